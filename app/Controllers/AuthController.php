@@ -53,11 +53,9 @@ class AuthController
                 // Save/update user in database
                 $user = $this->userService->createFromIVAOResponse($profile);
                 if ($user) {
-                    if ($this->userService->existsInDatabase($user->vid)) {
-                        $this->userService->update($user);
-                    } else {
-                        $this->userService->save($user);
-                    }
+                    $this->userService->upsert($user);
+                    // Kept for the Discord callback, which hands it to the bot
+                    $_SESSION['ivao_profile'] = $profile;
                 }
                 
                 // User has IVAO auth, show Discord join button
@@ -129,6 +127,12 @@ class AuthController
                 $user->discord_user_id = $discordUser['id'];
                 $this->userService->updateDiscordUserID($user);
                 
+                // Let the bot assign roles on join from the profile we already have
+                if (isset($_SESSION['ivao_profile'])) {
+                    $this->userService->saveMemberHandoff($user, $_SESSION['ivao_profile']);
+                    unset($_SESSION['ivao_profile']);
+                }
+                
                 // Join user to Discord server
                 $this->discordService->joinUserToGuild($user);
                 
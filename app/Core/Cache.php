@@ -0,0 +1,99 @@
+<?php
+
+namespace App\Core;
+
+/**
+ * Cross-request cache: APCu when it is enabled, otherwise JSON files in the
+ * system temp directory. Entries remember when they were stored, so callers
+ * decide themselves what is fresh and what is stale.
+ */
+class Cache
+{
+    public const PREFIX = 'ivao_discord_';
+
+    /**
+     * @return array|null ['value' => mixed, 'stored_at' => int], or null if missing
+     */
+    public static function get(string $key): ?array
+    {
+        if (self::useApcu()) {
+            $entry = apcu_fetch(self::PREFIX . $key, $success);
+            return $success && is_array($entry) ? $entry : null;
+        }
+
+        $data = @file_get_contents(self::path($key));
+        if ($data === false) {
+            return null;
+        }
+        $entry = json_decode($data, true);
+        return is_array($entry) && isset($entry['stored_at']) && array_key_exists('value', $entry) ? $entry : null;
+    }
+
+    public static function set(string $key, $value): void
+    {
+        $entry = ['value' => $value, 'stored_at' => time()];
+        if (self::useApcu()) {
+            apcu_store(self::PREFIX . $key, $entry);
+            return;
+        }
+
+        // Write a temp file and rename it, so readers never see a partial file
+        $path = self::path($key);
+        $tmp = $path . '.' . getmypid() . '.tmp';
+        if (@file_put_contents($tmp, json_encode($entry)) !== false) {
+            @rename($tmp, $path);
+        }
+    }
+
+    public static function delete(string $key): void
+    {
+        if (self::useApcu()) {
+            apcu_delete(self::PREFIX . $key);
+        }
+        @unlink(self::path($key));
+    }
+
+    /**
+     * Take a lock so only one request refreshes an entry.
+     *
+     * @return bool False if another request holds the lock
+     */
+    public static function lock(string $key, int $ttl): bool
+    {
+        if (self::useApcu()) {
+            return apcu_add(self::PREFIX . $key . '.lock', 1, $ttl);
+        }
+
+        $path = self::path($key) . '.lock';
+        $mtime = @filemtime($path);
+        if ($mtime !== false && time() - $mtime >= $ttl) {
+            // Left behind by a request that died while refreshing
+            @unlink($path);
+        }
+        $handle = @fopen($path, 'x');
+        if ($handle === false) {
+            return false;
+        }
+        fclose($handle);
+        return true;
+    }
+
+    public static function unlock(string $key): void
+    {
+        if (self::useApcu()) {
+            apcu_delete(self::PREFIX . $key . '.lock');
+            return;
+        }
+        @unlink(self::path($key) . '.lock');
+    }
+
+    private static function useApcu(): bool
+    {
+        return function_exists('apcu_enabled') && apcu_enabled();
+    }
+
+    private static function path(string $key): string
+    {
+        return sys_get_temp_dir() . '/' . self::PREFIX . md5($key) . '.json';
+    }
+}
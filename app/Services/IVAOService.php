@@ -2,12 +2,18 @@
 
 namespace App\Services;
 
+use App\Core\Cache;
+
 class IVAOService
 {
+    private const CACHE_TTL = 3600; // Discovery document is fresh for 1 hour
+    private const STALE_TTL = 86400; // then served while it is refreshed, for up to a day
+    private const LOCK_TTL = 30;
+    private const REQUEST_TIMEOUT = 10;
+    
     private $openid_data;
     private $openid_url;
-    private $openid_data_timestamp;
-    private const CACHE_TTL = 3600; // Cache for 1 hour
+    private $curl;
     
     public function __construct()
     {
@@ -21,55 +27,75 @@ class IVAOService
     public function clearCache(): void
     {
         $this->openid_data = null;
-        $this->openid_data_timestamp = null;
+        Cache::delete($this->cacheKey());
+    }
+    
+    private function cacheKey(): string
+    {
+        return 'openid_' . $this->openid_url;
     }
     
+    /**
+     * OpenID discovery document, cached across requests.
+     *
+     * A stale copy is served at once and refreshed by one request after its
+     * response has been sent; a copy of any age is used if IVAO is down.
+     */
     private function getOpenIdData(): array
     {
-        // Check if cache is still valid
-        $now = time();
-        if ($this->openid_data !== null && $this->openid_data_timestamp !== null) {
-            $age = $now - $this->openid_data_timestamp;
-            if ($age < self::CACHE_TTL) {
-                return $this->openid_data;
-            }
-            // Cache expired, clear it
-            $this->clearCache();
+        if ($this->openid_data !== null) {
+            return $this->openid_data;
         }
         
-        if (empty($this->openid_url)) {
-            throw new \Exception('OpenID URL not configured. Check your .env file.');
+        $key = $this->cacheKey();
+        $entry = Cache::get($key);
+        $age = $entry !== null ? time() - $entry['stored_at'] : null;
+        if ($entry !== null && $age < self::CACHE_TTL) {
+            return $this->openid_data = $entry['value'];
         }
         
-        // Use stream context with timeout and cache-busting
-        $cache_bust = '?t=' . $now;
-        $url = $this->openid_url . (strpos($this->openid_url, '?') === false ? $cache_bust : '&' . substr($cache_bust, 1));
-        
-        $context = stream_context_create([
-            'http' => [
-                'timeout' => 10,
-                'ignore_errors' => true,
-                'cache_control' => 'no-cache'
-            ]
-        ]);
-        
-        // Clear any opcache for this URL if opcache is enabled
-        if (function_exists('opcache_invalidate')) {
-            @opcache_invalidate($this->openid_url, true);
+        if ($entry !== null && $age < self::CACHE_TTL + self::STALE_TTL) {
+            if (Cache::lock($key, self::LOCK_TTL)) {
+                register_shutdown_function(function () use ($key) {
+                    // Let the user have the page before talking to IVAO
+                    if (session_status() === PHP_SESSION_ACTIVE) {
+                        session_write_close();
+                    }
+                    if (function_exists('fastcgi_finish_request')) {
+                        fastcgi_finish_request();
+                    }
+                    try {
+                        $this->fetchOpenIdData();
+                    } catch (\Exception $e) {
+                        error_log('OpenID refresh failed, keeping the cached copy: ' . $e->getMessage());
+                    } finally {
+                        Cache::unlock($key);
+                    }
+                });
+            }
+            return $this->openid_data = $entry['value'];
         }
         
-        $openid_result = @file_get_contents($url, false, $context);
-        
-        // If that fails, try without cache busting
-        if ($openid_result === FALSE) {
-            $openid_result = @file_get_contents($this->openid_url, false, $context);
+        try {
+            return $this->openid_data = $this->fetchOpenIdData();
+        } catch (\Exception $e) {
+            if ($entry === null) {
+                throw $e;
+            }
+            error_log('OpenID fetch failed, using the cached copy: ' . $e->getMessage());
+            return $this->openid_data = $entry['value'];
+        }
+    }
+    
+    private function fetchOpenIdData(): array
+    {
+        if (empty($this->openid_url)) {
+            throw new \Exception('OpenID URL not configured. Check your .env file.');
         }
         
-        if ($openid_result === FALSE) {
-            $error = error_get_last();
-            $errorMsg = $error['message'] ?? 'Unknown error';
-            // Clear cache on error to force fresh fetch on next attempt
-            $this->clearCache();
+        [$status, $openid_result] = $this->request($this->openid_url);
+        if ($openid_result === false || $status >= 400) {
+            $errorMsg = $openid_result === false ? curl_error($this->curl) : "HTTP $status";
             error_log("OpenID fetch failed: $errorMsg");
             throw new \Exception('Error while getting openid data: ' . $errorMsg);
         }
@@ -77,22 +103,52 @@ class IVAOService
         $decoded = json_decode($openid_result, true);
         
         if (json_last_error() !== JSON_ERROR_NONE) {
-            // Clear cache on parse error
-            $this->clearCache();
             throw new \Exception('Failed to parse OpenID configuration: ' . json_last_error_msg());
         }
         
         if (!isset($decoded['authorization_endpoint']) || !isset($decoded['token_endpoint'])) {
-            // Clear cache on invalid data
-            $this->clearCache();
             throw new \Exception('Invalid OpenID configuration: missing required endpoints');
         }
         
-        // Cache the valid data
-        $this->openid_data = $decoded;
-        $this->openid_data_timestamp = $now;
+        Cache::set($this->cacheKey(), $decoded);
+        return $decoded;
+    }
+    
+    /**
+     * Send a request over the curl handle shared by all IVAO calls of this
+     * request, so they reuse one keep-alive connection.
+     *
+     * @return array [HTTP status, body or false on a transport error]
+     */
+    private function request(string $url, array $headers = [], ?string $post_fields = null): array
+    {
+        if ($this->curl === null) {
+            $this->curl = curl_init();
+        } else {
+            // Resets the options but keeps the open connections
+            curl_reset($this->curl);
+        }
         
-        return $this->openid_data;
+        curl_setopt_array($this->curl, [
+            CURLOPT_URL => $url,
+            CURLOPT_RETURNTRANSFER => true,
+            CURLOPT_CONNECTTIMEOUT => self::REQUEST_TIMEOUT,
+            CURLOPT_TIMEOUT => self::REQUEST_TIMEOUT,
+            CURLOPT_TCP_KEEPALIVE => 1,
+            CURLOPT_ENCODING => '',
+            CURLOPT_HTTPHEADER => $headers,
+        ]);
+        if ($post_fields !== null) {
+            curl_setopt($this->curl, CURLOPT_POST, true);
+            curl_setopt($this->curl, CURLOPT_POSTFIELDS, $post_fields);
+        }
+        
+        $body = curl_exec($this->curl);
+        if ($body === false) {
+            error_log('IVAO request to ' . $url . ' failed: ' . curl_error($this->curl));
+            return [0, false];
+        }
+        return [curl_getinfo($this->curl, CURLINFO_RESPONSE_CODE), $body];
     }
     
     public function getTokens(): void
@@ -108,18 +164,14 @@ class IVAOService
             'redirect_uri' => $GLOBALS['redirect_uri'],
         );
         
-        $token_options = array(
-            'http' => array(
-                'header'  => "Content-type: application/x-www-form-urlencoded\r\n",
-                'method'  => 'POST',
-                'content' => http_build_query($token_req_data)
-            )
-        );
         $openid_data = $this->getOpenIdData();
-        $token_context = stream_context_create($token_options);
-        $token_result = @file_get_contents($openid_data['token_endpoint'], false, $token_context);
+        [$status, $token_result] = $this->request(
+            $openid_data['token_endpoint'],
+            ['Content-type: application/x-www-form-urlencoded'],
+            http_build_query($token_req_data)
+        );
         
-        if ($token_result === FALSE) {
+        if ($token_result === FALSE || $status >= 400) {
             throw new \Exception('Error while getting token');
         }
         
@@ -147,23 +199,14 @@ class IVAOService
         
         $access_token = $tokens['access_token'];
         
-        $user_options = array(
-            'http' => array(
-                'header'  => "Authorization: Bearer $access_token\r\n",
-                'method'  => 'GET',
-                'ignore_errors' => true,
-            )
-        );
-        
         $openid_data = $this->getOpenIdData();
-        $user_context = stream_context_create($user_options);
-        $user_result = @file_get_contents($openid_data['userinfo_endpoint'], false, $user_context);
+        [, $user_result] = $this->request($openid_data['userinfo_endpoint'], ["Authorization: Bearer $access_token"]);
         
         if ($user_result === FALSE) {
             return ['description' => 'Failed to get user profile'];
         }
         
-        return json_decode($user_result, true);
+        return json_decode($user_result, true) ?? ['description' => 'Failed to get user profile'];
     }
     
     public function refreshToken(): void
@@ -187,17 +230,12 @@ class IVAOService
             'client_secret' => $client_secret_ivao
         );
         
-        $token_options = array(
-            'http' => array(
-                'header'  => "Content-type: application/x-www-form-urlencoded\r\n",
-                'method'  => 'POST',
-                'content' => http_build_query($token_req_data),
-                'ignore_errors' => true,
-            )
-        );
         $openid_data = $this->getOpenIdData();
-        $token_context = stream_context_create($token_options);
-        $token_result = @file_get_contents($openid_data['token_endpoint'], false, $token_context);
+        [, $token_result] = $this->request(
+            $openid_data['token_endpoint'],
+            ['Content-type: application/x-www-form-urlencoded'],
+            http_build_query($token_req_data)
+        );
         
         if ($token_result === FALSE) {
             throw new \Exception('Error while refreshing token');
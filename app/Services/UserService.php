@@ -2,10 +2,16 @@
 
 namespace App\Services;
 
+use App\Core\Cache;
 use App\Models\User;
 
 class UserService
 {
+    // Maintenance mode is toggled by hand in the options table; a change
+    // takes effect within this many seconds (php clear_cache.php 1: at once)
+    private const MAINTENANCE_TTL = 30;
+    private const UNIQUE_VID_TTL = 300;
+    
     private $pdo;
     
     public function __construct()
@@ -17,7 +23,11 @@ class UserService
         }
         
         try {
-            $this->pdo = new \PDO($dsn, $database_user, $database_password);
+            // Persistent: PHP-FPM workers reuse their connection instead of
+            // connecting (and authenticating) on every page view
+            $this->pdo = new \PDO($dsn, $database_user, $database_password, [
+                \PDO::ATTR_PERSISTENT => true,
+            ]);
             $this->pdo->setAttribute(\PDO::ATTR_ERRMODE, \PDO::ERRMODE_EXCEPTION);
         } catch (\PDOException $e) {
             throw new \Exception('Database connection failed: ' . $e->getMessage());
@@ -26,12 +36,19 @@ class UserService
     
     public function isMaintenanceMode(): bool
     {
+        $entry = Cache::get('maintenance');
+        if ($entry !== null && time() - $entry['stored_at'] < self::MAINTENANCE_TTL) {
+            return $entry['value'];
+        }
+        
         try {
             $stmt = $this->pdo->prepare("SELECT value FROM options WHERE name = 'maintenance'");
             $stmt->execute();
             $result = $stmt->fetch(\PDO::FETCH_ASSOC);
             
-            return isset($result['value']) && $result['value'] == '1';
+            $maintenance = isset($result['value']) && $result['value'] == '1';
+            Cache::set('maintenance', $maintenance);
+            return $maintenance;
         } catch (\PDOException $e) {
             // If table doesn't exist or query fails, assume not in maintenance mode
             error_log('Maintenance mode check failed: ' . $e->getMessage());
@@ -72,57 +89,85 @@ class UserService
         return $user;
     }
     
-    public function existsInDatabase(string $vid): bool
-    {
-        $stmt = $this->pdo->prepare("SELECT * FROM user_data WHERE vid = :vid");
-        $stmt->execute(['vid' => $vid]);
-        return $stmt->rowCount() !== 0;
-    }
-    
-    public function save(User $user): void
+    /**
+     * Insert the user, or store the new refresh token of a known user.
+     *
+     * One INSERT ... ON DUPLICATE KEY UPDATE once user_data has the unique
+     * key on vid (migrations/001_user_data_unique_vid.sql); until then the
+     * row is looked up first, so no duplicate rows are created.
+     */
+    public function upsert(User $user): void
     {
         $tokens = json_decode($_COOKIE[COOKIE_NAME] ?? '{}', true);
         $refresh_token = $tokens['refresh_token'] ?? '';
         
-        $query = "INSERT INTO user_data 
+        $insert = "INSERT INTO user_data 
             (ivao_auth_date, vid, firstname, lastname, refresh_token, refresh_token_date, verified, is_banned)
             VALUES
             (NOW(), :vid, :firstname, :lastname, :refresh_token, NOW(), :verified, :is_banned)";
+        $params = [
+            'vid' => $user->vid,
+            'firstname' => $user->firstname,
+            'lastname' => $user->lastname,
+            'refresh_token' => $refresh_token,
+            'verified' => $user->verified,
+            'is_banned' => $user->is_banned,
+        ];
         
-        $stmt = $this->pdo->prepare($query);
-        $stmt->bindParam(':vid', $user->vid);
-        $stmt->bindParam(':firstname', $user->firstname);
-        $stmt->bindParam(':lastname', $user->lastname);
-        $stmt->bindParam(':refresh_token', $refresh_token);
-        $stmt->bindParam(':verified', $user->verified);
-        $stmt->bindParam(':is_banned', $user->is_banned);
+        // A fresh sign-in lifts the quarantine the bot puts on rejected tokens
+        if ($this->hasUniqueVid()) {
+            $stmt = $this->pdo->prepare("$insert
+                ON DUPLICATE KEY UPDATE
+                refresh_token = VALUES(refresh_token),
+                refresh_token_date = VALUES(refresh_token_date),
+                token_failure_reason = NULL,
+                token_failed_at = NULL,
+                token_failure_count = 0");
+        } elseif ($this->existsInDatabase($user->vid)) {
+            $stmt = $this->pdo->prepare("UPDATE user_data SET
+                refresh_token = :refresh_token,
+                refresh_token_date = NOW(),
+                token_failure_reason = NULL,
+                token_failed_at = NULL,
+                token_failure_count = 0
+                WHERE vid = :vid");
+            $params = ['vid' => $user->vid, 'refresh_token' => $refresh_token];
+        } else {
+            $stmt = $this->pdo->prepare($insert);
+        }
         
-        if ($stmt->execute()) {
+        if ($stmt->execute($params)) {
             $user->setNecessaryCookies();
         } else {
             throw new \Exception("Something went wrong with the user save. Please contact staff!");
         }
     }
     
-    public function update(User $user): void
+    private function existsInDatabase(string $vid): bool
     {
-        $tokens = json_decode($_COOKIE[COOKIE_NAME] ?? '{}', true);
-        $refresh_token = $tokens['refresh_token'] ?? '';
-        
-        $query = "UPDATE user_data SET
-            refresh_token = :refresh_token,
-            refresh_token_date = NOW()
-            WHERE vid = :vid";
-        
-        $stmt = $this->pdo->prepare($query);
-        $stmt->bindParam(':vid', $user->vid);
-        $stmt->bindParam(':refresh_token', $refresh_token);
-        
-        if ($stmt->execute()) {
-            $user->setNecessaryCookies();
-        } else {
-            throw new \Exception("User update failed");
+        $stmt = $this->pdo->prepare("SELECT 1 FROM user_data WHERE vid = :vid LIMIT 1");
+        $stmt->execute(['vid' => $vid]);
+        return $stmt->fetchColumn() !== false;
+    }
+    
+    /**
+     * Whether user_data has the unique key on vid. Cached; while it is
+     * missing it is looked up again every UNIQUE_VID_TTL seconds.
+     */
+    private function hasUniqueVid(): bool
+    {
+        $entry = Cache::get('unique_vid');
+        if ($entry !== null && ($entry['value'] || time() - $entry['stored_at'] < self::UNIQUE_VID_TTL)) {
+            return $entry['value'];
         }
+        
+        $stmt = $this->pdo->prepare("SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_data'
+            AND INDEX_NAME = 'unique_vid' AND NON_UNIQUE = 0 LIMIT 1");
+        $stmt->execute();
+        $unique = $stmt->fetchColumn() !== false;
+        Cache::set('unique_vid', $unique);
+        return $unique;
     }
     
     public function updateDiscordUserID(User $user): void
@@ -133,5 +178,32 @@ class UserService
             'vid' => $user->vid
         ]);
     }
+    
+    /**
+     * Hand the IVAO profile fetched during login to the bot, so it can assign
+     * roles when the user joins without refreshing the token again.
+     */
+    public function saveMemberHandoff(User $user, array $profile): void
+    {
+        if (!isset($profile['id']) || (string)$profile['id'] !== (string)$user->vid) {
+            return;
+        }
+        
+        try {
+            // Drop handoffs of users who never joined (e.g. already members)
+            $this->pdo->exec("DELETE FROM member_handoffs WHERE created_at < NOW() - INTERVAL 1 DAY");
+            
+            $stmt = $this->pdo->prepare("INSERT INTO member_handoffs (discord_user_id, vid, profile, created_at)
+                VALUES (:discord_user_id, :vid, :profile, NOW())");
+            $stmt->execute([
+                'discord_user_id' => $user->discord_user_id,
+                'vid' => $user->vid,
+                'profile' => json_encode($profile)
+            ]);
+        } catch (\PDOException $e) {
+            // The bot falls back to refreshing the token itself
+            error_log('Member handoff failed: ' . $e->getMessage());
+        }
+    }
 }
 
@@ -29,7 +29,8 @@ $dsn = "mysql:host={$db_host};dbname={$db_database};charset=UTF8";
 if (!defined('COOKIE_NAME')) {
     define('COOKIE_NAME', 'ivao_tokens');
 }
-$openid_url = 'https://api.ivao.aero/.well-known/openid-configuration';
+// Only change it to point at a mock server for benchmarks
+$openid_url = $_ENV['IVAO_OPENID_URL'] ?? getenv('IVAO_OPENID_URL') ?: 'https://api.ivao.aero/.well-known/openid-configuration';
 $client_id_ivao = $_ENV['OAUTH_CLIENT_ID'] ?? getenv('OAUTH_CLIENT_ID') ?: '';
 $client_secret_ivao = $_ENV['OAUTH_CLIENT_SECRET'] ?? getenv('OAUTH_CLIENT_SECRET') ?: '';
 $state_string_ivao = $_ENV['OAUTH_STATE'] ?? getenv('OAUTH_STATE') ?: '10';
@@ -0,0 +1 @@
+"""Benchmarks for the bot (run from backend/ with python -m benchmarks.<name>)."""
@@ -0,0 +1,101 @@
+"""
+Synthetic multi-guild benchmark for cluster mode scaling.
+
+Distributes synthetic guilds over shards and shards over worker processes
+exactly like the cluster launcher, then has every worker process the
+member-join CPU work (profile JSON decoding, nickname parsing, row mapping,
+nickname building) for the guilds it owns. Reports throughput and parallel
+efficiency for 1..N workers.
+
+Usage (from backend/):
+    python -m benchmarks.cluster_scaling --guilds 256 --joins 2000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+from src.bot.cluster import shard_for_guild, shard_ranges
+from src.database.models import UserData
+from src.services.identity import parse_nickname
+
+SHARDS = 16
+FIRST_GUILD_ID = 81384788765712384
+
+
+def _guild_ids(count: int) -> List[int]:
+    # Spread IDs over the timestamp bits so they land on different shards
+    return [FIRST_GUILD_ID + (index << 22) * 7 for index in range(count)]
+
+
+def _process_join(guild_id: int, seq: int) -> str:
+    vid = 100000 + seq
+    profile = json.dumps({
+        "id": vid,
+        "firstName": f"First{seq}",
+        "lastName": f"Last{guild_id % 997}",
+        "divisionId": "XM" if seq % 3 else "DE",
+        "isStaff": seq % 50 == 0,
+        "userStaffPositions": [{"id": "XM-AOC"}] if seq % 50 == 0 else [],
+    })
+    user_info = json.loads(profile)
+    parsed = parse_nickname(f"{user_info['firstName']} {user_info['lastName']} | {vid} #{guild_id}")
+    user_data = UserData.from_row((
+        seq, str(vid), str(guild_id + seq), f"user{seq}", parsed.firstname, parsed.lastname,
+        "x" * 1000, datetime.now(), 1, 0, None, None,
+    ))
+    return f"{user_data.full_name} | {user_info['id']}"[:32]
+
+
+def _worker(args: Tuple[List[int], List[int], int]) -> int:
+    shard_ids, guild_ids, joins = args
+    owned = set(shard_ids)
+    processed = 0
+    for guild_id in guild_ids:
+        if shard_for_guild(guild_id, SHARDS) not in owned:
+            continue
+        for seq in range(joins):
+            _process_join(guild_id, seq)
+            processed += 1
+    return processed
+
+
+def run(workers: int, guild_ids: List[int], joins: int) -> Tuple[int, float]:
+    """Run the workload with a number of worker processes; return (events, seconds)."""
+    ranges = shard_ranges(SHARDS, workers)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(len(ranges)) as pool:
+        # Warm the processes up before timing
+        pool.map(_worker, [([], [], 0)] * len(ranges))
+        started = time.perf_counter()
+        processed = sum(pool.map(_worker, [(shards, guild_ids, joins) for shards in ranges]))
+        elapsed = time.perf_counter() - started
+    return processed, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=256)
+    parser.add_argument("--joins", type=int, default=2000, help="Joins per guild")
+    parser.add_argument("--max-workers", type=int, default=min(os.cpu_count() or 1, SHARDS))
+    args = parser.parse_args()
+
+    guild_ids = _guild_ids(args.guilds)
+    counts = sorted({1, 2, 4, 8, 16, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    baseline = None
+    print(f"{'workers':>8} | {'events':>10} | {'events/s':>12} | {'speedup':>8} | {'efficiency':>10}")
+    for workers in counts:
+        processed, elapsed = run(workers, guild_ids, args.joins)
+        throughput = processed / elapsed
+        baseline = baseline or throughput
+        speedup = throughput / baseline
+        print(f"{workers:>8} | {processed:>10} | {throughput:>12.0f} | {speedup:>8.2f} | {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
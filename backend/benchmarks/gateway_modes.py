@@ -0,0 +1,298 @@
+"""
+Synthetic large-guild benchmark for gateway intents and member cache policies.
+
+Feeds a synthetic GUILD_CREATE and a mixed stream of gateway events through
+discord.py's ConnectionState parsers for each mode and reports memory and
+event throughput. Each mode runs in a fresh interpreter so RSS numbers are
+comparable.
+
+Usage (from backend/):
+    python -m benchmarks.gateway_modes --members 50000 --events 200000
+"""
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+import discord
+from discord.state import ConnectionState
+
+from src.bot.client import build_intents, build_member_cache_flags
+from src.utils.process import current_rss_bytes
+
+GUILD_ID = 100000000000000000
+TEXT_CHANNEL_ID = 100000000000000001
+VOICE_CHANNEL_ID = 100000000000000002
+BOT_USER_ID = 100000000000000003
+FIRST_MEMBER_ID = 200000000000000000
+
+MODES = ("all_intents", "full", "lazy", "fetch")
+
+# Share of each event type in the raw stream of a busy community guild,
+# and the intent Discord requires before it sends that event at all
+EVENT_MIX = (
+    ("PRESENCE_UPDATE", 0.55, "presences"),
+    ("MESSAGE_CREATE", 0.20, "guild_messages"),
+    ("TYPING_START", 0.12, "guild_typing"),
+    ("VOICE_STATE_UPDATE", 0.05, "voice_states"),
+    ("GUILD_MEMBER_UPDATE", 0.05, "members"),
+    ("GUILD_MEMBER_ADD", 0.03, "members"),
+)
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id % 1000000}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+    }
+
+
+def _member(user_id: int) -> Dict[str, Any]:
+    return {
+        "user": _user(user_id),
+        "roles": [],
+        "nick": None,
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def _guild_create(member_count: int, inline_members: int) -> Dict[str, Any]:
+    return {
+        "id": str(GUILD_ID),
+        "name": "Synthetic Guild",
+        "icon": None,
+        "owner_id": str(FIRST_MEMBER_ID),
+        "large": True,
+        "member_count": member_count,
+        "unavailable": False,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": [{
+            "id": str(GUILD_ID),
+            "name": "@everyone",
+            "permissions": "0",
+            "position": 0,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+            "flags": 0,
+        }],
+        "channels": [
+            {"id": str(TEXT_CHANNEL_ID), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+            {"id": str(VOICE_CHANNEL_ID), "type": 2, "name": "voice", "position": 1, "permission_overwrites": [],
+             "bitrate": 64000, "user_limit": 0},
+        ],
+        "members": [_member(FIRST_MEMBER_ID + i) for i in range(inline_members)],
+        "presences": [],
+        "voice_states": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+    }
+
+
+def _event(name: str, seq: int, member_count: int) -> Dict[str, Any]:
+    user_id = FIRST_MEMBER_ID + random.randrange(member_count)
+    if name == "PRESENCE_UPDATE":
+        return {
+            "user": {"id": str(user_id)},
+            "guild_id": str(GUILD_ID),
+            "status": "online",
+            "activities": [],
+            "client_status": {"desktop": "online"},
+        }
+    if name == "MESSAGE_CREATE":
+        return {
+            "id": str(300000000000000000 + seq),
+            "channel_id": str(TEXT_CHANNEL_ID),
+            "guild_id": str(GUILD_ID),
+            "author": _user(user_id),
+            "member": {k: v for k, v in _member(user_id).items() if k != "user"},
+            "content": "synthetic message",
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+            "flags": 0,
+        }
+    if name == "TYPING_START":
+        return {
+            "channel_id": str(TEXT_CHANNEL_ID),
+            "guild_id": str(GUILD_ID),
+            "user_id": str(user_id),
+            "timestamp": int(time.time()),
+            "member": _member(user_id),
+        }
+    if name == "VOICE_STATE_UPDATE":
+        return {
+            "guild_id": str(GUILD_ID),
+            "channel_id": str(VOICE_CHANNEL_ID) if seq % 2 else None,
+            "user_id": str(user_id),
+            "session_id": "synthetic",
+            "deaf": False,
+            "mute": False,
+            "self_deaf": False,
+            "self_mute": False,
+            "self_video": False,
+            "suppress": False,
+            "request_to_speak_timestamp": None,
+            "member": _member(user_id),
+        }
+    if name == "GUILD_MEMBER_ADD":
+        data = _member(FIRST_MEMBER_ID + member_count + seq)
+        data["guild_id"] = str(GUILD_ID)
+        return data
+    data = _member(user_id)
+    data["guild_id"] = str(GUILD_ID)
+    data["nick"] = f"Nick {seq}"
+    return data
+
+
+def _mode_options(mode: str) -> Dict[str, Any]:
+    if mode == "all_intents":
+        return {
+            "intents": discord.Intents.all(),
+            "member_cache_flags": discord.MemberCacheFlags.all(),
+            "chunk": True,
+        }
+    return {
+        "intents": build_intents(),
+        "member_cache_flags": build_member_cache_flags(mode),
+        "chunk": mode == "full",
+    }
+
+
+def run_mode(mode: str, member_count: int, event_count: int, seed: int) -> Dict[str, Any]:
+    """
+    Run one mode in the current process.
+
+    Args:
+        mode: Mode name (see MODES)
+        member_count: Synthetic guild size
+        event_count: Number of raw gateway events to generate
+        seed: Random seed so every mode sees the same stream
+
+    Returns:
+        Result dictionary
+    """
+    random.seed(seed)
+    options = _mode_options(mode)
+    intents: discord.Intents = options["intents"]
+
+    rss_before = current_rss_bytes()
+    tracemalloc.start()
+
+    state = ConnectionState(
+        dispatch=lambda *args, **kwargs: None,
+        handlers={},
+        hooks={},
+        http=None,
+        intents=intents,
+        member_cache_flags=options["member_cache_flags"],
+        chunk_guilds_at_startup=False,
+        max_messages=None,
+    )
+    state.user = discord.ClientUser(state=state, data=_user(BOT_USER_ID))
+
+    # Discord inlines at most large_threshold members in GUILD_CREATE, the
+    # rest only arrive through chunking
+    state.parse_guild_create(_guild_create(member_count, inline_members=min(250, member_count)))
+    if options["chunk"]:
+        chunk_size = 1000
+        chunk_count = (member_count + chunk_size - 1) // chunk_size
+        for index in range(chunk_count):
+            start = index * chunk_size
+            state.parse_guild_members_chunk({
+                "guild_id": str(GUILD_ID),
+                "members": [_member(FIRST_MEMBER_ID + i) for i in range(start, min(start + chunk_size, member_count))],
+                "chunk_index": index,
+                "chunk_count": chunk_count,
+            })
+
+    names = [name for name, _, _ in EVENT_MIX]
+    weights = [weight for _, weight, _ in EVENT_MIX]
+    required = {name: intent for name, _, intent in EVENT_MIX}
+    stream: List[str] = random.choices(names, weights=weights, k=event_count)
+
+    # Discord filters events server-side by intent
+    delivered = [name for name in stream if getattr(intents, required[name])]
+    payloads = [(name, _event(name, seq, member_count)) for seq, name in enumerate(delivered)]
+
+    errors = 0
+    started = time.perf_counter()
+    for name, payload in payloads:
+        try:
+            state.parsers[name](payload)
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    traced_current, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    guild = state._get_guild(GUILD_ID)
+
+    return {
+        "mode": mode,
+        "intents": intents.value,
+        "members": member_count,
+        "cached_members": len(guild.members) if guild else 0,
+        "cached_users": len(state._users),
+        "raw_events": event_count,
+        "delivered_events": len(delivered),
+        "parse_errors": errors,
+        "events_per_s": round(len(delivered) / elapsed, 1) if elapsed else 0.0,
+        "parse_seconds": round(elapsed, 3),
+        "traced_mib": round(traced_current / (1024 * 1024), 2),
+        "traced_peak_mib": round(traced_peak / (1024 * 1024), 2),
+        "rss_delta_mib": round((current_rss_bytes() - rss_before) / (1024 * 1024), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=MODES, help="Run a single mode in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.members, args.events, args.seed)))
+        return
+
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.gateway_modes", "--mode", mode,
+             "--members", str(args.members), "--events", str(args.events), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True
+        )
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    columns = ("mode", "cached_members", "delivered_events", "events_per_s", "traced_mib", "rss_delta_mib", "parse_errors")
+    print(" | ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{str(result[column]):>16}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Microbenchmarks for the bot's in-process hot paths.
+
+Times the pure-Python work done for every verification: role planning
+(plan_roles, the decision part of _apply_roles) with fake guild and member
+objects, nickname/VID parsing, UserData row mapping, settings loading and
+AuthService.verify_member end to end with an in-memory database pool and
+OAuth service. No Discord connection, database or IVAO access is needed.
+
+Each benchmark reports the best time per call over several repeats. With
+--save the results become the baseline (a JSON file); otherwise they are
+compared with the baseline and the run exits with status 1 if any benchmark
+got slower than the threshold allows. Baselines are machine specific, so
+save one on the machine that runs the comparison.
+
+Usage (from backend/):
+    python -m benchmarks.hot_paths --save
+    python -m benchmarks.hot_paths --threshold 0.2
+    python -m benchmarks.hot_paths --filter verify_member
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.config.settings import Settings, init_settings
+from src.database.models import UserData
+from src.database.pool import init_pool
+from src.services.auth import AuthService
+from src.services.identity import parse_nickname
+from src.services.roles import ALL_STAFF_ROLES, plan_roles
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "hot_paths_baseline.json")
+
+GUILD_ID = 100000000000000000
+MEMBER_ID = 200000000000000000
+HANDOFF_MEMBER_ID = 200000000000000001
+VID = 123456
+
+# Environment used for every run, so results do not depend on the local .env
+BENCHMARK_ENV = {
+    "DISCORD_TOKEN": "benchmark-token",
+    "BOT_ID": "300000000000000000",
+    "LOGCHANNEL_ID": "300000000000000001",
+    "HELP_CHANNEL_ID": "300000000000000002",
+    "BOTMANAGERS": "300000000000000003,300000000000000004",
+    "OAUTH_CLIENT_ID": "benchmark-client",
+    "OAUTH_CLIENT_SECRET": "benchmark-secret",
+    "OAUTH_STATE": "benchmark-state",
+    "HOST": "127.0.0.1",
+    "PORT": "3306",
+    "DBUSER": "benchmark",
+    "PASSWORD": "benchmark",
+    "DATABASE": "benchmark",
+    "DIV": "XM",
+    "COUNTRY": "Benchmark",
+    "LANGUAGE": "en",
+    "ICONURL": "https://example.invalid/icon.png",
+    "DIV_STAFF": "400000000000000001",
+    "DIV_HQ": "400000000000000002",
+    "SPECOPS": "400000000000000003",
+    "FLIGHTOPS": "400000000000000004",
+    "ATCOPS": "400000000000000005",
+    "TRAINING": "400000000000000006",
+    "WEB": "400000000000000007",
+    "MEMBERSHIP": "400000000000000008",
+    "EVENT": "400000000000000009",
+    "PR": "400000000000000010",
+    "VID_VERIFIED": "400000000000000011",
+    "DIV_MEMBER": "400000000000000012",
+    "NON_DIV_IVAO_MEMBER": "400000000000000013",
+}
+
+MEMBER_PROFILE = {
+    "id": VID,
+    "firstName": "Jane",
+    "lastName": "Doe",
+    "divisionId": "XM",
+    "isStaff": False,
+    "userStaffPositions": [],
+}
+
+STAFF_PROFILE = {
+    "id": VID,
+    "firstName": "Jane",
+    "lastName": "Doe",
+    "divisionId": "XM",
+    "isStaff": True,
+    "userStaffPositions": [
+        {"id": "XM-SOC"},
+        {"id": "XM-TA1"},
+        {"id": "XM-WMA1"},
+        {"id": "DE-FOA1"},
+    ],
+}
+
+USER_ROW = (
+    1, VID, str(MEMBER_ID), "jane", "Jane", "Doe",
+    "refresh-token", datetime(2024, 1, 1), 1, 0, None, None,
+)
+
+
+class FakeRole:
+    """Stands in for discord.Role (plan_roles only compares roles)."""
+
+    __slots__ = ("id",)
+
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class FakeGuild:
+    """Stands in for discord.Guild."""
+
+    def __init__(self, role_ids: List[int]):
+        self.id = GUILD_ID
+        self._roles = {role_id: FakeRole(role_id) for role_id in role_ids}
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+
+class FakeMember:
+    """Stands in for discord.Member."""
+
+    def __init__(self, member_id: int, name: str, display_name: str, guild: FakeGuild, roles: List[FakeRole]):
+        self.id = member_id
+        self.name = name
+        self.display_name = display_name
+        self.guild = guild
+        self.roles = roles
+
+
+class FakeCursor:
+    """In-memory cursor answering the queries of the verification path."""
+
+    def __init__(self):
+        self.rowcount = 0
+        self._row: Optional[tuple] = None
+
+    async def __aenter__(self) -> "FakeCursor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    async def execute(self, query: str, args: tuple = ()) -> int:
+        self._row = None
+        self.rowcount = 0
+        if "match_rank" in query:
+            # IdentityResolver: the Discord ID branch always comes first
+            if args[0] in (str(MEMBER_ID), str(HANDOFF_MEMBER_ID)):
+                self._row = USER_ROW + (0,)
+        elif query.startswith("SELECT id, profile FROM member_handoffs"):
+            if args[0] == str(HANDOFF_MEMBER_ID):
+                self._row = (1, json.dumps(MEMBER_PROFILE))
+        elif query.startswith("DELETE FROM member_handoffs"):
+            # consume_handoff claims the row it just read
+            self.rowcount = 1
+        else:
+            self.rowcount = 1
+        return self.rowcount
+
+    async def fetchone(self) -> Optional[tuple]:
+        return self._row
+
+
+class FakeConnection:
+    """In-memory connection."""
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor()
+
+    async def begin(self) -> None:
+        pass
+
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        pass
+
+
+class _FakeAcquire:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+
+    async def __aenter__(self) -> FakeConnection:
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+class FakePool:
+    """Stands in for the aiomysql pool."""
+
+    def __init__(self):
+        self._conn = FakeConnection()
+
+    def acquire(self) -> _FakeAcquire:
+        return _FakeAcquire(self._conn)
+
+
+class FakeOAuthService:
+    """Returns a fixed IVAO profile without any HTTP round trip."""
+
+    async def get_user_info_for_discord_user(
+        self,
+        user_id: Optional[int] = None,
+        vid: Optional[str] = None,
+        revoke: bool = False
+    ) -> Dict[str, Any]:
+        # verify_member fills in names, so hand out a fresh copy
+        return dict(MEMBER_PROFILE)
+
+
+# name -> (function, is coroutine function)
+Benchmarks = Dict[str, Tuple[Callable[[], Any], bool]]
+
+
+def build_benchmarks() -> Benchmarks:
+    """Set up fakes and return the benchmarks by name."""
+    os.environ.update(BENCHMARK_ENV)
+    os.environ.pop("DIVISIONS_FILE", None)
+
+    settings = init_settings()
+    division = settings.division
+    # Route get_pool() to the in-memory pool
+    init_pool(settings.database)._pool = FakePool()
+
+    role_fields = ALL_STAFF_ROLES + ("vid_verified", "div_member", "non_div_ivao_member")
+    guild = FakeGuild([getattr(division, role_field) for role_field in role_fields])
+    new_member = FakeMember(MEMBER_ID, "jane", "Jane Doe - 123456", guild, [])
+    verified_member = FakeMember(
+        MEMBER_ID, "jane", "Jane Doe | 123456", guild,
+        [guild.get_role(division.vid_verified), guild.get_role(division.div_member)]
+    )
+    handoff_member = FakeMember(HANDOFF_MEMBER_ID, "jane", "Jane Doe - 123456", guild, [])
+    auth = AuthService(FakeOAuthService())
+    parse_uncached = parse_nickname.__wrapped__
+
+    async def verify_oauth():
+        result = await auth.verify_member(new_member, new_member=True)
+        assert result['success'], result
+
+    async def verify_handoff():
+        result = await auth.verify_member(handoff_member, new_member=True)
+        assert result['success'] and result['source'] == "handoff", result
+
+    return {
+        "plan_roles.member_new": (lambda: plan_roles(division, guild, new_member, MEMBER_PROFILE), False),
+        "plan_roles.member_verified": (lambda: plan_roles(division, guild, verified_member, MEMBER_PROFILE), False),
+        "plan_roles.staff": (lambda: plan_roles(division, guild, new_member, STAFF_PROFILE), False),
+        "parse_nickname.uncached": (lambda: parse_uncached("Jane Doe | XM-SOC 123456"), False),
+        "parse_nickname.cached": (lambda: parse_nickname("Jane Doe | XM-SOC 123456"), False),
+        "user_data.from_row": (lambda: UserData.from_row(USER_ROW), False),
+        "settings.load": (Settings.load, False),
+        "verify_member.oauth": (verify_oauth, True),
+        "verify_member.handoff": (verify_handoff, True),
+    }
+
+
+def _time_sync(func: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - started
+
+
+async def _time_async(func: Callable[[], Awaitable[Any]], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        await func()
+    return time.perf_counter() - started
+
+
+def measure(func: Callable[[], Any], is_async: bool, repeat: int, min_time: float) -> float:
+    """
+    Time a benchmark.
+
+    The number of calls per repeat grows until one repeat takes at least
+    min_time seconds.
+
+    Returns:
+        Best time per call in microseconds
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        def run(number: int) -> float:
+            if is_async:
+                return loop.run_until_complete(_time_async(func, number))
+            return _time_sync(func, number)
+
+        number = 1
+        while True:
+            elapsed = run(number)
+            if elapsed >= min_time:
+                break
+            number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+        best = min([elapsed] + [run(number) for _ in range(repeat - 1)])
+        return best / number * 1e6
+    finally:
+        loop.close()
+
+
+def compare(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    threshold: float
+) -> List[str]:
+    """Print results against the baseline and return the regressed benchmark names."""
+    regressions = []
+    print(f"{'benchmark':<28} | {'us/call':>10} | {'baseline':>10} | {'change':>8} |")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<28} | {value:>10.2f} | {'-':>10} | {'new':>8} |")
+            continue
+        change = value / base - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<28} | {value:>10.2f} | {base:>10.2f} | {change:>+8.1%} |"
+            f"{' REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks()
+    results = {
+        name: measure(func, is_async, args.repeat, args.min_time)
+        for name, (func, is_async) in benchmarks.items()
+        if args.filter in name
+    }
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "saved_at": datetime.now().isoformat(timespec="seconds"),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        compare(results, {}, args.threshold)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    baseline: Dict[str, float] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        baseline = saved.get("results", {})
+        if saved.get("python") != platform.python_version():
+            print(f"Note: baseline was saved with Python {saved.get('python')}, running {platform.python_version()}")
+    else:
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""
+End-to-end load harness for member verification.
+
+Runs the real Auth cog, AuthService, OAuthService and database code against
+local stand-ins:
+
+- a mock IVAO API (token and /users/me endpoints) with configurable
+  latency, server error rate, 429 rate and refresh token rotation; the bot
+  is pointed at it through OAuthConfig.api_url (IVAO_API_URL)
+- a local MariaDB/MySQL database, configured like the bot (HOST, PORT,
+  DBUSER, PASSWORD, DATABASE) and created from schema.sql; synthetic
+  user_data rows are inserted before the run and deleted afterwards
+- a fake gateway that dispatches on_member_join in bursts, with fake
+  members whose role and nickname calls take a configurable Discord latency
+
+Reports joins/s, p50/p95/p99 time-to-verified, database pool saturation and
+IVAO call counts by endpoint and status.
+
+Usage (from backend/):
+    python -m benchmarks.load_harness --members 2000 --burst 200 --burst-interval 1
+    python -m benchmarks.load_harness --ivao-latency-ms 300 --ivao-429-rate 0.05 --handoff-rate 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+
+from src.bot.startup import ReadinessGate
+from src.cogs.auth import Auth
+from src.config.settings import init_settings
+from src.database.pool import get_pool, init_pool
+from src.database.schema import ensure_schema
+from src.services.auth import AuthService
+from src.services.claims import ClaimWorker, WorkClaimStore
+from src.services.jobs import JobManager
+from src.services.oauth import OAuthService
+from src.services.roles import ALL_STAFF_ROLES
+from src.utils.metrics import DB_POOL_WAIT_SECONDS, Histogram
+
+from .hot_paths import BENCHMARK_ENV
+
+GUILD_ID = 800000000000000000
+FIRST_MEMBER_ID = 900000000000000000
+FIRST_VID = 9000000
+USERNAME_PREFIX = "loadtest-"
+STAFF_EVERY = 10  # every n-th member is division staff
+
+
+class MockIVAO:
+    """Local stand-in for the IVAO token and user info endpoints."""
+
+    def __init__(self, latency_ms: float, error_rate: float, rate_limit_rate: float, rotate: bool):
+        """
+        Initialize mock server.
+
+        Args:
+            latency_ms: Mean response latency (uniformly +/- 50%)
+            error_rate: Share of requests answered with HTTP 500
+            rate_limit_rate: Share of requests answered with HTTP 429
+            rotate: Issue a new refresh token on every refresh (as IVAO does)
+        """
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rotate = rotate
+        self.refresh_tokens: Dict[str, int] = {}
+        self.access_tokens: Dict[str, int] = {}
+        self.profiles: Dict[int, Dict[str, Any]] = {}
+        self.calls: Counter = Counter()
+        self._serial = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_user(self, profile: Dict[str, Any]) -> str:
+        """Register a profile and return its initial refresh token."""
+        self.profiles[profile["id"]] = profile
+        return self._issue(self.refresh_tokens, "rt", profile["id"])
+
+    def _issue(self, tokens: Dict[str, int], prefix: str, vid: int) -> str:
+        self._serial += 1
+        token = f"{prefix}-{vid}-{self._serial}"
+        tokens[token] = vid
+        return token
+
+    async def _respond(self, endpoint: str) -> Optional[web.Response]:
+        """Simulate latency and return an injected failure, if any."""
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms * random.uniform(0.5, 1.5) / 1000)
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.calls[(endpoint, 429)] += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.calls[(endpoint, 500)] += 1
+            return web.json_response({"error": "server_error", "error_description": "Injected failure"}, status=500)
+        return None
+
+    def _reply(self, endpoint: str, body: Dict[str, Any], status: int = 200) -> web.Response:
+        self.calls[(endpoint, status)] += 1
+        return web.json_response(body, status=status)
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        failure = await self._respond("token")
+        if failure:
+            return failure
+        form = await request.post()
+        refresh_token = form.get("refresh_token", "")
+        vid = self.refresh_tokens.get(refresh_token)
+        if vid is None:
+            return self._reply("token", {
+                "error": "invalid_grant",
+                "error_description": "The refresh token is invalid or was already used"
+            }, 400)
+        if self.rotate:
+            del self.refresh_tokens[refresh_token]
+            refresh_token = self._issue(self.refresh_tokens, "rt", vid)
+        return self._reply("token", {
+            "access_token": self._issue(self.access_tokens, "at", vid),
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+            "expires_in": 3600,
+        })
+
+    async def handle_users_me(self, request: web.Request) -> web.Response:
+        failure = await self._respond("users_me")
+        if failure:
+            return failure
+        access_token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        vid = self.access_tokens.get(access_token)
+        if vid is None:
+            return self._reply("users_me", {"error": "invalid_token", "error_description": "Unknown access token"}, 401)
+        return self._reply("users_me", self.profiles[vid])
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start listening and return the base URL."""
+        app = web.Application()
+        app.router.add_post("/v2/oauth/token", self.handle_token)
+        app.router.add_get("/v2/users/me", self.handle_users_me)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeRole:
+    """Stands in for discord.Role."""
+
+    def __init__(self, role_id: int):
+        self.id = role_id
+        self.name = f"role-{role_id}"
+
+
+class FakeGuild:
+    """Stands in for discord.Guild."""
+
+    def __init__(self, guild_id: int, role_ids: List[int]):
+        self.id = guild_id
+        self._roles = {role_id: FakeRole(role_id) for role_id in role_ids}
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+
+class FakeMember:
+    """Stands in for discord.Member; REST calls take the simulated Discord latency."""
+
+    def __init__(self, member_id: int, vid: int, guild: FakeGuild, discord_latency_ms: float):
+        self.id = member_id
+        self.name = f"{USERNAME_PREFIX}{vid}"
+        self.display_name = f"Load Test - {vid}"
+        self.nick: Optional[str] = None
+        self.guild = guild
+        self.roles: List[FakeRole] = []
+        self.joined_at: Optional[datetime] = None
+        self._latency = discord_latency_ms / 1000
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None) -> None:
+        await asyncio.sleep(self._latency)
+        self.roles.extend(roles)
+
+    async def edit(self, *, nick: Optional[str] = None, **kwargs: Any) -> None:
+        await asyncio.sleep(self._latency)
+        if nick is not None:
+            self.nick = self.display_name = nick
+
+
+class HarnessBot:
+    """The parts of BotClient the Auth cog uses."""
+
+    def __init__(self, oauth_service: OAuthService):
+        self.oauth_service = oauth_service
+        self.auth_service = AuthService(oauth_service)
+        self.jobs = JobManager(self)
+        self.claims = ClaimWorker(WorkClaimStore())
+        # The harness warms up before dispatching joins
+        self.readiness = ReadinessGate()
+        self.readiness.open()
+
+
+def build_profile(vid: int, division: str, index: int) -> Dict[str, Any]:
+    staff = index % STAFF_EVERY == 0
+    return {
+        "id": vid,
+        "firstName": "Load",
+        "lastName": f"Test{index}",
+        "divisionId": division,
+        "isStaff": staff,
+        "userStaffPositions": [{"id": f"{division}-SOC"}] if staff else [],
+    }
+
+
+async def cleanup_database(members: List[FakeMember]) -> None:
+    async with get_pool().pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM user_data WHERE discord_username LIKE %s", (f"{USERNAME_PREFIX}%",))
+            if members:
+                await cursor.executemany(
+                    "DELETE FROM member_handoffs WHERE discord_user_id = %s",
+                    [(str(member.id),) for member in members]
+                )
+            await conn.commit()
+
+
+async def seed_database(
+    mock: MockIVAO,
+    members: List[FakeMember],
+    division: str,
+    handoff_rate: float
+) -> int:
+    """Insert user_data rows (and some handoffs); return the number of handoffs."""
+    users = []
+    handoffs = []
+    for index, member in enumerate(members):
+        vid = FIRST_VID + index
+        profile = build_profile(vid, division, index)
+        users.append((
+            str(vid), str(member.id), member.name, profile["firstName"], profile["lastName"],
+            mock.add_user(profile), datetime.now()
+        ))
+        if random.random() < handoff_rate:
+            handoffs.append((str(member.id), str(vid), json.dumps(profile)))
+
+    async with get_pool().pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.executemany(
+                """INSERT INTO user_data
+                   (vid, discord_user_id, discord_username, firstname, lastname, refresh_token,
+                    refresh_token_date, verified, is_banned)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, 0, 0)""",
+                users
+            )
+            if handoffs:
+                await cursor.executemany(
+                    "INSERT INTO member_handoffs (discord_user_id, vid, profile) VALUES (%s, %s, %s)",
+                    handoffs
+                )
+            await conn.commit()
+    return len(handoffs)
+
+
+class PoolSampler:
+    """Samples database pool usage while the run is in progress."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = 0
+        self.saturated = 0
+        self.max_in_use = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        pool = get_pool().pool
+        while True:
+            in_use = pool.size - pool.freesize
+            self.samples += 1
+            self.max_in_use = max(self.max_in_use, in_use)
+            if in_use >= pool.maxsize:
+                self.saturated += 1
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+
+def histogram_totals(histogram: Histogram) -> Tuple[float, int]:
+    """Return (sum, count) of a histogram over all label sets."""
+    total, count = 0.0, 0
+    for suffix, _, value in histogram.samples():
+        if suffix == "_sum":
+            total += value
+        elif suffix == "_count":
+            count += int(value)
+    return total, count
+
+
+async def timed_join(cog: Auth, member: FakeMember) -> Tuple[float, bool]:
+    member.joined_at = discord.utils.utcnow()
+    started = time.perf_counter()
+    await cog.on_member_join(member)
+    return time.perf_counter() - started, bool(member.roles)
+
+
+async def dispatch_joins(
+    cog: Auth,
+    members: List[FakeMember],
+    burst: int,
+    burst_interval: float
+) -> List[Tuple[float, bool]]:
+    """Emit on_member_join in bursts, like a raid or a mass invite, and wait for all handlers."""
+    tasks = []
+    for start in range(0, len(members), burst):
+        for member in members[start:start + burst]:
+            tasks.append(asyncio.create_task(timed_join(cog, member)))
+        if start + burst < len(members):
+            await asyncio.sleep(burst_interval)
+    return await asyncio.gather(*tasks)
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms"
+
+
+def report(
+    results: List[Tuple[float, bool]],
+    elapsed: float,
+    cog: Auth,
+    mock: MockIVAO,
+    sampler: PoolSampler,
+    handoffs: int
+) -> None:
+    verified = sorted(duration for duration, ok in results if ok)
+    print(f"Joins:          {len(results)} in {elapsed:.1f}s ({len(results) / elapsed:.1f} joins/s)")
+    print(f"Verified:       {len(verified)} ({len(results) - len(verified)} failed), {handoffs} handoffs seeded")
+    for source, stat in sorted(cog.join_latency.items()):
+        print(f"  via {source + ':':<10} {stat.count}")
+    if len(verified) >= 2:
+        quantiles = statistics.quantiles(verified, n=100)
+        print(
+            f"Time to verify: p50 {_ms(quantiles[49])}  p95 {_ms(quantiles[94])}  "
+            f"p99 {_ms(quantiles[98])}  max {_ms(verified[-1])}"
+        )
+
+    pool = get_pool().pool
+    wait_total, acquires = histogram_totals(DB_POOL_WAIT_SECONDS)
+    saturated = sampler.saturated / sampler.samples if sampler.samples else 0.0
+    mean_wait = wait_total / acquires if acquires else 0.0
+    print(
+        f"DB pool:        max {sampler.max_in_use}/{pool.maxsize} in use, saturated {saturated:.0%} of the run, "
+        f"{acquires} acquires, mean wait {mean_wait * 1000:.1f}ms"
+    )
+
+    print("IVAO calls:")
+    for (endpoint, status), count in sorted(mock.calls.items()):
+        print(f"  {endpoint:<9} {status}: {count}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    for key, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(key, value)
+    settings = init_settings()
+    division = settings.division
+
+    mock = MockIVAO(args.ivao_latency_ms, args.ivao_error_rate, args.ivao_429_rate, not args.no_rotation)
+    mock_url = await mock.start()
+
+    db_pool = init_pool(replace(settings.database, max_size=args.pool_size))
+    await db_pool.create_pool()
+    oauth = OAuthService(replace(settings.oauth, api_url=mock_url))
+    cog = Auth(HarnessBot(oauth))
+
+    role_fields = ALL_STAFF_ROLES + ("vid_verified", "div_member", "non_div_ivao_member")
+    guild = FakeGuild(GUILD_ID, [getattr(division, role_field) for role_field in role_fields])
+    members = [
+        FakeMember(FIRST_MEMBER_ID + index, FIRST_VID + index, guild, args.discord_latency_ms)
+        for index in range(args.members)
+    ]
+
+    try:
+        await ensure_schema(db_pool)
+        await cleanup_database(members)
+        handoffs = await seed_database(mock, members, division.division, args.handoff_rate)
+
+        sampler = PoolSampler()
+        sampler.start()
+        started = time.perf_counter()
+        results = await dispatch_joins(cog, members, args.burst, args.burst_interval)
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+
+        report(results, elapsed, cog, mock, sampler, handoffs)
+    finally:
+        await cleanup_database(members)
+        await oauth.close()
+        await db_pool.close_pool()
+        await mock.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=100, help="Joins dispatched at once")
+    parser.add_argument("--burst-interval", type=float, default=1.0, help="Seconds between bursts")
+    parser.add_argument("--ivao-latency-ms", type=float, default=150.0)
+    parser.add_argument("--ivao-error-rate", type=float, default=0.0, help="Share of IVAO requests failing with 500")
+    parser.add_argument("--ivao-429-rate", type=float, default=0.0, help="Share of IVAO requests failing with 429")
+    parser.add_argument("--no-rotation", action="store_true", help="Keep refresh tokens valid after use")
+    parser.add_argument("--handoff-rate", type=float, default=0.0, help="Share of members with a web flow handoff")
+    parser.add_argument("--discord-latency-ms", type=float, default=80.0, help="Latency of each role/nickname call")
+    parser.add_argument("--pool-size", type=int, default=10, help="Database pool max size")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's log output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
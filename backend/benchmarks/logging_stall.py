@@ -0,0 +1,135 @@
+"""
+Event-loop stall benchmark for the logging pipeline.
+
+Logs from coroutines on a running event loop and measures how long each
+logging call blocks the loop, plus the lag of a heartbeat task. Two setups
+are compared:
+
+- direct: FileHandler and StreamHandler attached to the logger (the
+  previous setup; every call writes to disk and stdout on the loop)
+- queue:  setup_logging's QueueHandler/QueueListener pipeline
+
+--slow-io-ms delays every console write to simulate a slow terminal, pipe
+or journald under pressure. Output goes to a temporary directory and the
+console stream is discarded.
+
+Usage (from backend/):
+    python -m benchmarks.logging_stall --records 20000 --slow-io-ms 0.2
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from src.config.settings import LoggingConfig
+from src.utils.logging import DATE_FORMAT, TEXT_FORMAT, setup_logging, shutdown_logging
+
+MODES = ("direct", "queue")
+
+
+class SlowStream(io.TextIOBase):
+    """Discards output after a delay per write."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+
+def configure(mode: str, log_dir: str) -> logging.Logger:
+    if mode == "queue":
+        return setup_logging(log_level="INFO", log_file="stall.log", log_dir=log_dir, config=LoggingConfig())
+
+    logger = logging.getLogger("discord")
+    logger.setLevel(logging.INFO)
+    logger.handlers.clear()
+    formatter = logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+    for handler in (logging.StreamHandler(sys.stdout), logging.FileHandler(os.path.join(log_dir, "stall.log"))):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+async def heartbeat(lags: List[float], interval: float, stop: asyncio.Event) -> None:
+    """Record how late a periodic wakeup is."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def workload(logger: logging.Logger, records: int, batch: int, calls: List[float]) -> None:
+    """Log in batches like a bulk refresh reporting per-user results."""
+    for start in range(0, records, batch):
+        for index in range(start, min(start + batch, records)):
+            started = time.perf_counter()
+            logger.info(f"Refreshed token for user {200000000000000000 + index} (VID {100000 + index})")
+            calls.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as log_dir:
+        stdout = sys.stdout
+        sys.stdout = SlowStream(args.slow_io_ms / 1000)
+        try:
+            logger = configure(mode, log_dir)
+            calls: List[float] = []
+            lags: List[float] = []
+            stop = asyncio.Event()
+            beat = asyncio.create_task(heartbeat(lags, 0.005, stop))
+            started = time.perf_counter()
+            await workload(logger, args.records, args.batch, calls)
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await beat
+            shutdown_logging()
+            for handler in logger.handlers:
+                handler.close()
+            logger.handlers.clear()
+        finally:
+            sys.stdout = stdout
+
+    calls.sort()
+    return {
+        "call_mean_us": statistics.fmean(calls) * 1e6,
+        "call_p99_us": calls[int(len(calls) * 0.99)] * 1e6,
+        "call_max_ms": calls[-1] * 1e3,
+        "stall_total_ms": sum(calls) * 1e3,
+        "lag_max_ms": max(lags, default=0.0) * 1e3,
+        "elapsed_s": elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=50, help="Records logged between yields to the loop")
+    parser.add_argument("--slow-io-ms", type=float, default=0.0, help="Delay per console write")
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<7} | {'mean us':>8} | {'p99 us':>8} | {'max ms':>7} | "
+        f"{'stall total ms':>14} | {'loop lag max ms':>15}"
+    )
+    for mode in MODES:
+        result = asyncio.run(run_mode(mode, args))
+        print(
+            f"{mode:<7} | {result['call_mean_us']:>8.1f} | {result['call_p99_us']:>8.1f} | "
+            f"{result['call_max_ms']:>7.2f} | {result['stall_total_ms']:>14.1f} | {result['lag_max_ms']:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Overhead and attribution of the event loop lag monitor.
+
+Runs a workload of coroutines that keep switching on the event loop and
+counts loop switches per second without and with LoopLagMonitor. A third
+run blocks the loop on purpose: hashing keys into a Bloom filter on the
+loop (src code) and a sleeping "blocking_write" (code outside src).
+Reports the throughput of the first two runs, the stalls the monitor
+caught in the third with their call sites, and the largest lag the
+heartbeat measured.
+
+Usage (from backend/):
+    python -m benchmarks.loop_lag --seconds 5 --stalls 4 --threshold-ms 100
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Optional
+
+from src.utils.bloom import BloomFilter
+from src.utils.loop_monitor import LoopLagMonitor
+from src.utils.metrics import LOOP_STALLS
+
+WORKERS = 100
+
+
+async def switch(deadline: float) -> int:
+    """Yield to the loop until the deadline; returns the number of switches."""
+    switches = 0
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0)
+        switches += 1
+    return switches
+
+
+def blocking_write(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def inject_stalls(deadline: float, stalls: int, keys: int, block: float) -> None:
+    bloom = BloomFilter(keys, 0.01)
+    pause = (deadline - time.monotonic()) / (stalls + 1)
+    for i in range(stalls):
+        await asyncio.sleep(pause)
+        if i % 2 == 0:
+            bloom.update(f"d:{n}" for n in range(keys))
+        else:
+            blocking_write(block)
+
+
+async def run(seconds: float, monitor: Optional[LoopLagMonitor], args: argparse.Namespace, stalls: int = 0) -> float:
+    """Run the workload; returns loop switches per second."""
+    if monitor:
+        monitor.start()
+    deadline = time.monotonic() + seconds
+    workers = [asyncio.create_task(switch(deadline)) for _ in range(WORKERS)]
+    if stalls:
+        await inject_stalls(deadline, stalls, args.keys, args.threshold_ms * 3 / 1000)
+    switches = sum(await asyncio.gather(*workers))
+    if monitor:
+        await monitor.stop()
+    return switches / seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--stalls", type=int, default=4, help="Stalls injected into the attribution run")
+    parser.add_argument("--keys", type=int, default=300000, help="Keys hashed on the loop per Bloom filter stall")
+    parser.add_argument("--interval-ms", type=int, default=100)
+    parser.add_argument("--threshold-ms", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3, help="Alternating baseline/monitored runs (median is reported)")
+    args = parser.parse_args()
+
+    interval, threshold = args.interval_ms / 1000, args.threshold_ms / 1000
+    baselines, monitoreds = [], []
+    for _ in range(args.repeat):
+        baselines.append(asyncio.run(run(args.seconds, None, args)))
+        monitoreds.append(asyncio.run(run(args.seconds, LoopLagMonitor(interval, threshold), args)))
+    baseline, monitored = statistics.median(baselines), statistics.median(monitoreds)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, "loop_lag.log")
+        monitor = LoopLagMonitor(interval, threshold, log_file)
+        asyncio.run(run(args.seconds, monitor, args, args.stalls))
+        with open(log_file, encoding="utf-8") as f:
+            report = f.read()
+
+    print(f"{'run':>9} | {'switches/s':>11}")
+    print(f"{'baseline':>9} | {baseline:>11.0f}")
+    print(f"{'monitored':>9} | {monitored:>11.0f}")
+    print(
+        f"overhead {1 - monitored / baseline:.1%}; "
+        f"{monitor.stalls}/{args.stalls} injected stalls caught; max lag {monitor.max_lag * 1000:.0f}ms"
+    )
+    for _, labels, count in LOOP_STALLS.samples():
+        print(f"  {labels} {count:.0f}")
+    first = report.split("\n[", 1)[0]
+    if first:
+        print(f"first report in the loop lag log:\n{first}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Render latency of the web app's login page against a mock IVAO server.
+
+Serves the PHP app with PHP's built-in server (php -S) and points it at a
+local OpenID discovery endpoint (IVAO_OPENID_URL) with configurable latency.
+The login page needs the discovery document for the SSO link, so it is the
+page that pays for fetching it. Two phases are compared:
+
+- uncached: the discovery cache is deleted before every request, so every
+  page view downloads the document (what every request used to do)
+- cached:   the cross-request cache is kept between requests
+
+Reports p50/p95/max page latency and the number of discovery downloads.
+The page also checks maintenance mode, so the database settings of the web
+app (DB_HOST, DB_DATABASE, DB_USER, DB_PASSWORD) must point at a database
+created from schema.sql. Run with --apcu to use APCu instead of the file
+cache (needs the apcu extension).
+
+With --signed-in the requests carry an IVAO token cookie, so the page
+fetches the profile from the mock server and stores the user (the page
+every signed-in user sees). Run it against an older checkout for the cost
+of the separate existence check and save/update queries.
+
+Usage (from backend/):
+    python -m benchmarks.php_login_page --requests 200 --discovery-latency-ms 150
+    python -m benchmarks.php_login_page --signed-in
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Cache file prefix of App\Core\Cache
+CACHE_PREFIX = "ivao_discord_"
+# Cookie name of the web app (COOKIE_NAME in app/config/config.php)
+TOKEN_COOKIE = "ivao_tokens"
+BENCHMARK_VID = 9999999
+
+
+class MockDiscovery:
+    """Local stand-in for IVAO's OpenID discovery and profile endpoints."""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+        self.downloads = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._base_url = ""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency_ms / 1000)
+        self.downloads += 1
+        return web.json_response({
+            "issuer": self._base_url,
+            "authorization_endpoint": f"{self._base_url}/oauth/authorize",
+            "token_endpoint": f"{self._base_url}/v2/oauth/token",
+            "userinfo_endpoint": f"{self._base_url}/v2/users/me",
+        })
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return web.json_response({"id": BENCHMARK_VID, "firstName": "Bench", "lastName": "Mark"})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start listening and return the discovery URL."""
+        app = web.Application()
+        app.router.add_get("/.well-known/openid-configuration", self.handle)
+        app.router.add_get("/v2/users/me", self.handle_profile)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        self._base_url = f"http://{host}:{port}"
+        return f"{self._base_url}/.well-known/openid-configuration"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_php(discovery_url: str, temp_dir: str, apcu: bool) -> Tuple[subprocess.Popen, str]:
+    """Start php -S serving the app; returns the process and its base URL."""
+    port = _free_port()
+    env = dict(os.environ, IVAO_OPENID_URL=discovery_url, REDIRECT_URI=f"http://127.0.0.1:{port}/")
+    command = ["php", "-d", f"sys_temp_dir={temp_dir}"]
+    if apcu:
+        command += ["-d", "apc.enable_cli=1"]
+    command += ["-S", f"127.0.0.1:{port}", "-t", ROOT_DIR, os.path.join(ROOT_DIR, "index.php")]
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}/"
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                return
+        except aiohttp.ClientConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_phase(
+    session: aiohttp.ClientSession,
+    url: str,
+    requests: int,
+    clear_cache: Optional[str],
+    marker: str
+) -> List[float]:
+    """Request the page; returns latencies in seconds."""
+    latencies = []
+    for _ in range(requests):
+        if clear_cache:
+            for path in glob.glob(os.path.join(clear_cache, f"{CACHE_PREFIX}*")):
+                os.unlink(path)
+        started = time.perf_counter()
+        async with session.get(url) as response:
+            body = await response.text()
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200 or marker not in body:
+            raise RuntimeError(f"Page failed with HTTP {response.status}: {body[:200]}")
+    return latencies
+
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "p50": statistics.median(ordered) * 1000,
+        "p95": ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    mock = MockDiscovery(args.discovery_latency_ms)
+    discovery_url = await mock.start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        process, url = start_php(discovery_url, temp_dir, args.apcu)
+        try:
+            cookies = {}
+            # The login page links to IVAO, the signed-in page to Discord
+            marker = "oauth/authorize"
+            if args.signed_in:
+                cookies[TOKEN_COOKIE] = json.dumps({"access_token": "benchmark", "refresh_token": "benchmark"})
+                marker = "oauth2/authorize"
+            async with aiohttp.ClientSession(cookies=cookies) as session:
+                await wait_until_up(session, url)
+                print(f"{'phase':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'max ms':>8} | {'downloads':>9}")
+                # APCu lives in the PHP process, so only the file cache can be cleared from here
+                phases = [("cached", None)] if args.apcu else [("uncached", temp_dir), ("cached", None)]
+                for name, clear_cache in phases:
+                    before = mock.downloads
+                    stats = _summary(await run_phase(session, url, args.requests, clear_cache, marker))
+                    print(
+                        f"{name:>9} | {stats['p50']:>8.1f} | {stats['p95']:>8.1f} | {stats['max']:>8.1f} | "
+                        f"{mock.downloads - before:>9}"
+                    )
+        finally:
+            process.terminate()
+            process.wait()
+            await mock.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--discovery-latency-ms", type=float, default=150.0, help="Latency of the discovery endpoint")
+    parser.add_argument("--apcu", action="store_true", help="Enable APCu in the PHP server")
+    parser.add_argument("--signed-in", action="store_true", help="Request the page of a signed-in IVAO user")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Replica scaling benchmark for DB-backed work claiming.
+
+Creates batches in the work_claims table of a local MariaDB/MySQL database
+(configured like the bot: HOST, PORT, DBUSER, PASSWORD, DATABASE) and lets
+1..N replica processes claim and process them with WorkClaimStore. Batch
+processing sleeps per item to simulate the IVAO API round trips of a token
+refresh. Reports throughput per replica count and checks that no batch was
+processed twice. With --abandon, one replica claims a batch and exits
+without completing it, and the run waits for its lease to expire and the
+batch to be reclaimed.
+
+Usage (from backend/):
+    python -m benchmarks.replica_claims --batches 200 --batch-size 50 --item-ms 2
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+from typing import Tuple
+
+from src.config.settings import DatabaseConfig
+from src.database.pool import get_pool, init_pool
+from src.database.schema import ensure_schema
+from src.services.claims import WorkClaimStore
+
+KIND = "benchmark"
+
+
+async def _with_pool(coro_factory):
+    db_pool = init_pool(DatabaseConfig.from_env())
+    await db_pool.create_pool()
+    try:
+        return await coro_factory()
+    finally:
+        await db_pool.close_pool()
+
+
+async def _setup(job_id: int, batches: int, batch_size: int) -> None:
+    await ensure_schema(get_pool())
+    async with get_pool().pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM work_claims WHERE kind = %s", (KIND,))
+            await conn.commit()
+    ids = list(range(1, batches * batch_size + 1))
+    await WorkClaimStore().create_batches(job_id, KIND, {}, ids, batch_size)
+
+
+async def _verify(job_id: int) -> Tuple[int, int, int]:
+    """Return (done batches, batches claimed more than once, processed items)."""
+    store = WorkClaimStore()
+    progress = await store.progress(job_id)
+    async with get_pool().pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT COUNT(*) FROM work_claims WHERE job_id = %s AND attempts > 1",
+                (job_id,)
+            )
+            reclaimed = (await cursor.fetchone())[0]
+            await cursor.execute("DELETE FROM work_claims WHERE job_id = %s", (job_id,))
+            await conn.commit()
+    return progress.done, reclaimed, sum(result["items"] for result in progress.results)
+
+
+async def _replica(index: int, item_ms: float, lease: int, abandon: bool) -> int:
+    store = WorkClaimStore(owner=f"benchmark-replica-{index}", lease_seconds=lease)
+    processed = 0
+    while True:
+        batch = await store.claim([KIND])
+        if batch is None:
+            return processed
+        if abandon:
+            # Simulate a crash: keep the claim and never complete it
+            return processed
+        items = batch.range_end - batch.range_start + 1
+        await asyncio.sleep(items * item_ms / 1000)
+        await store.complete(batch, {"items": items, "owner": store.owner})
+        processed += 1
+
+
+def _replica_entry(args: Tuple[int, float, int, bool]) -> int:
+    index, item_ms, lease, abandon = args
+    return asyncio.run(_with_pool(lambda: _replica(index, item_ms, lease, abandon)))
+
+
+def run(replicas: int, args: argparse.Namespace) -> Tuple[float, Tuple[int, int, int]]:
+    """Run one round with a number of replicas; return (seconds, verification)."""
+    job_id = int(time.time() * 1000) % 2_000_000_000
+    asyncio.run(_with_pool(lambda: _setup(job_id, args.batches, args.batch_size)))
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(replicas + (1 if args.abandon else 0)) as pool:
+        started = time.perf_counter()
+        if args.abandon:
+            pool.apply(_replica_entry, ((replicas, args.item_ms, args.lease, True),))
+        pool.map(_replica_entry, [(index, args.item_ms, args.lease, False) for index in range(replicas)])
+        elapsed = time.perf_counter() - started
+        if args.abandon:
+            # The abandoned batch becomes claimable once its lease expires
+            time.sleep(args.lease + 1)
+            pool.apply(_replica_entry, ((0, args.item_ms, args.lease, False),))
+
+    return elapsed, asyncio.run(_with_pool(lambda: _verify(job_id)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--item-ms", type=float, default=2.0, help="Simulated work per item")
+    parser.add_argument("--max-replicas", type=int, default=8)
+    parser.add_argument("--lease", type=int, default=5, help="Lease seconds (used by --abandon)")
+    parser.add_argument("--abandon", action="store_true", help="Simulate a replica crashing mid-batch")
+    args = parser.parse_args()
+
+    counts = sorted({1, 2, 4, 8, args.max_replicas} & set(range(1, args.max_replicas + 1)))
+    total_items = args.batches * args.batch_size
+
+    baseline = None
+    print(f"{'replicas':>8} | {'items/s':>10} | {'speedup':>8} | {'done':>6} | {'reclaimed':>9} | {'items ok':>8}")
+    for replicas in counts:
+        elapsed, (done, reclaimed, items) = run(replicas, args)
+        throughput = total_items / elapsed
+        baseline = baseline or throughput
+        print(
+            f"{replicas:>8} | {throughput:>10.0f} | {throughput / baseline:>8.2f} | "
+            f"{done:>6} | {reclaimed:>9} | {'yes' if items == total_items else 'NO':>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Throughput of AuthService.verify_members against looping verify_member.
+
+Runs the real AuthService, IdentityResolver and HandoffStore code against
+an in-memory database pool with a fixed latency per query and a bounded
+number of connections, and a stand-in OAuth service whose profile fetch
+makes two IVAO round trips and, like the refresh token rotation, uses a
+pooled connection only briefly before and after the token exchange.
+
+Members are a mix of users linked by Discord ID, users found by the VID in
+their nickname and unknown users. Reports members/s, database queries and
+IVAO fetches of both paths and checks that they agree on every result.
+
+Usage (from backend/):
+    python -m benchmarks.verify_batch --members 1000 --db-latency-ms 1 --ivao-latency-ms 150
+    python -m benchmarks.verify_batch --concurrency 4 --pool-size 5
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config.settings import init_settings
+from src.database.pool import init_pool
+from src.services.auth import AuthService
+
+from .hot_paths import BENCHMARK_ENV
+
+FIRST_MEMBER_ID = 500000000000000000
+FIRST_VID = 5000000
+VID_LINKED_EVERY = 10  # every n-th member is only known by the VID in the nickname
+UNKNOWN_EVERY = 7  # every n-th member has no user_data row
+
+
+class FakeDatabase:
+    """user_data rows plus query counting and latency."""
+
+    def __init__(self, members: int, latency: float):
+        self.latency = latency
+        self.queries = Counter()
+        self.by_discord_id: Dict[str, tuple] = {}
+        self.by_vid: Dict[str, tuple] = {}
+        for i in range(members):
+            if i % UNKNOWN_EVERY == 0:
+                continue
+            vid = str(FIRST_VID + i)
+            discord_id = None if i % VID_LINKED_EVERY == 0 else str(FIRST_MEMBER_ID + i)
+            row = (
+                i + 1, vid, discord_id, f"user{i}", "Jane", f"Doe{i}",
+                "refresh-token", datetime(2024, 1, 1), 1, 0, None, None,
+            )
+            self.by_vid[vid] = row
+            if discord_id:
+                self.by_discord_id[discord_id] = row
+
+
+class FakeCursor:
+    """Answers the identity, handoff and update queries of the verification paths."""
+
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.rowcount = 0
+        self._rows: List[tuple] = []
+
+    async def __aenter__(self) -> "FakeCursor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    async def execute(self, query: str, args=()) -> int:
+        await asyncio.sleep(self.db.latency)
+        self._rows = []
+        self.rowcount = 0
+        args = list(args)
+        if "match_rank" in query:
+            self.db.queries["resolve"] += 1
+            # Discord IDs are snowflakes; everything shorter is a VID
+            for value in args:
+                if len(value) >= 15 and value in self.db.by_discord_id:
+                    self._rows.append(self.db.by_discord_id[value] + (0,))
+                elif len(value) < 15 and value in self.db.by_vid:
+                    self._rows.append(self.db.by_vid[value] + (1,))
+            if "LIMIT 1" in query:
+                self._rows = sorted(self._rows, key=lambda row: row[-1])[:1]
+        elif "FROM member_handoffs" in query:
+            self.db.queries["handoff"] += 1
+        else:
+            self.db.queries["write"] += 1
+            self.rowcount = 1
+        return self.rowcount
+
+    async def fetchone(self) -> Optional[tuple]:
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self) -> List[tuple]:
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.db)
+
+    async def begin(self) -> None:
+        pass
+
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        pass
+
+
+class _FakeAcquire:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    async def __aenter__(self) -> FakeConnection:
+        await self.pool.slots.acquire()
+        return FakeConnection(self.pool.db)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.pool.slots.release()
+
+
+class FakePool:
+    """Stands in for the aiomysql pool, with a bounded number of connections."""
+
+    def __init__(self, db: FakeDatabase, size: int):
+        self.db = db
+        self.slots = asyncio.Semaphore(size)
+
+    def acquire(self) -> _FakeAcquire:
+        return _FakeAcquire(self)
+
+
+class FakeOAuthService:
+    """Fetches profiles with IVAO latency, using pooled connections around the token exchange."""
+
+    def __init__(self, pool: FakePool, db: FakeDatabase, latency: float, concurrency: int):
+        self.pool = pool
+        self.db = db
+        self.latency = latency
+        self.fetches = 0
+        self.config = SimpleNamespace(batch_concurrency=concurrency)
+
+    async def get_user_info_for_discord_user(
+        self,
+        user_id: Optional[int] = None,
+        vid: Optional[str] = None,
+        revoke: bool = False
+    ) -> Dict[str, Any]:
+        async with self.pool.acquire():
+            # Read and claim the refresh token
+            await asyncio.sleep(2 * self.db.latency)
+        await asyncio.sleep(self.latency)
+        async with self.pool.acquire():
+            # Store the rotated token
+            await asyncio.sleep(self.db.latency)
+        # /users/me
+        await asyncio.sleep(self.latency)
+        self.fetches += 1
+        if user_id:
+            # Also covers members whose Discord ID was linked a moment ago
+            vid = str(FIRST_VID + int(user_id) - FIRST_MEMBER_ID)
+        row = self.db.by_vid[vid]
+        return {"id": int(row[1]), "firstName": row[4], "lastName": row[5], "divisionId": "XM"}
+
+
+def build_members(count: int) -> List[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=FIRST_MEMBER_ID + i,
+            name=f"user{i}",
+            display_name=f"Jane Doe{i} - {FIRST_VID + i}",
+        )
+        for i in range(count)
+    ]
+
+
+async def run_path(batch: bool, args: argparse.Namespace) -> Tuple[float, Counter, int, Dict[int, Tuple[bool, int]]]:
+    """Verify every member with one path; returns elapsed seconds, queries, IVAO fetches and outcomes."""
+    db = FakeDatabase(args.members, args.db_latency_ms / 1000)
+    pool = FakePool(db, args.pool_size)
+    init_pool(init_settings().database)._pool = pool
+    oauth = FakeOAuthService(pool, db, args.ivao_latency_ms / 1000, args.concurrency)
+    auth = AuthService(oauth)
+    members = build_members(args.members)
+
+    started = time.perf_counter()
+    if batch:
+        results = await auth.verify_members(members)
+    else:
+        results = {}
+        for member in members:
+            results[member.id] = await auth.verify_member(member)
+    elapsed = time.perf_counter() - started
+
+    outcomes = {member_id: (result['success'], result.get('error_code', 0)) for member_id, result in results.items()}
+    return elapsed, db.queries, oauth.fetches, outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="Latency per database query")
+    parser.add_argument("--ivao-latency-ms", type=float, default=150.0, help="Latency per IVAO round trip")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel IVAO fetches of verify_members")
+    args = parser.parse_args()
+
+    os.environ.update(BENCHMARK_ENV)
+    os.environ.pop("DIVISIONS_FILE", None)
+
+    print(f"{'path':>6} | {'members/s':>10} | {'seconds':>8} | {'resolve':>7} | {'handoff':>7} | {'write':>6} | {'ivao':>5}")
+    reports = {}
+    for name, batch in (("loop", False), ("batch", True)):
+        elapsed, queries, fetches, outcomes = asyncio.run(run_path(batch, args))
+        reports[name] = (elapsed, outcomes)
+        print(
+            f"{name:>6} | {args.members / elapsed:>10.0f} | {elapsed:>8.2f} | {queries['resolve']:>7} | "
+            f"{queries['handoff']:>7} | {queries['write']:>6} | {fetches:>5}"
+        )
+
+    loop_elapsed, loop_outcomes = reports["loop"]
+    batch_elapsed, batch_outcomes = reports["batch"]
+    verified = sum(success for success, _ in batch_outcomes.values())
+    print(
+        f"speedup {loop_elapsed / batch_elapsed:.1f}x; {verified}/{args.members} verified; "
+        f"results {'match' if loop_outcomes == batch_outcomes else 'DIFFER'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
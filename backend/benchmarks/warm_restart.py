@@ -0,0 +1,154 @@
+"""
+Cold start against warm restart of the identity filter.
+
+Builds the identity filter from an in-memory user_data table (a fixed
+query latency plus a transfer time per row stands in for reading the
+table from MariaDB), writes the cache snapshot, and restores a new filter
+from it the way a restarted bot does. Reports the time to a ready filter
+for both paths, the snapshot size and write time, and checks that the
+restored filter gives the same answers as the built one.
+
+Usage (from backend/):
+    python -m benchmarks.warm_restart --users 200000 --row-us 2
+    python -m benchmarks.warm_restart --key some-secret  # needs cryptography
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+from src.config.settings import IdentityFilterConfig, init_settings
+from src.database.pool import init_pool
+from src.services.identity_filter import IdentityFilter
+from src.utils.snapshot import read_snapshot, write_snapshot
+
+from .hot_paths import BENCHMARK_ENV
+
+FIRST_MEMBER_ID = 500000000000000000
+FIRST_VID = 5000000
+
+
+class FakeCursor:
+    """Answers the identity filter's build and sync queries."""
+
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+        self._rows: List[tuple] = []
+
+    async def __aenter__(self) -> "FakeCursor":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    async def execute(self, query: str, args=()) -> None:
+        self.pool.queries += 1
+        if "FROM user_data" in query and "WHERE" not in query:
+            self._rows = self.pool.rows
+        elif "MAX(id)" in query:
+            self._rows = [(0,)]
+        else:
+            self._rows = []
+        await asyncio.sleep(self.pool.latency + len(self._rows) * self.pool.row_time)
+
+    async def fetchone(self) -> Optional[tuple]:
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self) -> List[tuple]:
+        return self._rows
+
+
+class _FakeConnection:
+    def __init__(self, pool: "FakePool"):
+        self.pool = pool
+
+    async def __aenter__(self) -> "_FakeConnection":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.pool)
+
+
+class FakePool:
+    """Stands in for the aiomysql pool with a user_data table in memory."""
+
+    def __init__(self, users: int, latency: float, row_time: float):
+        self.latency = latency
+        self.row_time = row_time
+        self.queries = 0
+        self.rows = [
+            (i + 1, str(FIRST_MEMBER_ID + i) if i % 3 else None, str(FIRST_VID + i))
+            for i in range(users)
+        ]
+
+    def acquire(self) -> _FakeConnection:
+        return _FakeConnection(self)
+
+
+async def run(args: argparse.Namespace) -> None:
+    pool = FakePool(args.users, args.db_latency_ms / 1000, args.row_us / 1e6)
+    init_pool(init_settings().database)._pool = pool
+    config = IdentityFilterConfig()
+
+    cold = IdentityFilter(config)
+    started = time.perf_counter()
+    await cold.rebuild()
+    cold_seconds = time.perf_counter() - started
+    for i in range(args.users, args.users + 1000):
+        cold.remember_missing(FIRST_MEMBER_ID + i, None)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cache.snapshot")
+        started = time.perf_counter()
+        meta, sections = cold.snapshot()
+        size = await asyncio.to_thread(write_snapshot, path, {"identity_filter": meta}, sections, args.key)
+        write_seconds = time.perf_counter() - started
+
+        queries = pool.queries
+        warm = IdentityFilter(config)
+        started = time.perf_counter()
+        snapshot = await asyncio.to_thread(read_snapshot, path, args.key)
+        restored = warm.restore(snapshot, snapshot.meta["identity_filter"])
+        snapshot.close()
+        warm_seconds = time.perf_counter() - started
+        warm_queries = pool.queries - queries
+
+    samples = [
+        (FIRST_MEMBER_ID + i, str(FIRST_VID + i) if i % 2 else None)
+        for i in range(0, args.users * 2, max(1, args.users // 5000))
+    ]
+    same = all(cold._check(discord_user_id, vid) == warm._check(discord_user_id, vid) for discord_user_id, vid in samples)
+
+    print(f"{'path':>8} | {'seconds':>8} | {'queries':>7}")
+    print(f"{'cold':>8} | {cold_seconds:>8.3f} | {queries:>7}")
+    print(f"{'warm':>8} | {warm_seconds:>8.3f} | {warm_queries:>7}")
+    print(
+        f"snapshot {size / 1024 / 1024:.1f}MiB written in {write_seconds:.3f}s "
+        f"(negative cache {'encrypted' if args.key else 'left out, no key'}); "
+        f"restored={restored}, {warm.negative_count} negative entries; "
+        f"answers {'match' if same else 'DIFFER'} on {len(samples)} samples; "
+        f"speedup {cold_seconds / warm_seconds:.0f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="Latency per database query")
+    parser.add_argument("--row-us", type=float, default=2.0, help="Transfer time per user_data row")
+    parser.add_argument("--key", default=None, help="SNAPSHOT_KEY to encrypt the negative cache with")
+    args = parser.parse_args()
+
+    os.environ.update(BENCHMARK_ENV)
+    os.environ.pop("DIVISIONS_FILE", None)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
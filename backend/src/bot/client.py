@@ -1,28 +1,123 @@
 """Discord bot client setup."""
 
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
+from collections import Counter
+from typing import List, Optional
+
 import discord
 from discord.ext import commands, tasks
 
 from ..config.settings import Settings, get_settings
 from ..database.pool import get_pool
+from ..services.claims import ClaimWorker, WorkClaimStore
+from ..services.jobs import JobManager
+from ..services.oauth import OAuthService
+from ..services.auth import AuthService
+from ..services.identity_filter import IdentityFilter
+from ..utils.exceptions import SnapshotError
+from ..utils.memory import MemoryTracker, format_bytes
+from ..utils.metrics import CACHE_SNAPSHOTS, DISCORD_REST_SECONDS, GATEWAY_EVENTS, discord_route, http_trace_config
+from ..utils.process import current_rss_bytes
+from ..utils.shutdown import SHUTDOWN, DrainReport
+from ..utils.snapshot import read_snapshot, write_snapshot
+from .startup import ReadinessGate
 
 logger = logging.getLogger("discord")
 
+# Loaded in this order by setup_hook; add new cogs here
+EXTENSIONS = (
+    "src.cogs.auth",
+    "src.cogs.jobs",
+    "src.cogs.diagnostics",
+)
+
+
+def build_intents() -> discord.Intents:
+    """
+    Compute the minimal gateway intents the bot needs.
+    
+    The bot only reacts to member joins and applies roles/nicknames, so it
+    needs the guild (roles, channels) and member events. Presences, messages,
+    typing and voice state are never used and are not requested.
+    
+    Returns:
+        Gateway intents
+    """
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    return intents
+
+
+def build_member_cache_flags(policy: str) -> discord.MemberCacheFlags:
+    """
+    Build member cache flags for a member cache policy.
+    
+    Args:
+        policy: Member cache policy (full, lazy or fetch)
+        
+    Returns:
+        Member cache flags
+    """
+    if policy == "fetch":
+        return discord.MemberCacheFlags.none()
+    return discord.MemberCacheFlags.from_intents(build_intents())
+
+
+class GatewayStats:
+    """Counts received gateway events to report event rates."""
+    
+    def __init__(self):
+        self.events: Counter = Counter()
+        self.total = 0
+        self._window_start = time.monotonic()
+        self._window_total = 0
+    
+    def record(self, event_type: str) -> None:
+        """Record a received gateway event."""
+        self.events[event_type] += 1
+        self.total += 1
+        self._window_total += 1
+        GATEWAY_EVENTS.inc(event=event_type)
+    
+    def rate(self) -> float:
+        """Return events/s since the last call and start a new window."""
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-9)
+        rate = self._window_total / elapsed
+        self._window_start = now
+        self._window_total = 0
+        return rate
 
-class BotClient(commands.Bot):
+
+class BotClient(commands.AutoShardedBot):
     """Extended Discord bot client with custom functionality."""
     
-    def __init__(self, settings: Settings):
+    def __init__(
+        self,
+        settings: Settings,
+        shard_ids: Optional[List[int]] = None,
+        shard_count: Optional[int] = None,
+        cluster_index: Optional[int] = None
+    ):
         """
         Initialize bot client.
         
         Args:
             settings: Application settings
+            shard_ids: Shards run by this process (cluster mode)
+            shard_count: Total shard count (None lets Discord decide)
+            cluster_index: Index of this worker in cluster mode, None otherwise
         """
-        intents = discord.Intents.all()
+        intents = build_intents()
+        countries = {settings.division.country} | {tenant.country for tenant in settings.tenants.values()}
         activity = discord.Activity(
-            name=f'IVAO {settings.division.country}',
+            name=f'IVAO {settings.division.country}' if len(countries) == 1 else 'IVAO',
             type=discord.ActivityType.watching
         )
         
@@ -30,10 +125,50 @@ class BotClient(commands.Bot):
             command_prefix='.',
             intents=intents,
             activity=activity,
-            help_command=None
+            help_command=None,
+            member_cache_flags=build_member_cache_flags(settings.discord.member_cache_policy),
+            chunk_guilds_at_startup=settings.discord.chunk_guilds_at_startup,
+            max_messages=None,
+            shard_ids=shard_ids,
+            shard_count=shard_count or settings.cluster.shard_count or None,
+            http_trace=http_trace_config(
+                DISCORD_REST_SECONDS,
+                lambda params: {"method": params.method, "route": discord_route(params.url)}
+            )
         )
         
         self.settings = settings
+        self.cluster_index = cluster_index
+        self.started_at = time.monotonic()
+        self._tree_checked = False
+        self._first_interaction_logged = False
+        # Opened by main() once the database and HTTP warmup has finished
+        self.readiness = ReadinessGate()
+        self.gateway_stats = GatewayStats()
+        # Jobs are held under a lease, so one replica runs each
+        self.jobs = JobManager(self, lease_seconds=settings.cluster.claim_lease)
+        # Bulk job batches are shared with other replicas through work_claims
+        self.claims = ClaimWorker(WorkClaimStore(
+            lease_seconds=settings.cluster.claim_lease,
+            max_attempts=settings.cluster.claim_max_attempts
+        ))
+        
+        # One HTTP session and service set for every guild/division served
+        self.oauth_service = OAuthService(settings.oauth)
+        # Built during startup warmup (see main)
+        self.identity_filter = IdentityFilter(settings.identity_filter) if settings.identity_filter.enabled else None
+        self.auth_service = AuthService(self.oauth_service, self.identity_filter)
+        
+        # One snapshot file per cluster worker, each holds its own caches
+        self.snapshot_path = settings.snapshot.path
+        if self.snapshot_path and cluster_index is not None:
+            root, ext = os.path.splitext(self.snapshot_path)
+            self.snapshot_path = f"{root}.worker{cluster_index}{ext}"
+        
+        # tracemalloc runs from startup only when periodic dumps are configured
+        self.memory = MemoryTracker("main" if cluster_index is None else f"worker{cluster_index}")
+        if settings.memory.snapshot_dir:
+            self.memory.start(settings.memory.trace_frames)
         self._extensions_loaded = False
     
     async def setup_hook(self) -> None:
@@ -45,35 +180,251 @@ class BotClient(commands.Bot):
         if self._extensions_loaded:
             return
         
-        import os
-        cogs_dir = os.path.join(os.path.dirname(__file__), "..", "cogs")
-        
-        for filename in os.listdir(cogs_dir):
-            if filename.endswith('.py') and not filename.startswith('_'):
-                cog_name = f"src.cogs.{filename[:-3]}"
-                try:
-                    await self.load_extension(cog_name)
-                    logger.info(f"Loaded extension: {cog_name}")
-                except Exception as e:
-                    logger.error(f"Failed to load extension {cog_name}: {e}")
+        for cog_name in EXTENSIONS:
+            try:
+                await self.load_extension(cog_name)
+                logger.info(f"Loaded extension: {cog_name}")
+            except Exception as e:
+                logger.error(f"Failed to load extension {cog_name}: {e}")
         
         self._extensions_loaded = True
     
     async def on_ready(self) -> None:
         """Called when the bot is ready."""
-        logger.info("Bot is ready!")
+        logger.info(f"Bot is ready! ({time.monotonic() - self.started_at:.1f}s after start)")
         logger.info(f"Logged in as {self.user} (ID: {self.user.id})")
         
-        # Sync command tree
-        try:
-            synced = await self.tree.sync()
-            logger.info(f"Synced {len(synced)} command(s)")
-        except Exception as e:
-            logger.error(f"Failed to sync commands: {e}")
+        # Sync command tree (once per cluster and process; commands are global).
+        # on_ready fires again after reconnects, which never change the tree.
+        if self.is_primary and not self._tree_checked:
+            self._tree_checked = True
+            try:
+                await self.sync_commands()
+            except Exception as e:
+                logger.error(f"Failed to sync commands: {e}")
+        
+        if self.settings.tenants:
+            logger.info(f"Serving {len(self.settings.tenants)} division(s) from DIVISIONS_FILE")
+        logger.info(
+            f"Member cache policy: {self.settings.discord.member_cache_policy} "
+            f"(chunk at startup: {self.settings.discord.chunk_guilds_at_startup})"
+        )
         
         # Start background tasks
         if not self.check_db_connection.is_running():
             self.check_db_connection.start()
+        if not self.report_resource_usage.is_running():
+            self.report_resource_usage.start()
+        if self.settings.memory.snapshot_dir and not self.dump_memory_snapshot.is_running():
+            self.dump_memory_snapshot.change_interval(minutes=self.settings.memory.snapshot_interval)
+            self.dump_memory_snapshot.start()
+        if self.snapshot_path and not self.write_cache_snapshot.is_running():
+            self.write_cache_snapshot.change_interval(minutes=self.settings.snapshot.interval)
+            self.write_cache_snapshot.start()
+        
+        # Pick up background jobs interrupted by a restart or abandoned by
+        # another replica (needs the warmed-up pool)
+        await self.readiness.wait()
+        if not self.resume_abandoned_jobs.is_running():
+            self.resume_abandoned_jobs.change_interval(seconds=self.settings.cluster.claim_lease)
+            self.resume_abandoned_jobs.start()
+        self.claims.start()
+        if self.identity_filter is not None:
+            self.identity_filter.start()
+    
+    async def drain(self, timeout: float) -> DrainReport:
+        """
+        Stop taking new work and wait for work in progress.
+        
+        Claimed bulk refresh batches are released for other replicas and
+        local jobs stop at a checkpoint; verifications, role changes and
+        token rotations in progress get until the deadline to finish.
+        
+        Args:
+            timeout: Seconds to wait in total
+            
+        Returns:
+            Drain report
+        """
+        SHUTDOWN.accepting = False
+        started = time.monotonic()
+        await self.claims.stop()
+        stopped_jobs = await self.jobs.stop()
+        report = await SHUTDOWN.drain(max(0.0, timeout - (time.monotonic() - started)))
+        if stopped_jobs:
+            report.drained["job_checkpoint"] += stopped_jobs
+        return report
+    
+    async def restore_cache_snapshot(self) -> bool:
+        """
+        Restore caches from the snapshot of the previous run.
+        
+        The file is memory-mapped and only the sections of the caches that
+        are restored get read. Caches past their TTL are left out.
+        
+        Returns:
+            True if the identity filter was restored and needs no build
+        """
+        if not self.snapshot_path or self.identity_filter is None:
+            return False
+        config = self.settings.snapshot
+        try:
+            snapshot = await asyncio.to_thread(read_snapshot, self.snapshot_path, config.key)
+        except (OSError, SnapshotError) as e:
+            logger.warning(f"Ignoring cache snapshot {self.snapshot_path}: {e}")
+            CACHE_SNAPSHOTS.inc(event="rejected")
+            return False
+        if snapshot is None:
+            return False
+        
+        try:
+            meta = snapshot.meta.get("identity_filter")
+            restored = meta is not None and self.identity_filter.restore(snapshot, meta)
+        except (SnapshotError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring cache snapshot {self.snapshot_path}: {e}")
+            restored = False
+        finally:
+            snapshot.close()
+        CACHE_SNAPSHOTS.inc(event="restored" if restored else "rejected")
+        return restored
+    
+    async def save_cache_snapshot(self) -> None:
+        """Write the caches to the snapshot file (periodically and on shutdown)."""
+        if not self.snapshot_path or self.identity_filter is None:
+            return
+        state = self.identity_filter.snapshot()
+        if state is None:
+            return
+        meta, sections = state
+        started = time.monotonic()
+        try:
+            size = await asyncio.to_thread(
+                write_snapshot, self.snapshot_path, {"identity_filter": meta}, sections, self.settings.snapshot.key
+            )
+        except (OSError, SnapshotError) as e:
+            logger.error(f"Could not write cache snapshot {self.snapshot_path}: {e}")
+            return
+        CACHE_SNAPSHOTS.inc(event="written")
+        logger.info(
+            f"Wrote cache snapshot {self.snapshot_path} ({format_bytes(size)}) in {time.monotonic() - started:.2f}s"
+        )
+    
+    async def close(self) -> None:
+        """Stop claiming work, close the shared HTTP session, then the Discord connection."""
+        await self.claims.stop()
+        if self.identity_filter is not None:
+            await self.identity_filter.stop()
+        await self.oauth_service.close()
+        await super().close()
+    
+    def command_tree_hash(self) -> str:
+        """Hash of the global application commands as they would be synced."""
+        payload = sorted(
+            (command.to_dict() for command in self.tree.get_commands()),
+            key=lambda command: (command.get("type", 1), command["name"])
+        )
+        document = json.dumps({"application_id": self.application_id, "commands": payload}, sort_keys=True)
+        return hashlib.sha256(document.encode()).hexdigest()
+    
+    async def sync_commands(self, force: bool = False) -> Optional[int]:
+        """
+        Sync the command tree with Discord if it changed since the last sync.
+        
+        Syncing is a heavily rate limited global call, so the hash of the
+        last synced tree is kept in COMMAND_HASH_FILE and an unchanged tree
+        is not synced again.
+        
+        Args:
+            force: Sync even if the tree is unchanged
+            
+        Returns:
+            Number of synced commands, None if the sync was skipped
+        """
+        path = self.settings.discord.command_hash_file
+        tree_hash = self.command_tree_hash()
+        if not force:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    if f.read().strip() == tree_hash:
+                        logger.info("Command tree unchanged since the last sync, skipping sync")
+                        return None
+            except OSError:
+                pass
+        
+        started = time.monotonic()
+        synced = await self.tree.sync()
+        logger.info(f"Synced {len(synced)} command(s) in {time.monotonic() - started:.2f}s")
+        
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(tree_hash)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not store the command tree hash in {path}: {e}")
+        return len(synced)
+    
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        """Log when the first interaction arrives, to track time to first response."""
+        if not self._first_interaction_logged:
+            self._first_interaction_logged = True
+            logger.info(f"First interaction received {time.monotonic() - self.started_at:.1f}s after start")
+    
+    @property
+    def is_primary(self) -> bool:
+        """Whether this process runs cluster-wide singleton work."""
+        return self.cluster_index in (None, 0)
+    
+    async def on_socket_event_type(self, event_type: str) -> None:
+        """Count every dispatched gateway event."""
+        self.gateway_stats.record(event_type)
+    
+    @tasks.loop(minutes=5)
+    async def report_resource_usage(self) -> None:
+        """Periodically log RSS, cache sizes and gateway event rates."""
+        cached_members = sum(len(guild.members) for guild in self.guilds)
+        top_events = ", ".join(
+            f"{name}={count}" for name, count in self.gateway_stats.events.most_common(5)
+        )
+        logger.info(
+            f"Resources: rss={current_rss_bytes() / (1024 * 1024):.1f}MiB "
+            f"policy={self.settings.discord.member_cache_policy} "
+            f"guilds={len(self.guilds)} cached_members={cached_members} "
+            f"cached_users={len(self.users)} "
+            f"gateway_events={self.gateway_stats.rate():.2f}/s top=[{top_events}]"
+        )
+    
+    @report_resource_usage.before_loop
+    async def before_resource_report(self) -> None:
+        """Wait until bot is ready before reporting resource usage."""
+        await self.wait_until_ready()
+    
+    @tasks.loop(minutes=60)
+    async def dump_memory_snapshot(self) -> None:
+        """Periodically write a tracemalloc snapshot to MEMORY_SNAPSHOT_DIR for leak hunting."""
+        config = self.settings.memory
+        try:
+            path = await asyncio.to_thread(self.memory.dump, config.snapshot_dir, config.snapshot_keep)
+        except OSError as e:
+            logger.error(f"Could not write memory snapshot to {config.snapshot_dir}: {e}")
+            return
+        if path:
+            logger.info(f"Wrote memory snapshot {path}")
+    
+    @tasks.loop(minutes=2)
+    async def resume_abandoned_jobs(self) -> None:
+        """Periodically take over jobs whose replica stopped renewing their lease."""
+        await self.jobs.resume_pending()
+    
+    @tasks.loop(minutes=10)
+    async def write_cache_snapshot(self) -> None:
+        """Periodically snapshot the caches, so a crash restarts from a recent state."""
+        await self.save_cache_snapshot()
+    
+    @write_cache_snapshot.before_loop
+    async def before_cache_snapshot(self) -> None:
+        """Skip the first iteration, the caches were just built or restored."""
+        await asyncio.sleep(self.settings.snapshot.interval * 60)
     
     @tasks.loop(minutes=5)
     async def check_db_connection(self) -> None:
@@ -89,6 +440,7 @@ class BotClient(commands.Bot):
     async def before_db_check(self) -> None:
         """Wait until bot is ready before starting DB checks."""
         await self.wait_until_ready()
+        await self.readiness.wait()
     
     def is_bot_manager(self, user_id: int) -> bool:
         """Check if a user is a bot manager."""
@@ -0,0 +1,260 @@
+"""Multi-process cluster launcher.
+
+Spawns CLUSTER_WORKERS processes, each running the bot as an
+AutoShardedBot over a contiguous range of shards. Workers send health and
+metrics snapshots to the launcher over a multiprocessing queue; the
+launcher aggregates and logs them and restarts workers that die.
+
+Usage: python -m src.bot.cluster [--workers N] [--debug]
+"""
+
+import sys
+
+if sys.version_info < (3, 9):
+    print(f"Error: Python 3.9+ is required, but you're using Python {sys.version_info.major}.{sys.version_info.minor}")
+    sys.exit(1)
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import platform
+import queue
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from ..config.settings import Settings, init_settings
+from ..utils.logging import setup_logging
+from ..utils.process import current_rss_bytes
+
+logger = logging.getLogger("discord")
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+RESTART_BACKOFF = 10.0  # seconds
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """Return the shard Discord routes a guild to."""
+    return (guild_id >> 22) % shard_count
+
+
+def shard_ranges(shard_count: int, workers: int) -> List[List[int]]:
+    """
+    Split shards into contiguous ranges, one per worker.
+
+    Args:
+        shard_count: Total number of shards
+        workers: Number of worker processes
+
+    Returns:
+        List of shard ID lists (workers without shards are dropped)
+    """
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        size = base + (1 if index < extra else 0)
+        if size:
+            ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+async def fetch_recommended_shards(token: str) -> int:
+    """Ask Discord for the recommended shard count of this bot."""
+    headers = {"Authorization": f"Bot {token}"}
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(GATEWAY_BOT_URL, headers=headers) as response:
+            data = await response.json()
+            if response.status != 200:
+                raise RuntimeError(f"GET /gateway/bot returned {response.status}: {data}")
+            return int(data["shards"])
+
+
+async def cluster_report_task(bot, ipc_queue, index: int, interval: int) -> None:
+    """
+    Periodically send a health/metrics snapshot of this worker to the launcher.
+
+    Args:
+        bot: BotClient of this worker
+        ipc_queue: Launcher queue
+        index: Worker index
+        interval: Seconds between reports
+    """
+    await bot.wait_until_ready()
+    while True:
+        snapshot = {
+            "worker": index,
+            "time": time.time(),
+            "shards": sorted(bot.shards.keys()),
+            "guilds": len(bot.guilds),
+            "latency_ms": round(bot.latency * 1000, 1) if bot.latency == bot.latency else None,
+            "rss": current_rss_bytes(),
+            "cached_members": sum(len(guild.members) for guild in bot.guilds),
+            "gateway_events": bot.gateway_stats.total,
+            "jobs_running": bot.jobs.running_count,
+            "batches_processed": bot.claims.processed_batches,
+        }
+        try:
+            ipc_queue.put_nowait(snapshot)
+        except queue.Full:
+            pass
+        await asyncio.sleep(interval)
+
+
+def _worker_entry(
+    index: int,
+    shard_ids: List[int],
+    shard_count: int,
+    worker_count: int,
+    ipc_queue,
+    debug: bool
+) -> None:
+    """Process entry point of a cluster worker."""
+    from .main import main
+
+    if debug and "--debug" not in sys.argv:
+        sys.argv.append("--debug")
+    try:
+        asyncio.run(main(
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+            cluster_index=index,
+            worker_count=worker_count,
+            ipc_queue=ipc_queue
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+class ClusterLauncher:
+    """Starts, supervises and aggregates cluster workers."""
+
+    def __init__(self, settings: Settings, workers: int, shard_count: int, debug: bool):
+        self.settings = settings
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.debug = debug
+        self.context = multiprocessing.get_context("spawn")
+        self.queue = self.context.Queue(maxsize=1000)
+        self.processes: Dict[int, Any] = {}
+        self.started_at: Dict[int, float] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.snapshots: Dict[int, Dict[str, Any]] = {}
+        self._previous_events: Optional[int] = None
+        self._previous_time = time.monotonic()
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=_worker_entry,
+            args=(index, self.ranges[index], self.shard_count, len(self.ranges), self.queue, self.debug),
+            name=f"bot-worker-{index}",
+            daemon=False
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        logger.info(f"Started worker {index} (pid {process.pid}) with shards {self.ranges[index]}")
+
+    def stop(self, *_: Any) -> None:
+        """Terminate all workers."""
+        self._stopping = True
+        for index, process in self.processes.items():
+            if process.is_alive():
+                logger.info(f"Stopping worker {index} (pid {process.pid})")
+                process.terminate()
+
+    def _drain_queue(self) -> None:
+        while True:
+            try:
+                snapshot = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.snapshots[snapshot["worker"]] = snapshot
+
+    def _log_aggregate(self) -> None:
+        now = time.monotonic()
+        alive = sum(1 for process in self.processes.values() if process.is_alive())
+        snapshots = list(self.snapshots.values())
+        events = sum(s["gateway_events"] for s in snapshots)
+        rate = 0.0
+        if self._previous_events is not None:
+            rate = max(events - self._previous_events, 0) / max(now - self._previous_time, 1e-9)
+        self._previous_events = events
+        self._previous_time = now
+
+        latencies = [s["latency_ms"] for s in snapshots if s["latency_ms"] is not None]
+        logger.info(
+            f"Cluster: workers={alive}/{len(self.ranges)} shards={self.shard_count} "
+            f"guilds={sum(s['guilds'] for s in snapshots)} "
+            f"cached_members={sum(s['cached_members'] for s in snapshots)} "
+            f"rss={sum(s['rss'] for s in snapshots) / (1024 * 1024):.1f}MiB "
+            f"gateway_events={rate:.2f}/s "
+            f"max_latency={max(latencies) if latencies else 'n/a'}ms "
+            f"jobs_running={sum(s['jobs_running'] for s in snapshots)} "
+            f"batches_processed={sum(s['batches_processed'] for s in snapshots)}"
+        )
+
+    def run(self) -> None:
+        """Start all workers and supervise them until stopped."""
+        for index in range(len(self.ranges)):
+            self._spawn(index)
+
+        interval = self.settings.cluster.report_interval
+        next_report = time.monotonic() + interval
+        while not self._stopping:
+            time.sleep(1)
+            self._drain_queue()
+
+            for index, process in list(self.processes.items()):
+                if process.is_alive() or self._stopping:
+                    continue
+                if index not in self.restart_at:
+                    logger.error(f"Worker {index} exited with code {process.exitcode}")
+                    self.snapshots.pop(index, None)
+                    # Avoid a tight restart loop on a worker that fails at startup
+                    self.restart_at[index] = self.started_at[index] + RESTART_BACKOFF
+                if time.monotonic() >= self.restart_at[index]:
+                    del self.restart_at[index]
+                    self._spawn(index)
+
+            if time.monotonic() >= next_report:
+                self._log_aggregate()
+                next_report = time.monotonic() + interval
+
+        for process in self.processes.values():
+            process.join(timeout=30)
+        logger.info("Cluster stopped")
+
+
+def run_cluster() -> None:
+    """Entry point of the cluster launcher."""
+    parser = argparse.ArgumentParser(description="Run the bot as a multi-process cluster")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CLUSTER_WORKERS)")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    debug = platform.system() == "Darwin" or args.debug
+    settings = init_settings(debug=debug)
+    setup_logging(log_level=settings.log_level, log_file="discord.log", config=settings.logging)
+
+    workers = args.workers or settings.cluster.workers
+    token = settings.discord.debug_token if debug else settings.discord.token
+    shard_count = settings.cluster.shard_count or asyncio.run(fetch_recommended_shards(token))
+    # Every worker needs at least one shard
+    shard_count = max(shard_count, workers)
+
+    launcher = ClusterLauncher(settings, workers, shard_count, debug)
+    signal.signal(signal.SIGTERM, launcher.stop)
+    signal.signal(signal.SIGINT, launcher.stop)
+    logger.info(f"Starting cluster: {workers} worker(s), {shard_count} shard(s)")
+    launcher.run()
+
+
+if __name__ == "__main__":
+    run_cluster()
@@ -10,16 +10,25 @@ if sys.version_info < (3, 9):
 
 import asyncio
 import logging
+import os
 import platform
-from typing import Optional
+import signal
+from dataclasses import replace
+from typing import List, Optional
 
 import discord
 
 from ..config.settings import Settings, init_settings
 from ..database.pool import DatabasePool, init_pool
-from ..utils.logging import setup_logging
+from ..database.schema import ensure_schema
+from ..utils.logging import setup_logging, shutdown_logging
+from ..utils.loop_monitor import LoopLagMonitor
 from ..utils.exceptions import ConfigError, DatabaseError
+from ..utils.tracing import init_tracing
 from .client import BotClient
+from .cluster import cluster_report_task
+from .metrics_server import MetricsServer
+from .startup import StartupTimer
 
 logger: Optional[logging.Logger] = None
 
@@ -61,8 +70,40 @@ async def status_report_task(settings: Settings) -> None:
         await asyncio.sleep(settings.division.status_report_interval)
 
 
-async def main() -> None:
-    """Main bot function."""
+def install_signal_handlers(task: asyncio.Task) -> None:
+    """
+    Turn SIGTERM and SIGINT into a cancellation of the main task.
+    
+    main() then drains in-flight work before closing anything. SIGTERM
+    is what service managers and the cluster launcher send; a second
+    signal cancels the drain itself.
+    """
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops do not support signal handlers
+            pass
+
+
+async def main(
+    shard_ids: Optional[List[int]] = None,
+    shard_count: Optional[int] = None,
+    cluster_index: Optional[int] = None,
+    worker_count: Optional[int] = None,
+    ipc_queue=None
+) -> None:
+    """
+    Main bot function.
+    
+    Args:
+        shard_ids: Shards run by this process (cluster workers only)
+        shard_count: Total shard count (cluster workers only)
+        cluster_index: Worker index (cluster workers only)
+        worker_count: Number of workers the launcher started (cluster workers only)
+        ipc_queue: Queue for health reports to the cluster launcher
+    """
     global logger
     
     # Determine if debug mode
@@ -76,23 +117,54 @@ async def main() -> None:
         log_dir = "discord-bot" if platform.system() == "Darwin" else "."
         logger = setup_logging(
             log_level=settings.log_level,
-            log_file="discord.log",
-            log_dir=log_dir
+            log_file="discord.log" if cluster_index is None else f"discord.worker{cluster_index}.log",
+            log_dir=log_dir,
+            config=settings.logging
         )
         
-        logger.info(f"Starting bot (debug={debug})")
+        tracing = settings.tracing
+        export_file = tracing.export_file
+        if export_file and cluster_index is not None:
+            root, ext = os.path.splitext(export_file)
+            export_file = f"{root}.worker{cluster_index}{ext}"
+        tracer = init_tracing(tracing.enabled, export_file, tracing.sample_rate, tracing.slow_threshold_ms)
         
-        # Initialize database pool
-        db_pool = init_pool(settings.database)
-        pool = await db_pool.create_pool()
+        loop_monitor = None
+        if settings.loop_monitor.enabled:
+            lag_log = settings.loop_monitor.log_file
+            if lag_log:
+                if cluster_index is not None:
+                    root, ext = os.path.splitext(lag_log)
+                    lag_log = f"{root}.worker{cluster_index}{ext}"
+                lag_log = os.path.join(log_dir, lag_log)
+            loop_monitor = LoopLagMonitor(settings.loop_monitor.interval, settings.loop_monitor.threshold, lag_log)
+            loop_monitor.start()
         
-        # Check database connection
-        if not await db_pool.check_connection():
-            logger.critical("Database connection failed, shutting down...")
-            return
+        database_config = settings.database
+        if cluster_index is None:
+            logger.info(f"Starting bot (debug={debug})")
+        else:
+            logger.info(f"Starting cluster worker {cluster_index} with shards {shard_ids} of {shard_count} (debug={debug})")
+            # Workers share one connection budget
+            max_size = max(1, settings.database.max_size // (worker_count or settings.cluster.workers))
+            database_config = replace(
+                settings.database,
+                max_size=max_size,
+                min_size=min(settings.database.min_size, max_size)
+            )
+        
+        startup = StartupTimer()
+        
+        # Initialize database pool (connected during warmup)
+        db_pool = init_pool(database_config)
         
         # Create bot client
-        bot = BotClient(settings)
+        bot = BotClient(
+            settings,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+            cluster_index=cluster_index
+        )
         
         # Store pool in bot for access by cogs
         bot.db_pool = db_pool
@@ -100,22 +172,86 @@ async def main() -> None:
         # Determine which token to use
         token = settings.discord.debug_token if debug else settings.discord.token
         
-        # Start status report task
-        status_task = asyncio.create_task(status_report_task(settings))
+        # Expose Prometheus metrics (one port per cluster worker)
+        metrics_server = None
+        if settings.metrics.enabled:
+            metrics_server = MetricsServer(bot, settings.metrics.host, settings.metrics.port + (cluster_index or 0))
+            await metrics_server.start()
         
+        # Start background tasks (status report once per cluster)
+        background_tasks = []
+        if bot.is_primary:
+            background_tasks.append(asyncio.create_task(status_report_task(settings)))
+        if ipc_queue is not None:
+            background_tasks.append(asyncio.create_task(
+                cluster_report_task(bot, ipc_queue, cluster_index, settings.cluster.report_interval)
+            ))
+        
+        async def warm_database() -> None:
+            await db_pool.create_pool()
+            if not await db_pool.check_connection():
+                raise DatabaseError("Database connection check failed")
+            # Bring the schema up to date
+            await ensure_schema(db_pool)
+            if bot.identity_filter is not None:
+                # A warm restart skips reading the whole user_data table
+                if await startup.phase("snapshot", bot.restore_cache_snapshot()):
+                    return
+                try:
+                    await startup.phase("identity_filter", bot.identity_filter.rebuild())
+                except Exception as e:
+                    # Joins are let through until the next rebuild
+                    logger.error(f"Could not build the identity filter: {e}")
+        
+        async def warm_up() -> None:
+            await asyncio.gather(
+                startup.phase("database", warm_database()),
+                startup.phase("http", bot.oauth_service.warmup())
+            )
+            bot.readiness.open()
+            logger.info(f"Startup warmup finished: {startup.summary()}")
+        
+        install_signal_handlers(asyncio.current_task())
+        
+        # Warmup runs alongside the gateway login and connect; events that
+        # need the database wait on bot.readiness until it has finished
+        warmup_task = asyncio.create_task(warm_up())
+        connect_task = None
         try:
-            # Start bot
-            await bot.start(token, reconnect=True)
+            # Login also runs setup_hook, which loads the extensions
+            await startup.phase("login", bot.login(token))
+            connect_task = asyncio.create_task(bot.connect(reconnect=True))
+            await warmup_task
+            await connect_task
         finally:
+            # Let in-flight verifications and writes finish while the pool
+            # and HTTP sessions are still open
+            logger.info(f"Shutting down, draining in-flight work (up to {settings.shutdown.timeout}s)")
+            report = await bot.drain(settings.shutdown.timeout)
+            if report.abandoned:
+                logger.warning(f"Shutdown deadline passed: {report.summary()}")
+            else:
+                logger.info(f"Shutdown drained all work: {report.summary()}")
+            await bot.save_cache_snapshot()
+            
             # Cleanup
-            status_task.cancel()
-            try:
-                await status_task
-            except asyncio.CancelledError:
-                pass
+            for task in (warmup_task, connect_task, *background_tasks):
+                if task is None or task.done():
+                    continue
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
             
-            await db_pool.close_pool()
+            if metrics_server:
+                await metrics_server.stop()
             await bot.close()
+            await db_pool.close_pool()
+            if loop_monitor:
+                await loop_monitor.stop()
+            tracer.close()
+            shutdown_logging()
             
     except ConfigError as e:
         print(f"Configuration error: {e}")
@@ -126,11 +262,11 @@ async def main() -> None:
         else:
             print(f"Database error: {e}")
         sys.exit(1)
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         if logger:
-            logger.info("Bot stopped by user")
+            logger.info("Bot stopped")
         else:
-            print("Bot stopped by user")
+            print("Bot stopped")
     except Exception as e:
         if logger:
             logger.exception(f"Unexpected error: {e}")
@@ -0,0 +1,73 @@
+"""Embedded HTTP server exposing Prometheus metrics."""
+
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from ..database.pool import get_pool
+from ..utils.metrics import REGISTRY
+from ..utils.process import current_rss_bytes
+
+logger = logging.getLogger("discord")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _pool_connections():
+    try:
+        pool = get_pool().pool
+    except RuntimeError:
+        pool = None
+    if not pool:
+        return {}
+    return {("total",): pool.size, ("free",): pool.freesize}
+
+
+class MetricsServer:
+    """Serves GET /metrics for Prometheus scrapes."""
+
+    def __init__(self, bot, host: str, port: int):
+        """
+        Initialize metrics server.
+
+        Args:
+            bot: BotClient whose state is exported as gauges
+            host: Listen address
+            port: Listen port
+        """
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+        # Read at scrape time, so they cost nothing between scrapes
+        REGISTRY.gauge("bot_guilds", "Guilds served by this process", callback=lambda: {(): len(bot.guilds)})
+        REGISTRY.gauge(
+            "bot_gateway_latency_seconds", "Gateway heartbeat latency per shard", ("shard",),
+            callback=lambda: {(str(shard_id),): latency for shard_id, latency in bot.latencies if latency == latency}
+        )
+        REGISTRY.gauge(
+            "bot_db_pool_connections", "Database pool connections", ("state",), callback=_pool_connections
+        )
+        REGISTRY.gauge("bot_jobs_running", "Background jobs running in this process", callback=lambda: {(): bot.jobs.running_count})
+        REGISTRY.gauge("process_resident_memory_bytes", "Resident memory size", callback=lambda: {(): current_rss_bytes()})
+
+    async def start(self) -> None:
+        """Start listening."""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
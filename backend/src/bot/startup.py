@@ -0,0 +1,73 @@
+"""Startup orchestration: phase timing and the readiness gate.
+
+main() runs the database warmup, the HTTP warmup and the gateway login
+concurrently and connects to the gateway as soon as the login is done.
+Events that arrive before the warmup has finished wait on the bot's
+ReadinessGate instead of racing a pool that is still being filled.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+
+logger = logging.getLogger("discord")
+
+T = TypeVar("T")
+
+
+class ReadinessGate:
+    """Holds work that needs warmed-up resources until startup has finished."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._event.is_set()
+
+    def open(self) -> None:
+        """Release everything waiting on the gate."""
+        if not self.is_open:
+            self.opened_at = time.monotonic()
+            self._event.set()
+
+    async def wait(self) -> None:
+        """Wait until the gate is open (returns at once when it already is)."""
+        await self._event.wait()
+
+
+class StartupTimer:
+    """Times startup phases and logs a breakdown."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    async def phase(self, name: str, awaitable: Awaitable[T]) -> T:
+        """
+        Await a startup phase and record how long it took.
+
+        Args:
+            name: Phase name for the breakdown
+            awaitable: The phase's work
+
+        Returns:
+            The result of the awaitable
+        """
+        started = time.monotonic()
+        try:
+            result = await awaitable
+        except BaseException:
+            logger.error(f"Startup phase {name} failed after {time.monotonic() - started:.2f}s")
+            raise
+        self.phases[name] = time.monotonic() - started
+        logger.info(f"Startup phase {name} finished in {self.phases[name]:.2f}s")
+        return result
+
+    def summary(self) -> str:
+        """Phase durations, wall time since start and the time saved by overlapping them."""
+        wall = time.monotonic() - self.started
+        phases = ", ".join(f"{name}={elapsed:.2f}s" for name, elapsed in self.phases.items())
+        return f"{phases} (wall {wall:.2f}s, sum of phases {sum(self.phases.values()):.2f}s)"
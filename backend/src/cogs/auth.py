@@ -2,7 +2,8 @@
 
 import logging
 import asyncio
-from typing import Optional
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -10,11 +11,23 @@ from discord.ext import commands
 from ..config.settings import get_settings
 from ..database.pool import get_pool
 from ..services.oauth import OAuthService
-from ..services.auth import AuthService
+from ..services.auth import AuthService, JoinBatcher
+from ..services.claims import BATCH_CANCELLED, BATCH_PENDING, JobClaimProgress, WorkBatch
+from ..services.identity import MATCH_DISCORD_ID, LatencyStat
+from ..services.jobs import JOB_CANCELLED, Job, JobContext, JobError
+from ..database.models import UserData
+from ..services.roles import RolePlan, plan_roles, is_division_staff, profile_fingerprint
 from ..utils.exceptions import OAuthError, TokenRefreshError
+from ..utils.metrics import ROLE_SYNC, TOKEN_QUARANTINE
+from ..utils.shutdown import SHUTDOWN
+from ..utils.tracing import span
 
 logger = logging.getLogger("discord")
 
+REFRESH_JOB = "refresh_tokens"
+REFRESH_BATCH_SIZE = 50
+REFRESH_POLL_INTERVAL = 5.0  # seconds between progress checks of a bulk refresh
+
 
 class Auth(commands.Cog):
     """Handles user authentication and verification."""
@@ -27,12 +40,19 @@ class Auth(commands.Cog):
             bot: Bot instance
         """
         self.bot = bot
-        settings = get_settings()
         
-        # Initialize services
-        oauth_service = OAuthService(settings.oauth)
-        self.auth_service = AuthService(oauth_service)
-        self.oauth_service = oauth_service
+        # Services are owned by the bot and shared by every guild it serves
+        self.auth_service: AuthService = bot.auth_service
+        self.oauth_service: OAuthService = bot.oauth_service
+        
+        # Joins arriving together are verified in one verify_members batch
+        self.joins = JoinBatcher(self.auth_service)
+        
+        # Join-to-roles latency per profile source (web flow handoff or IVAO)
+        self.join_latency: Dict[str, LatencyStat] = {}
+        
+        bot.jobs.register(REFRESH_JOB, self._run_refresh_job)
+        bot.claims.register(REFRESH_JOB, self._process_refresh_batch)
     
     @commands.Cog.listener()
     async def on_ready(self) -> None:
@@ -43,11 +63,21 @@ class Auth(commands.Cog):
     async def on_member_join(self, member: discord.Member) -> None:
         """Handle new member joining."""
         logger.info(f"{member.name} ({member.id}) joined the server")
-        result = await self.auth_service.verify_member(member, new_member=True)
+        if not SHUTDOWN.accepting:
+            logger.warning(f"Not verifying {member.name} ({member.id}): shutting down, /auth works after the restart")
+            return
+        started = time.monotonic()
+        if not self.bot.readiness.is_open:
+            logger.info(f"Holding join of {member.name} ({member.id}) until startup warmup has finished")
+            await self.bot.readiness.wait()
+        with SHUTDOWN.track("member_join"), span("member_join", member_id=member.id, guild_id=member.guild.id):
+            result = await self.joins.verify(member)
+            if result['success']:
+                await self._apply_roles(member, result['user_info'], result['user_data'])
         
         if result['success']:
-            await self._apply_roles(member, result['user_info'])
             logger.info(f"Successfully verified {member.name} ({member.id})")
+            self._record_join_latency(member, result['source'], time.monotonic() - started)
         else:
             error_code = result.get('error_code', 1)
             logger.warning(
@@ -55,15 +85,44 @@ class Auth(commands.Cog):
                 f"{result.get('error_message', 'Unknown error')} (code: {error_code})"
             )
     
+    def _record_join_latency(self, member: discord.Member, source: str, elapsed: float) -> None:
+        """Log how long a join took to get its roles, per profile source."""
+        stat = self.join_latency.setdefault(source, LatencyStat())
+        stat.add(elapsed)
+        since_join = ""
+        if member.joined_at:
+            since_join = f", {(discord.utils.utcnow() - member.joined_at).total_seconds():.2f}s after join"
+        summary = "; ".join(
+            f"{name}: n={s.count} avg={s.total / s.count * 1000:.0f}ms max={s.max * 1000:.0f}ms"
+            for name, s in sorted(self.join_latency.items())
+        )
+        logger.info(
+            f"Join-to-roles for {member.name} ({member.id}): {elapsed * 1000:.0f}ms via {source}{since_join} "
+            f"[{summary}]"
+        )
+    
+    @staticmethod
+    async def _check_accepting(interaction: discord.Interaction) -> bool:
+        """Refuse new work while the bot is shutting down, replying if so."""
+        if SHUTDOWN.accepting:
+            return True
+        await interaction.followup.send("⏳ The bot is restarting, please try again in a minute.", ephemeral=True)
+        return False
+    
     @app_commands.command(name="auth", description="Manual authentication")
     async def auth(self, interaction: discord.Interaction) -> None:
         """Manual authentication command."""
         await interaction.response.defer(ephemeral=True)
+        if not await self._check_accepting(interaction):
+            return
+        await self.bot.readiness.wait()
         
-        result = await self.auth_service.verify_member(interaction.user)
+        with SHUTDOWN.track("auth_command"), span("auth_command", member_id=interaction.user.id):
+            result = await self.auth_service.verify_member(interaction.user)
+            if result['success']:
+                await self._apply_roles(interaction.user, result['user_info'], result['user_data'])
         
         if result['success']:
-            await self._apply_roles(interaction.user, result['user_info'])
             await interaction.followup.send("✅ Authentication successful!", ephemeral=True)
         else:
             error_msg = result.get('error_message', 'Unknown error')
@@ -79,26 +138,30 @@ class Auth(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Check if user is staff
-        settings = get_settings()
         guild = interaction.guild
         if not guild:
             await interaction.followup.send("This command can only be used in a server.", ephemeral=True)
             return
         
-        staff_role = guild.get_role(settings.division.div_staff)
-        if not staff_role or staff_role not in interaction.user.roles:
+        if not is_division_staff(interaction.user):
             await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
             return
         
+        if not await self._check_accepting(interaction):
+            return
+        await self.bot.readiness.wait()
+        
         logger.info(
             f"{interaction.user.name}/{interaction.user.id} used staffauth on "
             f"{member.name}/{member.id}"
         )
         
-        result = await self.auth_service.verify_member(member)
+        with SHUTDOWN.track("staffauth_command"), span("staffauth_command", member_id=member.id):
+            result = await self.auth_service.verify_member(member)
+            if result['success']:
+                await self._apply_roles(member, result['user_info'], result['user_data'])
         
         if result['success']:
-            await self._apply_roles(member, result['user_info'])
             await interaction.followup.send(
                 f"✅ Successfully authenticated {member.mention}",
                 ephemeral=True
@@ -116,23 +179,33 @@ class Auth(commands.Cog):
         interaction: discord.Interaction,
         member: Optional[discord.Member] = None,
         days_old: int = 10,
-        all_users: bool = False
+        all_users: bool = False,
+        include_quarantined: bool = False
     ) -> None:
-        """Refresh tokens in database."""
+        """
+        Refresh tokens in database.
+        
+        Bulk refreshes skip tokens IVAO has rejected for good unless
+        include_quarantined is set; those users must sign in again.
+        user_data is shared by every division the bot serves, so with
+        several divisions only bot managers can start a bulk refresh.
+        """
         await interaction.response.defer(ephemeral=True)
         
         # Check permissions
-        settings = get_settings()
         guild = interaction.guild
         if not guild:
             await interaction.followup.send("This command can only be used in a server.", ephemeral=True)
             return
         
-        staff_role = guild.get_role(settings.division.div_staff)
-        if not staff_role or staff_role not in interaction.user.roles:
+        if not is_division_staff(interaction.user):
             await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
             return
         
+        if not await self._check_accepting(interaction):
+            return
+        await self.bot.readiness.wait()
+        
         # Build query
         pool = get_pool().pool
         if not pool:
@@ -147,101 +220,17 @@ class Auth(commands.Cog):
                 f"Display: '{member.display_name}')"
             )
             
-            # Try to find user by Discord ID first (convert to string since DB stores as varchar)
-            sql = "SELECT discord_user_id, vid, refresh_token FROM user_data WHERE discord_user_id = %s"
-            params = (str(member.id),)
-            
-            async with pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(sql, params)
-                    users = await cursor.fetchall()
-            
-            logger.info(f"Refreshtokens: Discord ID lookup found {len(users)} user(s)")
-            
-            # If not found by Discord ID, try multiple fallback methods
-            if not users:
-                vid = None
-                
-                # Method 1: Try to extract VID from display name (format: "Name | VID" or "Name | XM-SOC VID")
-                if member.display_name and '|' in member.display_name:
-                    try:
-                        parts = member.display_name.split('|')
-                        if len(parts) >= 2:
-                            # Get the part after the pipe and try to find numeric VID
-                            after_pipe = parts[1].strip()
-                            # Split by spaces and find the first numeric value
-                            for part in after_pipe.split():
-                                if part.isdigit() and len(part) >= 4:  # VIDs are typically 6 digits
-                                    vid = part
-                                    logger.info(f"Extracted VID {vid} from nickname '{member.display_name}' for token refresh")
-                                    break
-                    except Exception as e:
-                        logger.debug(f"Could not extract VID from nickname: {e}")
-                
-                # Method 2: Try looking up by Discord username
-                if not users and member.name:
-                    sql = "SELECT discord_user_id, vid, refresh_token FROM user_data WHERE discord_username = %s"
-                    params = (member.name,)
-                    async with pool.acquire() as conn:
-                        async with conn.cursor() as cursor:
-                            await cursor.execute(sql, params)
-                            users = await cursor.fetchall()
-                    
-                    logger.info(f"Refreshtokens: Discord username '{member.name}' lookup found {len(users)} user(s)")
-                    if users:
-                        logger.info(f"Found user by Discord username '{member.name}' for token refresh")
-                
-                # Method 3: Try looking up by firstname and lastname (extracted from display name or name)
-                if not users and member.display_name:
-                    try:
-                        # Try to extract first and last name from display name (format: "FirstName LastName | ...")
-                        name_part = member.display_name.split('|')[0].strip()
-                        name_parts = name_part.split()
-                        if len(name_parts) >= 2:
-                            firstname = name_parts[0]
-                            lastname = ' '.join(name_parts[1:])
-                            sql = """SELECT discord_user_id, vid, refresh_token FROM user_data 
-                                     WHERE firstname = %s AND lastname = %s"""
-                            params = (firstname, lastname)
-                            async with pool.acquire() as conn:
-                                async with conn.cursor() as cursor:
-                                    await cursor.execute(sql, params)
-                                    users = await cursor.fetchall()
-                            
-                            logger.info(
-                                f"Refreshtokens: Name lookup '{firstname} {lastname}' found {len(users)} user(s)"
-                            )
-                            if users:
-                                logger.info(f"Found user by name '{firstname} {lastname}' for token refresh")
-                    except Exception as e:
-                        logger.debug(f"Could not lookup by name: {e}")
-                
-                # Method 4: If we have VID, look up by VID
-                if not users and vid:
-                    sql = "SELECT discord_user_id, vid, refresh_token FROM user_data WHERE vid = %s"
-                    params = (vid,)
-                    async with pool.acquire() as conn:
-                        async with conn.cursor() as cursor:
-                            await cursor.execute(sql, params)
-                            users = await cursor.fetchall()
-                    
-                    logger.info(f"Refreshtokens: VID {vid} lookup found {len(users)} user(s)")
-                    if users:
-                        logger.info(f"Found user by VID {vid} for token refresh")
-                
-                # If found by VID or username, update Discord user ID in database
-                if users:
-                    user_row = users[0]
-                    found_vid = user_row[1] if len(user_row) > 1 else None
-                    if found_vid:
-                        async with pool.acquire() as conn:
-                            async with conn.cursor() as cursor:
-                                await cursor.execute(
-                                    "UPDATE user_data SET discord_user_id = %s WHERE vid = %s",
-                                    (str(member.id), found_vid)
-                                )
-                                await conn.commit()
-                                logger.info(f"Updated discord_user_id for VID {found_vid} to {member.id}")
+            # Resolve by Discord ID, VID, username or display name in one query
+            identity = self.auth_service.identity
+            match = await identity.resolve(member, include_weak=True)
+            users = []
+            if match:
+                user_data = match.user_data
+                # If found by another key, update Discord user ID in database
+                if match.kind != MATCH_DISCORD_ID and user_data.vid:
+                    await identity.link_discord_id(user_data, member.id)
+                users = [(user_data.discord_user_id, user_data.vid, user_data.refresh_token)]
+                logger.info(f"Refreshtokens: found user by {match.kind} ({identity.latency_summary()})")
             
             # If still no users found, return error
             if not users:
@@ -253,308 +242,373 @@ class Auth(commands.Cog):
                 logger.warning(f"Refreshtokens: {error_msg}")
                 await interaction.followup.send(error_msg, ephemeral=True)
                 return
-        elif all_users:
-            sql = "SELECT discord_user_id, vid, refresh_token FROM user_data WHERE refresh_token IS NOT NULL"
-            params = ()
-            await interaction.followup.send("Refreshing tokens for all users with refresh tokens... This may take a while.", ephemeral=True)
-            
-            # Get users
-            async with pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(sql, params)
-                    users = await cursor.fetchall()
-            
-            if not users:
-                await interaction.followup.send("No users found matching the criteria.", ephemeral=True)
-                return
         else:
-            sql = """SELECT discord_user_id, vid, refresh_token FROM user_data 
-                     WHERE refresh_token IS NOT NULL 
-                     AND TIMESTAMPDIFF(DAY, refresh_token_date, NOW()) > %s"""
-            params = (days_old,)
-            await interaction.followup.send(f"Refreshing tokens older than {days_old} days...", ephemeral=True)
-            
-            # Get users
-            async with pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute(sql, params)
-                    users = await cursor.fetchall()
-            
-            if not users:
-                await interaction.followup.send("No users found matching the criteria.", ephemeral=True)
+            settings = get_settings()
+            if settings.tenants and not settings.is_bot_manager(interaction.user.id):
+                # user_data is shared by every division served, so a sweep
+                # would rotate other divisions' tokens too
+                await interaction.followup.send(
+                    "❌ This bot serves several divisions; only bot managers can refresh all tokens. "
+                    "Pass a member to refresh one user's token.",
+                    ephemeral=True
+                )
                 return
+            
+            # Bulk refreshes run as a persisted background job
+            job = await self.bot.jobs.enqueue(
+                REFRESH_JOB,
+                {"all_users": all_users, "days_old": days_old, "include_quarantined": include_quarantined},
+                channel=interaction.channel,
+                guild_id=guild.id,
+                created_by=interaction.user.id
+            )
+            scope = "all users with refresh tokens" if all_users else f"tokens older than {days_old} days"
+            if include_quarantined:
+                scope += ", quarantined tokens included"
+            await interaction.followup.send(
+                f"Started job #{job.id}: refreshing {scope}. Progress is shown in {interaction.channel.mention}; "
+                f"use `/jobs status {job.id}` or `/jobs cancel {job.id}`.",
+                ephemeral=True
+            )
+            return
         
-        # Refresh tokens
-        total = len(users)
+        # Refresh the single member's token
         successful = 0
         failed = 0
         errors = []
-        
-        for idx, user_row in enumerate(users, 1):
-            # Handle different query result formats
-            if len(user_row) == 3:
-                discord_id, vid, refresh_token = user_row
-            else:
-                discord_id, vid = user_row
-                refresh_token = None
-            
-            # Check if user has a refresh token
-            if not refresh_token:
+        for discord_id, vid, refresh_token in users:
+            error = await self._refresh_user(discord_id, vid, refresh_token)
+            if error:
                 failed += 1
-                identifier = f"User {discord_id}" if discord_id else f"VID {vid}"
-                errors.append(f"{identifier} (VID: {vid}): No refresh token found. User needs to re-authenticate.")
-                logger.warning(f"Token refresh skipped for {identifier}: No refresh token")
-                continue
-            
-            try:
-                # Use VID if discord_id is None
-                if discord_id:
-                    await self.oauth_service.refresh_token(user_id=discord_id)
-                elif vid:
-                    await self.oauth_service.refresh_token(vid=vid)
-                else:
-                    failed += 1
-                    errors.append(f"User has no Discord ID or VID")
-                    continue
+                errors.append(error)
+            else:
                 successful += 1
-            except (OAuthError, TokenRefreshError) as e:
-                failed += 1
-                identifier = f"User {discord_id}" if discord_id else f"VID {vid}"
-                errors.append(f"{identifier} (VID: {vid}): {str(e)}")
-                logger.warning(f"Token refresh failed for {identifier}: {e}")
-            
-            # Update progress
-            if idx % 10 == 0 or idx == total:
-                await interaction.followup.send(
-                    f"Progress: {idx}/{total} processed... ✅ {successful} successful, ❌ {failed} failed",
-                    ephemeral=True
+        
+        await interaction.followup.send(
+            self._format_refresh_summary(successful, failed, len(users), errors[:10], len(errors)),
+            ephemeral=True
+        )
+        logger.info(f"Token refresh completed: {successful} successful, {failed} failed out of {len(users)} total")
+    
+    async def _refresh_user(
+        self,
+        discord_id: Optional[str],
+        vid: Optional[str],
+        refresh_token: Optional[str]
+    ) -> Optional[str]:
+        """
+        Refresh one user's token.
+        
+        Returns:
+            Error line if the refresh failed, None on success
+        """
+        identifier = f"User {discord_id}" if discord_id else f"VID {vid}"
+        
+        # Check if user has a refresh token
+        if not refresh_token:
+            logger.warning(f"Token refresh skipped for {identifier}: No refresh token")
+            return f"{identifier} (VID: {vid}): No refresh token found. User needs to re-authenticate."
+        
+        try:
+            # Use VID if discord_id is None
+            if discord_id:
+                await self.oauth_service.refresh_token(user_id=discord_id)
+            elif vid:
+                await self.oauth_service.refresh_token(vid=vid)
+            else:
+                return "User has no Discord ID or VID"
+        except (OAuthError, TokenRefreshError) as e:
+            logger.warning(f"Token refresh failed for {identifier}: {e}")
+            return f"{identifier} (VID: {vid}): {str(e)}"
+        return None
+    
+    @staticmethod
+    def _refresh_filter(params: Dict[str, Any], quarantined: Optional[bool] = None) -> Tuple[str, tuple]:
+        """
+        Build the WHERE clause selecting users for a bulk refresh.
+        
+        Args:
+            params: Job parameters
+            quarantined: Select only quarantined (True) or only healthy
+                (False) tokens; None follows the job's include_quarantined
+        """
+        if params.get("all_users"):
+            where, where_params = "refresh_token IS NOT NULL", ()
+        else:
+            where, where_params = (
+                "refresh_token IS NOT NULL AND TIMESTAMPDIFF(DAY, refresh_token_date, NOW()) > %s",
+                (params.get("days_old", 10),)
+            )
+        if quarantined is None and not params.get("include_quarantined"):
+            # Tokens IVAO rejected for good stay dead until the user signs in again
+            quarantined = False
+        if quarantined is not None:
+            where += " AND token_failed_at IS NOT NULL" if quarantined else " AND token_failed_at IS NULL"
+        return where, where_params
+    
+    async def _run_refresh_job(self, job: Job, ctx: JobContext) -> str:
+        """
+        Job handler for bulk token refreshes.
+        
+        Splits the matching users into ID-range batches in work_claims. The
+        claim workers of every replica, this one included, process the
+        batches; this handler only tracks their progress. A replica that
+        dies loses its batch lease and the batch is reclaimed by another.
+        """
+        pool = get_pool().pool
+        if not pool:
+            raise JobError("Database pool not available")
+        
+        store = self.bot.claims.store
+        cp = ctx.checkpoint
+        progress = await store.progress(job.id)
+        if progress.batches == 0:
+            where, where_params = self._refresh_filter(job.params)
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(f"SELECT id FROM user_data WHERE {where} ORDER BY id", where_params)
+                    ids = [row[0] for row in await cursor.fetchall()]
+                    cp["quarantined"] = 0
+                    if not job.params.get("include_quarantined"):
+                        where, where_params = self._refresh_filter(job.params, quarantined=True)
+                        await cursor.execute(f"SELECT COUNT(*) FROM user_data WHERE {where}", where_params)
+                        (cp["quarantined"],) = await cursor.fetchone()
+                        TOKEN_QUARANTINE.inc(cp["quarantined"], event="skipped")
+            cp["total"] = len(ids)
+            cp["batches"] = await store.create_batches(job.id, REFRESH_JOB, job.params, ids, REFRESH_BATCH_SIZE)
+            await ctx.save(force=True)
+        else:
+            # Resumed after /jobs cancel: hand the cancelled batches back out
+            await store.set_job_status(job.id, BATCH_CANCELLED, BATCH_PENDING)
+        
+        try:
+            while True:
+                progress = await store.progress(job.id)
+                self._aggregate_refresh_progress(cp, progress)
+                await ctx.save()
+                if progress.batches == 0 or progress.finished:
+                    break
+                await ctx.report(
+                    f"Job #{job.id} progress: {cp['processed']}/{cp['total']} processed "
+                    f"({progress.done}/{progress.batches} batches"
+                    f"{f', {progress.failed} failed' if progress.failed else ''})... "
+                    f"✅ {cp['successful']} successful, ❌ {cp['failed']} failed"
                 )
+                await asyncio.sleep(REFRESH_POLL_INTERVAL)
+        except asyncio.CancelledError:
+            if job.status == JOB_CANCELLED:
+                # Batches already claimed finish; the rest are not started
+                await asyncio.shield(store.set_job_status(job.id, BATCH_PENDING, BATCH_CANCELLED))
+            raise
+        
+        await ctx.save(force=True)
+        logger.info(
+            f"Token refresh job #{job.id} completed: {cp['successful']} successful, "
+            f"{cp['failed']} failed out of {cp['processed']} total, "
+            f"{cp.get('quarantined', 0)} quarantined token(s) skipped, "
+            f"{cp['failed_batches']} batch(es) failed"
+        )
+        # The summary replaces the public progress message, so it only has
+        # counts; the error lines name users and go to the log channel
+        summary = self._format_refresh_summary(
+            cp["successful"], cp["failed"], cp["processed"], [], cp["error_count"],
+            cp.get("quarantined", 0), cp["failed_batches"]
+        )
+        if cp["errors"] or cp["batch_errors"]:
+            posted = await self._post_refresh_errors(job, cp)
+            summary += f"\nError details are in {'the log channel' if posted else 'the bot log'}."
+        return summary
+    
+    async def _post_refresh_errors(self, job: Job, cp: Dict[str, Any]) -> bool:
+        """
+        Post the error lines of a bulk refresh to the log channel of the
+        job's division.
+        
+        Returns:
+            True if they were posted, False if there is no log channel
+        """
+        text = f"**Token refresh job #{job.id} errors**\n"
+        if cp["batch_errors"]:
+            text += f"Failed batches: {'; '.join(sorted(set(cp['batch_errors'])))}\n"
+        if cp["errors"]:
+            text += f"First {len(cp['errors'])} of {cp['error_count']} errors:\n" + "\n".join(cp["errors"])
+        logger.warning(text)
+        
+        channel = self.bot.get_channel(get_settings().division_for(job.guild_id).log_channel_id)
+        if channel is None:
+            return False
+        try:
+            await channel.send(text[:2000])
+        except discord.HTTPException as e:
+            logger.warning(f"Could not post errors of job #{job.id} to the log channel: {e}")
+            return False
+        return True
+    
+    @staticmethod
+    def _aggregate_refresh_progress(cp: Dict[str, Any], progress: JobClaimProgress) -> None:
+        """Sum the results of finished batches into the job checkpoint."""
+        cp.setdefault("total", 0)
+        for key in ("processed", "successful", "failed", "error_count"):
+            cp[key] = sum(result.get(key, 0) for result in progress.results)
+        cp["errors"] = [error for result in progress.results for error in result.get("errors", [])][:10]
+        cp["failed_batches"] = progress.failed
+        cp["batch_errors"] = progress.errors[:10]
+    
+    async def _process_refresh_batch(
+        self,
+        batch: WorkBatch,
+        renew: Callable[[], Awaitable[bool]]
+    ) -> Dict[str, Any]:
+        """
+        Claim worker processor: refresh every matching user in a batch.
+        
+        The filter is evaluated again so users refreshed since the job was
+        created are skipped.
+        """
+        pool = get_pool().pool
+        if not pool:
+            raise JobError("Database pool not available")
+        
+        where, where_params = self._refresh_filter(batch.params)
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""SELECT discord_user_id, vid, refresh_token FROM user_data
+                        WHERE {where} AND id BETWEEN %s AND %s ORDER BY id""",
+                    where_params + (batch.range_start, batch.range_end)
+                )
+                rows = await cursor.fetchall()
+        
+        result = {"processed": 0, "successful": 0, "failed": 0, "error_count": 0, "errors": []}
+        renew_interval = self.bot.claims.store.lease_seconds / 3
+        last_renewal = time.monotonic()
+        for discord_id, vid, refresh_token in rows:
+            error = await self._refresh_user(discord_id, vid, refresh_token)
+            result["processed"] += 1
+            if error:
+                result["failed"] += 1
+                result["error_count"] += 1
+                if len(result["errors"]) < 10:
+                    result["errors"].append(error)
+            else:
+                result["successful"] += 1
             
-            if total > 1 and idx < total:
-                await asyncio.sleep(0.5)
+            if time.monotonic() - last_renewal >= renew_interval:
+                if not await renew():
+                    raise JobError(f"Lost claim on batch #{batch.id}")
+                last_renewal = time.monotonic()
+            await asyncio.sleep(0.5)
         
-        # Final result
+        return result
+    
+    @staticmethod
+    def _format_refresh_summary(
+        successful: int,
+        failed: int,
+        total: int,
+        errors: List[str],
+        error_count: int,
+        quarantined: int = 0,
+        failed_batches: int = 0,
+        batch_errors: Optional[List[str]] = None
+    ) -> str:
+        """Format the final token refresh report."""
         result_msg = (
             f"**Token refresh completed**\n\n"
             f"✅ Successful: {successful}\n"
             f"❌ Failed: {failed}\n"
             f"📊 Total: {total}\n"
         )
+        if quarantined:
+            result_msg += (
+                f"⏭️ Skipped: {quarantined} quarantined token(s) rejected by IVAO earlier "
+                f"({quarantined} IVAO calls avoided; these users must sign in again)\n"
+            )
+        if failed_batches:
+            # Their users were not (or only partly) refreshed
+            result_msg += f"⚠️ {failed_batches} batch(es) failed after all retries and were given up"
+            result_msg += f": {'; '.join(sorted(set(batch_errors)))}\n" if batch_errors else "\n"
         
         if errors:
             result_msg += f"\n**Errors (first 10):**\n" + "\n".join(errors[:10])
-            if len(errors) > 10:
-                result_msg += f"\n... and {len(errors) - 10} more errors."
+            if error_count > 10:
+                result_msg += f"\n... and {error_count - 10} more errors."
         
-        await interaction.followup.send(result_msg, ephemeral=True)
-        logger.info(f"Token refresh completed: {successful} successful, {failed} failed out of {total} total")
+        return result_msg
+    
+    async def _apply_roles(
+        self,
+        member: discord.Member,
+        user_info: dict,
+        user_data: Optional[UserData] = None
+    ) -> None:
+        """Apply roles to member based on user info, to completion even if the caller is cancelled."""
+        await SHUTDOWN.protect("roles", self._apply_role_plan(member, user_info, user_data))
     
-    async def _apply_roles(self, member: discord.Member, user_info: dict) -> None:
-        """Apply roles to member based on user info."""
-        settings = get_settings()
-        guild = member.guild
-        
-        # Get role objects
-        staff = guild.get_role(settings.division.div_staff)
-        div_hq = guild.get_role(settings.division.div_hq)
-        specops = guild.get_role(settings.division.specops)
-        flightops = guild.get_role(settings.division.flightops)
-        atcops = guild.get_role(settings.division.atcops)
-        training = guild.get_role(settings.division.training)
-        web = guild.get_role(settings.division.web)
-        membership = guild.get_role(settings.division.membership)
-        event = guild.get_role(settings.division.event)
-        pr = guild.get_role(settings.division.pr)
-        vid_verified = guild.get_role(settings.division.vid_verified)
-        div_member = guild.get_role(settings.division.div_member)
-        non_div_ivao_member = guild.get_role(settings.division.non_div_ivao_member)
-        
-        first_name = user_info.get('firstName', '')
-        last_name = user_info.get('lastName', '')
-        vid = user_info.get('id', '')
-        div = user_info.get('divisionId', '')
-        name = f"{first_name} {last_name}" if first_name and last_name else member.name
+    async def _apply_role_plan(
+        self,
+        member: discord.Member,
+        user_info: dict,
+        user_data: Optional[UserData]
+    ) -> None:
+        """
+        Plan and apply roles and nickname (see _apply_roles).
         
-        # Check if user is staff
-        if user_info.get('isStaff'):
-            staff_positions = []
-            if 'userStaffPositions' in user_info and isinstance(user_info['userStaffPositions'], list):
-                for position in user_info['userStaffPositions']:
-                    if isinstance(position, dict) and 'id' in position:
-                        staff_positions.append(position['id'])
+        Members who already have every granted role and the nickname get no
+        Discord REST call; otherwise only the missing roles and the nickname
+        are sent. The fingerprint of the applied profile and the granted
+        roles are then recorded on the user_data row.
+        """
+        with span("apply_roles", member_id=member.id) as s:
+            with span("plan_roles"):
+                division = get_settings().division_for(member.guild.id)
+                plan = plan_roles(division, member.guild, member, user_info)
+            s.set("roles", len(plan.roles))
             
-            if div == settings.division.division:
-                # Map staff positions to roles
-                role_mapping = {
-                    # Director and Assistant Director -> all staff roles
-                    f"{settings.division.division}-DIR": [staff, div_hq, specops, flightops, atcops, training, web, membership, event, pr],
-                    f"{settings.division.division}-ADIR": [staff, div_hq, specops, flightops, atcops, training, web, membership, event, pr],
-                    # Special Operations
-                    f"{settings.division.division}-SOC": [staff, specops],
-                    f"{settings.division.division}-SOAC": [staff, specops],
-                    f"{settings.division.division}-SOA1": [staff, specops],
-                    # Flight Operations
-                    f"{settings.division.division}-FOC": [staff, flightops],
-                    f"{settings.division.division}-FOAC": [staff, flightops],
-                    f"{settings.division.division}-FOA1": [staff, flightops],
-                    # ATC Operations
-                    f"{settings.division.division}-AOC": [staff, atcops],
-                    f"{settings.division.division}-AOAC": [staff, atcops],
-                    f"{settings.division.division}-AOA1": [staff, atcops],
-                    # Training
-                    f"{settings.division.division}-TC": [staff, training],
-                    f"{settings.division.division}-TAC": [staff, training],
-                    f"{settings.division.division}-TA1": [staff, training],
-                    # Web
-                    f"{settings.division.division}-WM": [staff, web],
-                    f"{settings.division.division}-AWM": [staff, web],
-                    f"{settings.division.division}-WMA1": [staff, web],
-                    # Membership
-                    f"{settings.division.division}-MC": [staff, membership],
-                    f"{settings.division.division}-MAC": [staff, membership],
-                    f"{settings.division.division}-MA1": [staff, membership],
-                    # Event
-                    f"{settings.division.division}-EC": [staff, event],
-                    f"{settings.division.division}-EAC": [staff, event],
-                    f"{settings.division.division}-EA1": [staff, event],
-                    # Public Relations
-                    f"{settings.division.division}-PRC": [staff, pr],
-                    f"{settings.division.division}-PRAC": [staff, pr],
-                    f"{settings.division.division}-PRA1": [staff, pr],
-                }
-                
-                position_names = {
-                    f"{settings.division.division}-DIR": "DIR",
-                    f"{settings.division.division}-ADIR": "ADIR",
-                    f"{settings.division.division}-SOC": "SOC",
-                    f"{settings.division.division}-SOAC": "SOAC",
-                    f"{settings.division.division}-SOA1": "SOA1",
-                    f"{settings.division.division}-FOC": "FOC",
-                    f"{settings.division.division}-FOAC": "FOAC",
-                    f"{settings.division.division}-FOA1": "FOA1",
-                    f"{settings.division.division}-AOC": "AOC",
-                    f"{settings.division.division}-AOAC": "AOAC",
-                    f"{settings.division.division}-AOA1": "AOA1",
-                    f"{settings.division.division}-TC": "TC",
-                    f"{settings.division.division}-TAC": "TAC",
-                    f"{settings.division.division}-TA1": "TA1",
-                    f"{settings.division.division}-WM": "WM",
-                    f"{settings.division.division}-AWM": "AWM",
-                    f"{settings.division.division}-WMA1": "WMA1",
-                    f"{settings.division.division}-MC": "MC",
-                    f"{settings.division.division}-MAC": "MAC",
-                    f"{settings.division.division}-MA1": "MA1",
-                    f"{settings.division.division}-EC": "EC",
-                    f"{settings.division.division}-EAC": "EAC",
-                    f"{settings.division.division}-EA1": "EA1",
-                    f"{settings.division.division}-PRC": "PRC",
-                    f"{settings.division.division}-PRAC": "PRAC",
-                    f"{settings.division.division}-PRA1": "PRA1",
-                }
-                
-                div_ranks = [
-                    f"{settings.division.division}-DIR", f"{settings.division.division}-ADIR",
-                    f"{settings.division.division}-SOC", f"{settings.division.division}-SOAC", f"{settings.division.division}-SOA1",
-                    f"{settings.division.division}-FOC", f"{settings.division.division}-FOAC", f"{settings.division.division}-FOA1",
-                    f"{settings.division.division}-AOC", f"{settings.division.division}-AOAC", f"{settings.division.division}-AOA1",
-                    f"{settings.division.division}-TC", f"{settings.division.division}-TAC", f"{settings.division.division}-TA1",
-                    f"{settings.division.division}-WM", f"{settings.division.division}-AWM", f"{settings.division.division}-WMA1",
-                    f"{settings.division.division}-MC", f"{settings.division.division}-MAC", f"{settings.division.division}-MA1",
-                    f"{settings.division.division}-EC", f"{settings.division.division}-EAC", f"{settings.division.division}-EA1",
-                    f"{settings.division.division}-PRC", f"{settings.division.division}-PRAC", f"{settings.division.division}-PRA1",
-                ]
-                
-                matching_positions = [pos for pos in staff_positions if pos in div_ranks]
-                role_names = []
-                
-                for position in matching_positions:
-                    roles = role_mapping.get(position, [])
-                    for role in roles:
-                        if role and role not in member.roles:
-                            try:
-                                await member.add_roles(role, reason="IVAO staff authentication")
-                            except discord.Forbidden:
-                                logger.error(f"Missing permissions to add role {role.name} to {member.name}")
-                    
-                    position_name = position_names.get(position)
-                    if position_name and position_name not in role_names:
-                        role_names.append(position_name)
-                        # Add base member and verified roles
-                        if div_member and div_member not in member.roles:
-                            try:
-                                await member.add_roles(div_member, reason="IVAO authentication")
-                            except discord.Forbidden:
-                                logger.error(f"Missing permissions to add DIV_MEMBER role to {member.name}")
-                        if vid_verified and vid_verified not in member.roles:
-                            try:
-                                await member.add_roles(vid_verified, reason="IVAO authentication")
-                            except discord.Forbidden:
-                                logger.error(f"Missing permissions to add VID_VERIFIED role to {member.name}")
-                
-                # Update nickname with staff position
-                if role_names:
-                    role_str = "/".join(role_names)
-                    nickname = f"{name} | {settings.division.division}-{role_str}"
-                    if len(nickname) > 32:
-                        nickname = f"{name} | {settings.division.division} Staff"
-                else:
-                    nickname = f"{name} | {settings.division.division} Staff"
-                
-                try:
-                    await member.edit(nick=nickname)
-                except discord.Forbidden:
-                    logger.error(f"Missing permissions to edit nickname for {member.name}")
-                except Exception as e:
-                    logger.warning(f"Could not set nickname '{nickname}': {e}")
-                    # Try shorter version
-                    try:
-                        await member.edit(nick=f"{member.name} | {settings.division.division} Staff")
-                    except:
-                        pass
+            if not plan.roles and plan.nickname_applied(member):
+                s.set("unchanged", True)
+                ROLE_SYNC.inc(result="unchanged")
             else:
-                # Staff from other division
-                nickname = f"{name} | {vid}" if len(f"{name} | {vid}") < 32 else f"{member.name} | {vid}"
-                try:
-                    await member.edit(nick=nickname)
-                except discord.Forbidden:
-                    logger.error(f"Missing permissions to edit nickname for {member.name}")
-                
-                if vid_verified and vid_verified not in member.roles:
-                    try:
-                        await member.add_roles(vid_verified, reason="IVAO authentication")
-                    except discord.Forbidden:
-                        logger.error(f"Missing permissions to add VID_VERIFIED role to {member.name}")
-                if non_div_ivao_member and non_div_ivao_member not in member.roles:
-                    try:
-                        await member.add_roles(non_div_ivao_member, reason="IVAO authentication")
-                    except discord.Forbidden:
-                        logger.error(f"Missing permissions to add NON_DIV_IVAO_MEMBER role to {member.name}")
-        else:
-            # Not staff - regular member
-            nickname = f"{name} | {vid}" if len(f"{name} | {vid}") < 32 else f"{member.name} | {vid}"
+                ROLE_SYNC.inc(result="updated")
+                await self._apply_role_changes(member, plan)
+            
+            if user_data is not None:
+                await self.auth_service.store_applied_roles(
+                    user_data, profile_fingerprint(user_info), [role.id for role in plan.granted]
+                )
+    
+    @staticmethod
+    async def _apply_role_changes(member: discord.Member, plan: RolePlan) -> None:
+        """
+        Add the missing roles one by one and set the nickname with its fallback.
+        
+        Roles are only ever added, never set as a list: a list built from the
+        cached member would drop roles a moderator or another bot gave the
+        member in the meantime. One failure does not block the rest.
+        """
+        for role in plan.roles:
             try:
-                await member.edit(nick=nickname)
+                with span("discord.add_role", role=role.name):
+                    await member.add_roles(role, reason=plan.reason)
             except discord.Forbidden:
-                logger.error(f"Missing permissions to edit nickname for {member.name}")
-            
-            if div == settings.division.division:
-                if div_member and div_member not in member.roles:
-                    try:
-                        await member.add_roles(div_member, reason="IVAO authentication")
-                    except discord.Forbidden:
-                        logger.error(f"Missing permissions to add DIV_MEMBER role to {member.name}")
-            else:
-                if non_div_ivao_member and non_div_ivao_member not in member.roles:
-                    try:
-                        await member.add_roles(non_div_ivao_member, reason="IVAO authentication")
-                    except discord.Forbidden:
-                        logger.error(f"Missing permissions to add NON_DIV_IVAO_MEMBER role to {member.name}")
-            
-            if vid_verified and vid_verified not in member.roles:
+                logger.error(f"Missing permissions to add role {role.name} to {member.name}")
+        
+        if plan.nickname_applied(member):
+            return
+        try:
+            with span("discord.edit_nick"):
+                await member.edit(nick=plan.nickname)
+        except discord.Forbidden:
+            logger.error(f"Missing permissions to edit nickname for {member.name}")
+        except Exception as e:
+            logger.warning(f"Could not set nickname '{plan.nickname}': {e}")
+            # Try shorter version
+            if plan.fallback_nickname:
                 try:
-                    await member.add_roles(vid_verified, reason="IVAO authentication")
-                except discord.Forbidden:
-                    logger.error(f"Missing permissions to add VID_VERIFIED role to {member.name}")
+                    with span("discord.edit_nick", fallback=True):
+                        await member.edit(nick=plan.fallback_nickname)
+                except Exception:
+                    pass
 
 
 async def setup(bot: commands.Bot) -> None:
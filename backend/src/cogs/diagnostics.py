@@ -0,0 +1,226 @@
+"""Live process diagnostics for bot managers."""
+
+import asyncio
+import gzip
+import io
+import logging
+import tracemalloc
+from datetime import datetime
+from typing import List
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from ..services.identity import parse_nickname
+from ..utils.memory import CacheStat, estimate_size, format_bytes, format_growth
+from ..utils.metrics import REGISTRY
+from ..utils.process import current_rss_bytes
+from ..utils.profiler import ProfilerBusyError, SamplingProfiler
+
+logger = logging.getLogger("discord")
+
+MAX_PROFILE_SECONDS = 300
+# Stay below the attachment limit of servers without boosts
+MAX_ATTACHMENT_BYTES = 8 * 1024 * 1024
+# Discord message length limit, with room for the surrounding text
+MAX_SUMMARY_CHARS = 1500
+
+
+class Diagnostics(commands.GroupCog, group_name="diagnostics", group_description="Process diagnostics - BOT MANAGERS ONLY"):
+    """Profiling commands that run against the live process."""
+
+    def __init__(self, bot: commands.Bot):
+        """
+        Initialize diagnostics cog.
+
+        Args:
+            bot: Bot instance
+        """
+        self.bot = bot
+        super().__init__()
+
+    async def _check_manager(self, interaction: discord.Interaction) -> bool:
+        """Check that the user is a bot manager, replying if not."""
+        if not self.bot.is_bot_manager(interaction.user.id):
+            await interaction.followup.send("❌ Only bot managers can use this command.", ephemeral=True)
+            return False
+        return True
+
+    @app_commands.command(name="profile", description="Sample the event loop's CPU usage - BOT MANAGERS ONLY")
+    @app_commands.describe(
+        seconds="How long to sample (1-300)",
+        interval_ms="Milliseconds between samples"
+    )
+    async def profile(
+        self,
+        interaction: discord.Interaction,
+        seconds: app_commands.Range[int, 1, MAX_PROFILE_SECONDS] = 30,
+        interval_ms: app_commands.Range[int, 1, 1000] = 10
+    ) -> None:
+        """Profile this process and upload the stacks as a flamegraph input file."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_manager(interaction):
+            return
+
+        profiler = SamplingProfiler(interval=interval_ms / 1000)
+        try:
+            profiler.start()
+        except ProfilerBusyError as e:
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+
+        logger.info(f"{interaction.user.name}/{interaction.user.id} started a {seconds}s CPU profile")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+
+        data = profiler.collapsed().encode()
+        filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+        if len(data) > MAX_ATTACHMENT_BYTES:
+            data = gzip.compress(data)
+            filename += ".gz"
+
+        top = "\n".join(
+            f"`{share:6.1%}` {label}" for label, share in profiler.top_functions(5)
+        )
+        await interaction.followup.send(
+            f"Profiled {profiler.elapsed:.1f}s: {profiler.samples} samples, "
+            f"event loop idle {profiler.idle_share():.0%}.\n"
+            f"Top functions (self time):\n{top or 'no samples'}\n"
+            f"Open the file with speedscope or flamegraph.pl.",
+            file=discord.File(io.BytesIO(data), filename=filename),
+            ephemeral=True
+        )
+
+    def _cache_stats(self) -> List[CacheStat]:
+        """Entry counts and size estimates of discord.py's and the bot's caches."""
+        bot = self.bot
+        guilds = list(bot.guilds)
+        members = [member for guild in guilds for member in guild.members]
+        roles = [role for guild in guilds for role in guild.roles]
+        channels = [channel for guild in guilds for channel in guild.channels]
+        users = list(bot.users)
+        auth = bot.get_cog("Auth")
+        identity_filter = bot.identity_filter
+        bloom = identity_filter.bloom if identity_filter is not None else None
+        return [
+            CacheStat("discord guilds", len(guilds), estimate_size(guilds)),
+            CacheStat("discord members", len(members), estimate_size(members)),
+            CacheStat("discord users", len(users), estimate_size(users)),
+            CacheStat("discord roles", len(roles), estimate_size(roles)),
+            CacheStat("discord channels", len(channels), estimate_size(channels)),
+            CacheStat("parse_nickname LRU", parse_nickname.cache_info().currsize, None),
+            CacheStat("metric series", REGISTRY.series_count(), None),
+            CacheStat("gateway event types", len(bot.gateway_stats.events), None),
+            CacheStat("identity latency stats", len(bot.auth_service.identity.latency), None),
+            CacheStat("join latency stats", len(auth.join_latency) if auth else 0, None),
+            CacheStat("running jobs", bot.jobs.running_count, None),
+            CacheStat("identity filter keys", bloom.count if bloom else 0, bloom.nbytes if bloom else None),
+            CacheStat("identity negative cache", identity_filter.negative_count if identity_filter else 0, None),
+        ]
+
+    @staticmethod
+    def _format_cache_stats(stats: List[CacheStat]) -> List[str]:
+        return [
+            f"{stat.name:<24} {stat.count:>9}  {'~' + format_bytes(stat.size) if stat.size is not None else '':>10}"
+            for stat in stats
+        ]
+
+    @app_commands.command(name="memory", description="Report memory growth and cache sizes - BOT MANAGERS ONLY")
+    @app_commands.describe(
+        reset_baseline="Make this snapshot the baseline for the next report",
+        limit="Number of allocation sites to list"
+    )
+    async def memory(
+        self,
+        interaction: discord.Interaction,
+        reset_baseline: bool = False,
+        limit: app_commands.Range[int, 1, 100] = 15
+    ) -> None:
+        """Start tracemalloc, or diff a new snapshot against the baseline."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_manager(interaction):
+            return
+
+        tracker = self.bot.memory
+        lines = [f"RSS {format_bytes(current_rss_bytes())}", "", "Caches:"]
+        lines += self._format_cache_stats(self._cache_stats())
+        bloom = self.bot.identity_filter.bloom if self.bot.identity_filter is not None else None
+        if bloom is not None:
+            lines.append(f"Identity filter expected false positives: {bloom.expected_fp_rate():.2%}")
+
+        if not tracker.tracing:
+            await asyncio.to_thread(tracker.start, self.bot.settings.memory.trace_frames)
+            logger.info(f"{interaction.user.name}/{interaction.user.id} started memory tracing")
+            header = (
+                "Started tracemalloc and took the baseline. Run this command again later to see "
+                "which allocation sites grew; /diagnostics memory_stop ends tracing."
+            )
+        else:
+            def diff():
+                snapshot = tracker.snapshot()
+                baseline_at = tracker.baseline_at
+                growth = tracker.growth(snapshot, limit)
+                if reset_baseline:
+                    tracker.reset_baseline(snapshot)
+                return baseline_at, growth
+
+            baseline_at, growth = await asyncio.to_thread(diff)
+            traced, peak = tracemalloc.get_traced_memory()
+            header = (
+                f"Traced {format_bytes(traced)} (peak {format_bytes(peak)}, tracemalloc overhead "
+                f"{format_bytes(tracemalloc.get_tracemalloc_memory())}). "
+                f"Top growth since {baseline_at:%Y-%m-%d %H:%M:%S}"
+                f"{' (baseline reset)' if reset_baseline else ''}:"
+            )
+            lines = format_growth(growth) + [""] + lines
+
+        report = "\n".join(lines)
+        summary = report if len(report) <= MAX_SUMMARY_CHARS else report[:MAX_SUMMARY_CHARS].rsplit("\n", 1)[0] + "\n..."
+        await interaction.followup.send(
+            f"{header}\n```\n{summary}\n```",
+            file=discord.File(io.BytesIO(report.encode()), filename=f"memory-{datetime.now():%Y%m%d-%H%M%S}.txt"),
+            ephemeral=True
+        )
+
+    @app_commands.command(name="memory_stop", description="Stop memory tracing - BOT MANAGERS ONLY")
+    async def memory_stop(self, interaction: discord.Interaction) -> None:
+        """Stop tracemalloc and free its memory."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_manager(interaction):
+            return
+
+        if not self.bot.memory.tracing:
+            await interaction.followup.send("Memory tracing is not running.", ephemeral=True)
+            return
+        self.bot.memory.stop()
+        logger.info(f"{interaction.user.name}/{interaction.user.id} stopped memory tracing")
+        note = " Periodic snapshot dumps are skipped until tracing is started again." if self.bot.settings.memory.snapshot_dir else ""
+        await interaction.followup.send(f"Memory tracing stopped.{note}", ephemeral=True)
+
+    @app_commands.command(name="sync_commands", description="Sync slash commands with Discord - BOT MANAGERS ONLY")
+    @app_commands.describe(force="Sync even if the command tree is unchanged since the last sync")
+    async def sync_commands(self, interaction: discord.Interaction, force: bool = True) -> None:
+        """Sync the command tree, normally skipped when its hash is unchanged."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_manager(interaction):
+            return
+
+        logger.info(f"{interaction.user.name}/{interaction.user.id} requested a command sync (force={force})")
+        try:
+            synced = await self.bot.sync_commands(force=force)
+        except discord.HTTPException as e:
+            await interaction.followup.send(f"❌ Sync failed: {e}", ephemeral=True)
+            return
+
+        if synced is None:
+            await interaction.followup.send("Command tree unchanged since the last sync; nothing to do.", ephemeral=True)
+        else:
+            await interaction.followup.send(f"✅ Synced {synced} command(s).", ephemeral=True)
+
+
+async def setup(bot: commands.Bot) -> None:
+    """Setup function for the cog."""
+    await bot.add_cog(Diagnostics(bot))
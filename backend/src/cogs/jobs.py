@@ -0,0 +1,112 @@
+"""Background job management commands."""
+
+import logging
+from typing import Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from ..services.jobs import Job, JobError
+from ..services.roles import is_division_staff
+
+logger = logging.getLogger("discord")
+
+
+class Jobs(commands.GroupCog, group_name="jobs", group_description="Background jobs - STAFF ONLY"):
+    """Status, cancel and resume for persisted background jobs."""
+
+    def __init__(self, bot: commands.Bot):
+        """
+        Initialize jobs cog.
+
+        Args:
+            bot: Bot instance
+        """
+        self.bot = bot
+        super().__init__()
+
+    async def _check_staff(self, interaction: discord.Interaction) -> bool:
+        """Check that the user is division staff, replying if not."""
+        if not interaction.guild:
+            await interaction.followup.send("This command can only be used in a server.", ephemeral=True)
+            return False
+
+        if not is_division_staff(interaction.user):
+            await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
+            return False
+        return True
+
+    def _describe(self, job: Job) -> str:
+        """Format a one-line job summary."""
+        cp = job.checkpoint
+        line = f"**#{job.id}** `{job.kind}` — {job.status}"
+        if self.bot.jobs.is_running(job.id):
+            line += " (running here)"
+        if "processed" in cp:
+            line += (
+                f" — {cp['processed']}/{cp.get('total', '?')} processed, "
+                f"✅ {cp.get('successful', 0)} ❌ {cp.get('failed', 0)}"
+            )
+        if job.updated_at:
+            line += f" — updated {discord.utils.format_dt(job.updated_at, 'R')}"
+        return line
+
+    @app_commands.command(name="status", description="Show background job status - STAFF ONLY")
+    async def status(self, interaction: discord.Interaction, job_id: Optional[int] = None) -> None:
+        """Show one job, or the most recent jobs of this server."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_staff(interaction):
+            return
+
+        if job_id is not None:
+            job = await self.bot.jobs.store.get(job_id)
+            jobs = [job] if job and job.guild_id == interaction.guild.id else []
+        else:
+            jobs = await self.bot.jobs.store.list_recent(interaction.guild.id)
+
+        if not jobs:
+            await interaction.followup.send("No jobs found.", ephemeral=True)
+            return
+
+        await interaction.followup.send("\n".join(self._describe(job) for job in jobs), ephemeral=True)
+
+    @app_commands.command(name="cancel", description="Cancel a background job - STAFF ONLY")
+    async def cancel(self, interaction: discord.Interaction, job_id: int) -> None:
+        """Cancel a job; its checkpoint is kept so it can be resumed."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_staff(interaction):
+            return
+
+        try:
+            job = await self.bot.jobs.cancel(job_id, interaction.guild.id)
+        except JobError as e:
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+
+        logger.info(f"{interaction.user.name}/{interaction.user.id} cancelled job #{job.id}")
+        await interaction.followup.send(f"Job #{job.id} cancelled.", ephemeral=True)
+
+    @app_commands.command(name="resume", description="Resume a background job - STAFF ONLY")
+    async def resume(self, interaction: discord.Interaction, job_id: int) -> None:
+        """Resume a cancelled or failed job from its last checkpoint."""
+        await interaction.response.defer(ephemeral=True)
+        if not await self._check_staff(interaction):
+            return
+
+        try:
+            job = await self.bot.jobs.resume(job_id, interaction.guild.id)
+        except JobError as e:
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+
+        logger.info(f"{interaction.user.name}/{interaction.user.id} resumed job #{job.id}")
+        await interaction.followup.send(
+            f"Job #{job.id} resumed from checkpoint ({job.checkpoint.get('processed', 0)} already processed).",
+            ephemeral=True
+        )
+
+
+async def setup(bot: commands.Bot) -> None:
+    """Setup function for the cog."""
+    await bot.add_cog(Jobs(bot))
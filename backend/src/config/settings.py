@@ -1,19 +1,30 @@
 """Application settings and configuration management."""
 
 import os
-from typing import List, Optional
-from dataclasses import dataclass, field
+import json
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field, fields, replace
 from dotenv import load_dotenv
 
 from .validators import (
     validate_required,
     validate_int,
+    validate_float,
     validate_bool,
     validate_list,
+    validate_choice,
     ConfigError
 )
 
 
+# Member cache policies supported by the bot client:
+# - full:  cache every member and chunk guilds at startup
+# - lazy:  cache members as they are seen, never chunk
+# - fetch: keep no member cache (commands and events carry their members)
+MEMBER_CACHE_POLICIES = ("full", "lazy", "fetch")
+
+
 # Load environment variables
 load_dotenv()
 
@@ -27,6 +38,9 @@ class DiscordConfig:
     log_channel_id: int = 0
     help_channel_id: int = 0
     bot_managers: List[int] = field(default_factory=list)
+    member_cache_policy: str = "full"
+    chunk_guilds_at_startup: bool = True
+    command_hash_file: str = "command_tree.hash"  # hash of the last synced command tree
     
     @classmethod
     def from_env(cls) -> "DiscordConfig":
@@ -44,13 +58,26 @@ class DiscordConfig:
             if manager_id.strip()
         ]
         
+        member_cache_policy = validate_choice(
+            "member_cache_policy", os.getenv("MEMBER_CACHE_POLICY"), "MEMBER_CACHE_POLICY",
+            MEMBER_CACHE_POLICIES, default="full"
+        )
+        # Chunking only makes sense when the whole member list is cached
+        chunk_guilds_at_startup = member_cache_policy == "full" and validate_bool(
+            "chunk_guilds_at_startup", os.getenv("CHUNK_GUILDS_AT_STARTUP", "true"), "CHUNK_GUILDS_AT_STARTUP", default=True
+        )
+        command_hash_file = os.getenv("COMMAND_HASH_FILE", "command_tree.hash")
+        
         return cls(
             token=token,
             debug_token=debug_token,
             bot_id=bot_id,
             log_channel_id=log_channel_id,
             help_channel_id=help_channel_id,
-            bot_managers=bot_managers
+            bot_managers=bot_managers,
+            member_cache_policy=member_cache_policy,
+            chunk_guilds_at_startup=chunk_guilds_at_startup,
+            command_hash_file=command_hash_file
         )
 
 
@@ -60,6 +87,8 @@ class OAuthConfig:
     client_id: str
     client_secret: str
     state: str
+    api_url: str = "https://api.ivao.aero"
+    batch_concurrency: int = 8
     
     @classmethod
     def from_env(cls) -> "OAuthConfig":
@@ -67,11 +96,16 @@ class OAuthConfig:
         client_id = validate_required("client_id", os.getenv("OAUTH_CLIENT_ID"), "OAUTH_CLIENT_ID")
         client_secret = validate_required("client_secret", os.getenv("OAUTH_CLIENT_SECRET"), "OAUTH_CLIENT_SECRET")
         state = validate_required("state", os.getenv("OAUTH_STATE"), "OAUTH_STATE")
+        # Point at a mock server for load tests
+        api_url = os.getenv("IVAO_API_URL", "https://api.ivao.aero").rstrip("/")
+        batch_concurrency = validate_int("batch_concurrency", os.getenv("IVAO_BATCH_CONCURRENCY", "8"), "IVAO_BATCH_CONCURRENCY", min_value=1)
         
         return cls(
             client_id=client_id,
             client_secret=client_secret,
-            state=state
+            state=state,
+            api_url=api_url,
+            batch_concurrency=batch_concurrency
         )
 
 
@@ -122,6 +156,7 @@ class DivisionConfig:
     enable_status_report: bool = False
     status_report_url: Optional[str] = None
     status_report_interval: int = 120
+    log_channel_id: int = 0  # staff log channel (bulk job error details)
     
     # Role IDs
     div_staff: int = 0
@@ -149,6 +184,7 @@ class DivisionConfig:
         enable_status_report = validate_bool("enable_status_report", os.getenv("ENABLE_STATUS_REPORT", "false"), "ENABLE_STATUS_REPORT", default=False)
         status_report_url = os.getenv("STATUS_REPORT_URL", "http://localhost:8080/status_report")
         status_report_interval = validate_int("status_report_interval", os.getenv("STATUS_REPORT_INTERVAL", "120"), "STATUS_REPORT_INTERVAL", min_value=10)
+        log_channel_id = validate_int("log_channel_id", os.getenv("LOGCHANNEL_ID"), "LOGCHANNEL_ID")
         
         # Role IDs
         div_staff = validate_int("div_staff", os.getenv("DIV_STAFF"), "DIV_STAFF")
@@ -173,6 +209,7 @@ class DivisionConfig:
             enable_status_report=enable_status_report,
             status_report_url=status_report_url,
             status_report_interval=status_report_interval,
+            log_channel_id=log_channel_id,
             div_staff=div_staff,
             div_hq=div_hq,
             specops=specops,
@@ -189,6 +226,285 @@ class DivisionConfig:
         )
 
 
+# DivisionConfig fields holding Discord role IDs
+ROLE_FIELDS = (
+    "div_staff", "div_hq", "specops", "flightops", "atcops", "training", "web",
+    "membership", "event", "pr", "vid_verified", "div_member", "non_div_ivao_member",
+)
+
+
+def load_tenants(path: Optional[str], default: DivisionConfig) -> Dict[int, DivisionConfig]:
+    """
+    Load per-guild division configuration from a JSON file.
+    
+    The file maps guild IDs to DivisionConfig fields; fields that are left
+    out are taken from the environment configuration, e.g.
+    {"123456789012345678": {"division": "XM", "country": "Middle East", "div_staff": 111}}
+    
+    Args:
+        path: Path to the JSON file (None or empty for single-division mode)
+        default: Division configuration from environment variables
+        
+    Returns:
+        Mapping of guild ID to division configuration
+    """
+    if not path:
+        return {}
+    
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Could not read DIVISIONS_FILE '{path}': {e}")
+    
+    if not isinstance(data, dict):
+        raise ConfigError("DIVISIONS_FILE must contain an object mapping guild IDs to division settings")
+    
+    known = {f.name for f in fields(DivisionConfig)}
+    tenants = {}
+    for guild_key, overrides in data.items():
+        guild_id = validate_int("guild_id", guild_key, f"DIVISIONS_FILE[{guild_key}]")
+        if not isinstance(overrides, dict):
+            raise ConfigError(f"DIVISIONS_FILE[{guild_key}] must be an object")
+        unknown = set(overrides) - known
+        if unknown:
+            raise ConfigError(f"DIVISIONS_FILE[{guild_key}] has unknown keys: {', '.join(sorted(unknown))}")
+        values: Dict[str, Any] = dict(overrides)
+        for id_field in ROLE_FIELDS + ("log_channel_id",):
+            if id_field in values:
+                values[id_field] = validate_int(id_field, values[id_field], f"DIVISIONS_FILE[{guild_key}].{id_field}")
+        tenants[guild_id] = replace(default, **values)
+    return tenants
+
+
+@dataclass
+class ClusterConfig:
+    """Multi-process cluster configuration (python -m src.bot.cluster)."""
+    workers: int = 1
+    shard_count: int = 0  # 0 = use Discord's recommended shard count
+    report_interval: int = 30
+    claim_lease: int = 120  # seconds a replica may hold a work batch without renewing
+    claim_max_attempts: int = 3  # claims of a work batch before it is marked failed
+    
+    @classmethod
+    def from_env(cls) -> "ClusterConfig":
+        """Load cluster configuration from environment variables."""
+        workers = validate_int("workers", os.getenv("CLUSTER_WORKERS", "1"), "CLUSTER_WORKERS", min_value=1)
+        shard_count = validate_int("shard_count", os.getenv("SHARD_COUNT", "0"), "SHARD_COUNT", min_value=0)
+        report_interval = validate_int("report_interval", os.getenv("CLUSTER_REPORT_INTERVAL", "30"), "CLUSTER_REPORT_INTERVAL", min_value=5)
+        claim_lease = validate_int("claim_lease", os.getenv("CLAIM_LEASE_SECONDS", "120"), "CLAIM_LEASE_SECONDS", min_value=30)
+        claim_max_attempts = validate_int("claim_max_attempts", os.getenv("CLAIM_MAX_ATTEMPTS", "3"), "CLAIM_MAX_ATTEMPTS", min_value=1)
+        
+        return cls(
+            workers=workers,
+            shard_count=shard_count,
+            report_interval=report_interval,
+            claim_lease=claim_lease,
+            claim_max_attempts=claim_max_attempts
+        )
+
+
+@dataclass
+class MetricsConfig:
+    """Embedded Prometheus metrics endpoint configuration."""
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9108  # cluster worker N listens on port + N
+    
+    @classmethod
+    def from_env(cls) -> "MetricsConfig":
+        """Load metrics configuration from environment variables."""
+        enabled = validate_bool("enabled", os.getenv("METRICS_ENABLED", "false"), "METRICS_ENABLED")
+        host = os.getenv("METRICS_HOST", "127.0.0.1")
+        port = validate_int("port", os.getenv("METRICS_PORT", "9108"), "METRICS_PORT", min_value=1, max_value=65535)
+        
+        return cls(
+            enabled=enabled,
+            host=host,
+            port=port
+        )
+
+
+@dataclass
+class TracingConfig:
+    """Stage-level tracing configuration."""
+    enabled: bool = False
+    export_file: Optional[str] = "traces.jsonl"  # OTLP/JSON lines, None = no export
+    sample_rate: float = 0.01
+    slow_threshold_ms: int = 3000  # 0 = no slow-trace log
+    
+    @classmethod
+    def from_env(cls) -> "TracingConfig":
+        """Load tracing configuration from environment variables."""
+        enabled = validate_bool("enabled", os.getenv("TRACING_ENABLED", "false"), "TRACING_ENABLED")
+        export_file = os.getenv("TRACE_EXPORT_FILE", "traces.jsonl") or None
+        sample_rate = validate_float("sample_rate", os.getenv("TRACE_SAMPLE_RATE", "0.01"), "TRACE_SAMPLE_RATE", min_value=0, max_value=1)
+        slow_threshold_ms = validate_int("slow_threshold_ms", os.getenv("TRACE_SLOW_MS", "3000"), "TRACE_SLOW_MS", min_value=0)
+        
+        return cls(
+            enabled=enabled,
+            export_file=export_file,
+            sample_rate=sample_rate,
+            slow_threshold_ms=slow_threshold_ms
+        )
+
+
+# Time-based log rotation intervals (logging.handlers.TimedRotatingFileHandler)
+LOG_ROTATION_INTERVALS = ("midnight", "h", "d", "w0", "w1", "w2", "w3", "w4", "w5", "w6", "none")
+
+
+@dataclass
+class LoggingConfig:
+    """Log file format, rotation and deduplication configuration."""
+    json_format: bool = False
+    max_bytes: int = 10 * 1024 * 1024  # rotate when larger, 0 = no size limit
+    rotate_when: Optional[str] = "midnight"  # None = size-based rotation only
+    backup_count: int = 14  # rotated files kept, 0 = keep all
+    compress: bool = True  # gzip rotated files
+    dedup_window: int = 60  # seconds, 0 = no deduplication
+    dedup_burst: int = 5  # repeated warnings let through per call site and window
+    
+    @classmethod
+    def from_env(cls) -> "LoggingConfig":
+        """Load logging configuration from environment variables."""
+        log_format = validate_choice("log_format", os.getenv("LOG_FORMAT"), "LOG_FORMAT", ("text", "json"), default="text")
+        max_bytes = validate_int("max_bytes", os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)), "LOG_MAX_BYTES", min_value=0)
+        rotate_when = validate_choice(
+            "rotate_when", os.getenv("LOG_ROTATE_WHEN"), "LOG_ROTATE_WHEN", LOG_ROTATION_INTERVALS, default="midnight"
+        )
+        backup_count = validate_int("backup_count", os.getenv("LOG_BACKUP_COUNT", "14"), "LOG_BACKUP_COUNT", min_value=0)
+        compress = validate_bool("compress", os.getenv("LOG_COMPRESS", "true"), "LOG_COMPRESS", default=True)
+        dedup_window = validate_int("dedup_window", os.getenv("LOG_DEDUP_WINDOW", "60"), "LOG_DEDUP_WINDOW", min_value=0)
+        dedup_burst = validate_int("dedup_burst", os.getenv("LOG_DEDUP_BURST", "5"), "LOG_DEDUP_BURST", min_value=1)
+        
+        return cls(
+            json_format=log_format == "json",
+            max_bytes=max_bytes,
+            rotate_when=None if rotate_when == "none" else rotate_when,
+            backup_count=backup_count,
+            compress=compress,
+            dedup_window=dedup_window,
+            dedup_burst=dedup_burst
+        )
+
+
+@dataclass
+class MemoryConfig:
+    """Memory diagnostics configuration."""
+    snapshot_dir: Optional[str] = None  # periodic tracemalloc dumps, None = disabled
+    snapshot_interval: int = 60  # minutes
+    snapshot_keep: int = 24  # newest dumps kept per process (main or cluster worker N)
+    trace_frames: int = 5  # traceback depth recorded per allocation
+    
+    @classmethod
+    def from_env(cls) -> "MemoryConfig":
+        """Load memory diagnostics configuration from environment variables."""
+        snapshot_dir = os.getenv("MEMORY_SNAPSHOT_DIR") or None
+        snapshot_interval = validate_int("snapshot_interval", os.getenv("MEMORY_SNAPSHOT_INTERVAL", "60"), "MEMORY_SNAPSHOT_INTERVAL", min_value=1)
+        snapshot_keep = validate_int("snapshot_keep", os.getenv("MEMORY_SNAPSHOT_KEEP", "24"), "MEMORY_SNAPSHOT_KEEP", min_value=1)
+        trace_frames = validate_int("trace_frames", os.getenv("MEMORY_TRACE_FRAMES", "5"), "MEMORY_TRACE_FRAMES", min_value=1, max_value=100)
+        
+        return cls(
+            snapshot_dir=snapshot_dir,
+            snapshot_interval=snapshot_interval,
+            snapshot_keep=snapshot_keep,
+            trace_frames=trace_frames
+        )
+
+
+@dataclass
+class IdentityFilterConfig:
+    """Join prefilter for Discord users that never linked IVAO."""
+    enabled: bool = True
+    fp_rate: float = 0.01  # target Bloom filter false-positive rate
+    max_bytes: int = 8 * 1024 * 1024  # Bloom filter size limit (0 = no limit)
+    sync_interval: float = 1.0  # minimum seconds between incremental syncs
+    rebuild_interval: int = 60  # minutes between full rebuilds
+    negative_ttl: int = 60  # seconds an unknown member stays cached, 0 = no negative cache
+    negative_size: int = 10000
+    
+    @classmethod
+    def from_env(cls) -> "IdentityFilterConfig":
+        """Load identity filter configuration from environment variables."""
+        enabled = validate_bool("enabled", os.getenv("IDENTITY_FILTER_ENABLED", "true"), "IDENTITY_FILTER_ENABLED", default=True)
+        fp_rate = validate_float("fp_rate", os.getenv("IDENTITY_FILTER_FP_RATE", "0.01"), "IDENTITY_FILTER_FP_RATE", min_value=0.000001, max_value=0.5)
+        max_bytes = validate_int("max_bytes", os.getenv("IDENTITY_FILTER_MAX_BYTES", str(8 * 1024 * 1024)), "IDENTITY_FILTER_MAX_BYTES", min_value=0)
+        sync_interval = validate_float("sync_interval", os.getenv("IDENTITY_FILTER_SYNC_INTERVAL", "1.0"), "IDENTITY_FILTER_SYNC_INTERVAL", min_value=0)
+        rebuild_interval = validate_int("rebuild_interval", os.getenv("IDENTITY_FILTER_REBUILD_INTERVAL", "60"), "IDENTITY_FILTER_REBUILD_INTERVAL", min_value=1)
+        negative_ttl = validate_int("negative_ttl", os.getenv("NEGATIVE_CACHE_TTL", "60"), "NEGATIVE_CACHE_TTL", min_value=0)
+        negative_size = validate_int("negative_size", os.getenv("NEGATIVE_CACHE_SIZE", "10000"), "NEGATIVE_CACHE_SIZE", min_value=1)
+        
+        return cls(
+            enabled=enabled,
+            fp_rate=fp_rate,
+            max_bytes=max_bytes,
+            sync_interval=sync_interval,
+            rebuild_interval=rebuild_interval,
+            negative_ttl=negative_ttl,
+            negative_size=negative_size
+        )
+
+
+@dataclass
+class ShutdownConfig:
+    """Graceful shutdown configuration."""
+    timeout: int = 20  # seconds to drain in-flight work; the cluster launcher waits 30s per worker
+    
+    @classmethod
+    def from_env(cls) -> "ShutdownConfig":
+        """Load shutdown configuration from environment variables."""
+        timeout = validate_int("timeout", os.getenv("SHUTDOWN_TIMEOUT", "20"), "SHUTDOWN_TIMEOUT", min_value=0)
+        
+        return cls(timeout=timeout)
+
+
+@dataclass
+class LoopMonitorConfig:
+    """Event loop lag monitor configuration."""
+    enabled: bool = True
+    interval: float = 0.1  # seconds between heartbeats
+    threshold: float = 0.25  # seconds of blocking before the loop's stack is sampled
+    log_file: Optional[str] = "loop_lag.log"  # stall reports with stacks, None = main log only
+    
+    @classmethod
+    def from_env(cls) -> "LoopMonitorConfig":
+        """Load loop lag monitor configuration from environment variables."""
+        enabled = validate_bool("enabled", os.getenv("LOOP_MONITOR_ENABLED", "true"), "LOOP_MONITOR_ENABLED", default=True)
+        interval_ms = validate_int("interval_ms", os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"), "LOOP_MONITOR_INTERVAL_MS", min_value=10)
+        threshold_ms = validate_int("threshold_ms", os.getenv("LOOP_LAG_THRESHOLD_MS", "250"), "LOOP_LAG_THRESHOLD_MS", min_value=20)
+        log_file = os.getenv("LOOP_LAG_LOG", "loop_lag.log") or None
+        
+        return cls(
+            enabled=enabled,
+            interval=interval_ms / 1000,
+            threshold=threshold_ms / 1000,
+            log_file=log_file
+        )
+
+
+@dataclass
+class SnapshotConfig:
+    """Cache snapshot configuration (warm restarts)."""
+    path: Optional[str] = "cache.snapshot"  # None = no snapshots
+    interval: int = 10  # minutes between periodic snapshots
+    key: Optional[str] = None  # encrypts secret sections; they are left out without it
+    
+    @classmethod
+    def from_env(cls) -> "SnapshotConfig":
+        """Load cache snapshot configuration from environment variables."""
+        path = os.getenv("SNAPSHOT_FILE", "cache.snapshot") or None
+        interval = validate_int("interval", os.getenv("SNAPSHOT_INTERVAL", "10"), "SNAPSHOT_INTERVAL", min_value=1)
+        key = os.getenv("SNAPSHOT_KEY") or None
+        if key and find_spec("cryptography") is None:
+            raise ConfigError("SNAPSHOT_KEY needs the cryptography package (pip install cryptography)")
+        
+        return cls(
+            path=path,
+            interval=interval,
+            key=key
+        )
+
+
 @dataclass
 class Settings:
     """Application settings container."""
@@ -196,6 +512,16 @@ class Settings:
     oauth: OAuthConfig
     database: DatabaseConfig
     division: DivisionConfig
+    cluster: ClusterConfig = field(default_factory=ClusterConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
+    memory: MemoryConfig = field(default_factory=MemoryConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    shutdown: ShutdownConfig = field(default_factory=ShutdownConfig)
+    identity_filter: IdentityFilterConfig = field(default_factory=IdentityFilterConfig)
+    snapshot: SnapshotConfig = field(default_factory=SnapshotConfig)
+    loop_monitor: LoopMonitorConfig = field(default_factory=LoopMonitorConfig)
+    tenants: Dict[int, DivisionConfig] = field(default_factory=dict)
     debug: bool = False
     log_level: str = "INFO"
     
@@ -203,11 +529,22 @@ class Settings:
     def load(cls, debug: bool = False) -> "Settings":
         """Load all settings from environment variables."""
         try:
+            division = DivisionConfig.from_env()
             return cls(
                 discord=DiscordConfig.from_env(),
                 oauth=OAuthConfig.from_env(),
                 database=DatabaseConfig.from_env(),
-                division=DivisionConfig.from_env(),
+                division=division,
+                cluster=ClusterConfig.from_env(),
+                metrics=MetricsConfig.from_env(),
+                tracing=TracingConfig.from_env(),
+                memory=MemoryConfig.from_env(),
+                logging=LoggingConfig.from_env(),
+                shutdown=ShutdownConfig.from_env(),
+                identity_filter=IdentityFilterConfig.from_env(),
+                snapshot=SnapshotConfig.from_env(),
+                loop_monitor=LoopMonitorConfig.from_env(),
+                tenants=load_tenants(os.getenv("DIVISIONS_FILE"), division),
                 debug=debug,
                 log_level=os.getenv("LOG_LEVEL", "INFO").upper()
             )
@@ -217,6 +554,21 @@ class Settings:
     def is_bot_manager(self, user_id: int) -> bool:
         """Check if a user is a bot manager."""
         return user_id in self.discord.bot_managers
+    
+    def division_for(self, guild_id: Optional[int]) -> DivisionConfig:
+        """
+        Get the division configuration of a guild.
+        
+        Args:
+            guild_id: Discord guild ID
+            
+        Returns:
+            The guild's configuration from DIVISIONS_FILE, or the
+            environment configuration for guilds not listed there
+        """
+        if guild_id is None:
+            return self.division
+        return self.tenants.get(guild_id, self.division)
 
 
 # Global settings instance
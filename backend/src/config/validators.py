@@ -31,6 +31,21 @@ def validate_int(key: str, value: Any, env_key: str, min_value: int = None, max_
         raise ConfigError(f"'{env_key}' must be a valid integer")
 
 
+def validate_float(key: str, value: Any, env_key: str, min_value: float = None, max_value: float = None) -> float:
+    """Validate and convert a float configuration value."""
+    if value is None:
+        raise ConfigError(f"Required environment variable '{env_key}' is not set")
+    try:
+        float_value = float(value)
+    except ValueError:
+        raise ConfigError(f"'{env_key}' must be a valid number")
+    if min_value is not None and float_value < min_value:
+        raise ConfigError(f"'{env_key}' must be >= {min_value}")
+    if max_value is not None and float_value > max_value:
+        raise ConfigError(f"'{env_key}' must be <= {max_value}")
+    return float_value
+
+
 def validate_bool(key: str, value: Any, env_key: str, default: bool = False) -> bool:
     """Validate and convert a boolean configuration value."""
     if value is None:
@@ -42,6 +57,16 @@ def validate_bool(key: str, value: Any, env_key: str, default: bool = False) ->
     return bool(value)
 
 
+def validate_choice(key: str, value: Any, env_key: str, choices: tuple, default: str) -> str:
+    """Validate that a configuration value is one of a fixed set of choices."""
+    if value is None or value == "":
+        return default
+    normalized = str(value).strip().lower()
+    if normalized not in choices:
+        raise ConfigError(f"'{env_key}' must be one of: {', '.join(choices)}")
+    return normalized
+
+
 def validate_list(key: str, value: Any, env_key: str, separator: str = ",") -> list:
     """Validate and convert a comma-separated list."""
     if value is None:
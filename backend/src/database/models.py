@@ -1,10 +1,17 @@
 """Database models and data structures."""
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Sequence, Any
 from datetime import datetime
 
 
+# Column list matching UserData.from_row
+USER_DATA_COLUMNS = (
+    "id, vid, discord_user_id, discord_username, firstname, lastname, "
+    "refresh_token, refresh_token_date, verified, is_banned, profile_fingerprint, applied_roles"
+)
+
+
 @dataclass
 class UserData:
     """User data from database."""
@@ -18,6 +25,26 @@ class UserData:
     refresh_token_date: Optional[datetime]
     verified: bool
     is_banned: bool
+    profile_fingerprint: Optional[str] = None
+    applied_roles: Optional[str] = None
+    
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "UserData":
+        """Build UserData from a row selected with USER_DATA_COLUMNS."""
+        return cls(
+            id=row[0],
+            vid=row[1],
+            discord_user_id=row[2],
+            discord_username=row[3],
+            firstname=row[4],
+            lastname=row[5],
+            refresh_token=row[6],
+            refresh_token_date=row[7],
+            verified=bool(row[8]),
+            is_banned=bool(row[9]),
+            profile_fingerprint=row[10],
+            applied_roles=row[11]
+        )
     
     @property
     def full_name(self) -> str:
@@ -1,16 +1,62 @@
 """Database connection pool management."""
 
 import logging
+import time
 from typing import Optional
 import aiomysql
 from aiomysql import Pool
 
 from ..config.settings import DatabaseConfig
 from ..utils.exceptions import DatabaseError
+from ..utils.metrics import DB_POOL_WAIT_SECONDS, DB_QUERY_SECONDS
 
 logger = logging.getLogger("discord")
 
 
+class InstrumentedCursor(aiomysql.Cursor):
+    """Cursor that records query latency by statement type."""
+    
+    async def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            words = query.lstrip(" \t\r\n(").split(None, 1)
+            operation = words[0].lower() if words else "other"
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+
+class _TimedAcquire:
+    """async with pool.acquire(), recording the wait for a free connection."""
+    
+    __slots__ = ("_context",)
+    
+    def __init__(self, context):
+        self._context = context
+    
+    async def __aenter__(self) -> aiomysql.Connection:
+        started = time.perf_counter()
+        conn = await self._context.__aenter__()
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        return conn
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._context.__aexit__(exc_type, exc, tb)
+
+
+class TimedPool:
+    """The aiomysql pool, recording how long acquire() waits for a free connection."""
+    
+    def __init__(self, pool: Pool):
+        self.raw = pool
+    
+    def __getattr__(self, name: str):
+        return getattr(self.raw, name)
+    
+    def acquire(self) -> _TimedAcquire:
+        return _TimedAcquire(self.raw.acquire())
+
+
 class DatabasePool:
     """Manages database connection pool."""
     
@@ -23,10 +69,11 @@ class DatabasePool:
         """
         self.config = config
         self._pool: Optional[Pool] = None
+        self._timed: Optional[TimedPool] = None
     
     async def create_pool(self) -> Pool:
         """
-        Create and return a connection pool.
+        Create and return a connection pool with min_size open connections.
         
         Returns:
             Database connection pool
@@ -45,11 +92,15 @@ class DatabasePool:
                 maxsize=self.config.max_size,
                 echo=False,
                 pool_recycle=self.config.pool_recycle,
-                autocommit=False
+                autocommit=True,  # multi-statement transactions call conn.begin() explicitly
+                cursorclass=InstrumentedCursor
             )
-            logger.info("Database connection pool created successfully")
+            logger.info(f"Database connection pool created successfully ({self.config.min_size} connection(s) open)")
             return self._pool
         except Exception as e:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
             logger.error(f"Failed to create database pool: {e}")
             raise DatabaseError(f"Failed to create database pool: {e}") from e
     
@@ -100,9 +151,13 @@ class DatabasePool:
         return True
     
     @property
-    def pool(self) -> Optional[Pool]:
-        """Get the connection pool."""
-        return self._pool
+    def pool(self) -> Optional[TimedPool]:
+        """Get the connection pool (acquire() waits are recorded)."""
+        if self._pool is None:
+            return None
+        if self._timed is None or self._timed.raw is not self._pool:
+            self._timed = TimedPool(self._pool)
+        return self._timed
 
 
 # Global pool instance
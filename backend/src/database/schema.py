@@ -0,0 +1,218 @@
+"""Schema migrations applied at startup.
+
+Each migration checks information_schema before it changes anything, so
+it is safe to run repeatedly on both MariaDB and MySQL (which lacks the
+IF NOT EXISTS forms of ALTER TABLE and CREATE INDEX). New installations
+get the same structure from schema.sql at the repository root.
+
+Tables and columns the bot's queries rely on are required: if one is
+still missing after the migrations ran (e.g. the database user has no DDL
+rights), startup fails instead of every query failing later. Indexes only
+affect speed, so a missing index is logged.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import List, Set, Tuple, Union
+
+from ..utils.exceptions import DatabaseError
+from .pool import DatabasePool
+
+logger = logging.getLogger("discord")
+
+
+@dataclass(frozen=True)
+class Table:
+    """A table created with `statement` (a CREATE TABLE) if it is missing."""
+    name: str
+    statement: str
+
+    @property
+    def description(self) -> str:
+        return f"{self.name} table"
+
+
+@dataclass(frozen=True)
+class Column:
+    """A column added with `definition` if it is missing."""
+    table: str
+    name: str
+    definition: str
+
+    @property
+    def description(self) -> str:
+        return f"{self.table}.{self.name} column"
+
+
+@dataclass(frozen=True)
+class Index:
+    """An index added if no index of that name exists on the table."""
+    table: str
+    name: str
+    columns: Tuple[str, ...]
+
+    @property
+    def description(self) -> str:
+        return f"{self.table}.{self.name} index"
+
+
+Migration = Union[Table, Column, Index]
+
+MIGRATIONS: List[Migration] = [
+    Index("user_data", "discord_user_id", ("discord_user_id",)),
+    Index("user_data", "discord_username", ("discord_username",)),
+    Index("user_data", "name", ("firstname", "lastname")),
+    Table(
+        "bot_jobs",
+        """CREATE TABLE IF NOT EXISTS bot_jobs (
+            id int(11) NOT NULL AUTO_INCREMENT,
+            kind varchar(50) NOT NULL,
+            status varchar(20) NOT NULL,
+            params text NOT NULL,
+            checkpoint mediumtext DEFAULT NULL,
+            guild_id varchar(100) DEFAULT NULL,
+            channel_id varchar(100) DEFAULT NULL,
+            message_id varchar(100) DEFAULT NULL,
+            created_by varchar(100) DEFAULT NULL,
+            created_at datetime NOT NULL,
+            updated_at datetime NOT NULL,
+            owner varchar(100) DEFAULT NULL,
+            lease_expires_at datetime DEFAULT NULL,
+            PRIMARY KEY (id),
+            KEY status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci"""
+    ),
+    Table(
+        "work_claims",
+        """CREATE TABLE IF NOT EXISTS work_claims (
+            id int(11) NOT NULL AUTO_INCREMENT,
+            job_id int(11) NOT NULL,
+            kind varchar(50) NOT NULL,
+            params text NOT NULL,
+            range_start int(11) NOT NULL,
+            range_end int(11) NOT NULL,
+            status varchar(20) NOT NULL,
+            owner varchar(100) DEFAULT NULL,
+            lease_expires_at datetime DEFAULT NULL,
+            attempts int(11) NOT NULL DEFAULT 0,
+            result text DEFAULT NULL,
+            created_at datetime NOT NULL,
+            updated_at datetime NOT NULL,
+            PRIMARY KEY (id),
+            KEY job_id (job_id),
+            KEY claimable (kind, status, lease_expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci"""
+    ),
+    Table(
+        "member_handoffs",
+        """CREATE TABLE IF NOT EXISTS member_handoffs (
+            id int(11) NOT NULL AUTO_INCREMENT,
+            discord_user_id varchar(100) NOT NULL,
+            vid varchar(100) NOT NULL,
+            profile mediumtext NOT NULL,
+            created_at datetime NOT NULL,
+            PRIMARY KEY (id),
+            KEY discord_user_id (discord_user_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci"""
+    ),
+    # Lease on a job while a replica runs it
+    Column("bot_jobs", "owner", "varchar(100) DEFAULT NULL"),
+    Column("bot_jobs", "lease_expires_at", "datetime DEFAULT NULL"),
+    # Refresh token quarantine
+    Column("user_data", "token_failure_reason", "varchar(255) DEFAULT NULL"),
+    Column("user_data", "token_failed_at", "datetime DEFAULT NULL"),
+    Column("user_data", "token_failure_count", "int(11) NOT NULL DEFAULT 0"),
+    # Lease on the refresh token while a worker exchanges it
+    Column("user_data", "token_claim_owner", "varchar(100) DEFAULT NULL"),
+    Column("user_data", "token_claim_expires_at", "datetime DEFAULT NULL"),
+    # Profile and roles last applied by the bot
+    Column("user_data", "profile_fingerprint", "varchar(64) DEFAULT NULL"),
+    Column("user_data", "applied_roles", "varchar(1000) DEFAULT NULL"),
+]
+
+
+class _Catalog:
+    """Tables, columns and indexes of the current database."""
+
+    def __init__(self):
+        self.tables: Set[str] = set()
+        self.columns: Set[Tuple[str, str]] = set()
+        self.indexes: Set[Tuple[str, str]] = set()
+
+    async def load(self, cursor) -> None:
+        await cursor.execute(
+            "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        self.tables = {row[0].lower() for row in await cursor.fetchall()}
+        await cursor.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        self.columns = {(row[0].lower(), row[1].lower()) for row in await cursor.fetchall()}
+        await cursor.execute(
+            "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        self.indexes = {(row[0].lower(), row[1].lower()) for row in await cursor.fetchall()}
+
+    def has(self, migration: Migration) -> bool:
+        """Whether the migration's object exists."""
+        if isinstance(migration, Table):
+            return migration.name.lower() in self.tables
+        if isinstance(migration, Column):
+            return (migration.table.lower(), migration.name.lower()) in self.columns
+        return (migration.table.lower(), migration.name.lower()) in self.indexes
+
+
+def _statement(migration: Migration) -> str:
+    if isinstance(migration, Column):
+        return f"ALTER TABLE {migration.table} ADD COLUMN {migration.name} {migration.definition}"
+    if isinstance(migration, Index):
+        return f"ALTER TABLE {migration.table} ADD INDEX {migration.name} ({', '.join(migration.columns)})"
+    return migration.statement
+
+
+async def ensure_schema(db_pool: DatabasePool) -> None:
+    """
+    Apply all missing migrations.
+
+    A failed migration is logged and the others still run, so a database
+    user without DDL rights can run the bot against a schema created from
+    schema.sql.
+
+    Args:
+        db_pool: Database pool
+
+    Raises:
+        DatabaseError: If a required table or column is still missing
+    """
+    pool = db_pool.pool
+    if not pool:
+        return
+
+    catalog = _Catalog()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await catalog.load(cursor)
+            pending = [migration for migration in MIGRATIONS if not catalog.has(migration)]
+            for migration in pending:
+                try:
+                    await cursor.execute(_statement(migration))
+                    await conn.commit()
+                    logger.info(f"Schema migration '{migration.description}' applied")
+                except Exception as e:
+                    await conn.rollback()
+                    logger.error(f"Schema migration '{migration.description}' failed: {e}")
+            if pending:
+                await catalog.load(cursor)
+
+    missing = [migration for migration in MIGRATIONS if isinstance(migration, (Table, Column)) and not catalog.has(migration)]
+    if missing:
+        raise DatabaseError(
+            f"Database schema is missing {', '.join(migration.description for migration in missing)}; "
+            f"apply schema.sql or grant the bot's database user ALTER and CREATE rights"
+        )
+    if ("user_data", "unique_vid") not in catalog.indexes:
+        # Merging duplicate rows needs review, so the bot never does it itself
+        logger.warning(
+            "user_data has no unique key on vid, the web app falls back to a lookup per sign-in; "
+            "apply migrations/001_user_data_unique_vid.sql"
+        )
@@ -1,28 +1,50 @@
 """Authentication service."""
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any
+import time
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Sequence, Tuple
 import discord
 
 from ..database.pool import get_pool
-from ..database.models import UserData
+from ..database.models import UserData, USER_DATA_COLUMNS
 from ..services.oauth import OAuthService
+from ..services.handoff import HandoffStore
+from ..services.identity import IdentityMatch, IdentityResolver, MATCH_DISCORD_ID, parse_nickname
+from ..services.roles import profile_fingerprint
 from ..utils.exceptions import UserNotFoundError, OAuthError
+from ..utils.metrics import VERIFY_RESULTS, VERIFY_SECONDS
+from ..utils.shutdown import SHUTDOWN
+from ..utils.tracing import span, traced
+
+if TYPE_CHECKING:
+    from .identity_filter import IdentityFilter
 
 logger = logging.getLogger("discord")
 
+# Where the IVAO profile of a successful verification came from
+SOURCE_HANDOFF = "handoff"
+SOURCE_IVAO = "ivao"
+
+# Rows per statement when storing the results of verify_members
+STORE_BATCH_SIZE = 500
+
 
 class AuthService:
     """Handles user authentication and verification."""
     
-    def __init__(self, oauth_service: OAuthService):
+    def __init__(self, oauth_service: OAuthService, identity_filter: Optional["IdentityFilter"] = None):
         """
         Initialize auth service.
         
         Args:
             oauth_service: OAuth service instance
+            identity_filter: Prefilter that turns away joins of unknown users
         """
         self.oauth = oauth_service
+        self.identity_filter = identity_filter
+        self.identity = IdentityResolver(identity_filter)
+        self.handoffs = HandoffStore()
     
     async def get_user_data(self, discord_user_id: int) -> Optional[UserData]:
         """
@@ -41,9 +63,7 @@ class AuthService:
         async with pool.acquire() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    """SELECT id, vid, discord_user_id, discord_username, firstname, lastname,
-                       refresh_token, refresh_token_date, verified, is_banned
-                       FROM user_data WHERE discord_user_id = %s""",
+                    f"SELECT {USER_DATA_COLUMNS} FROM user_data WHERE discord_user_id = %s",
                     (discord_user_id,)
                 )
                 result = await cursor.fetchone()
@@ -51,18 +71,7 @@ class AuthService:
                 if not result:
                     return None
                 
-                return UserData(
-                    id=result[0],
-                    vid=result[1],
-                    discord_user_id=result[2],
-                    discord_username=result[3],
-                    firstname=result[4],
-                    lastname=result[5],
-                    refresh_token=result[6],
-                    refresh_token_date=result[7],
-                    verified=bool(result[8]),
-                    is_banned=bool(result[9])
-                )
+                return UserData.from_row(result)
     
     async def get_user_data_by_vid(self, vid: str) -> Optional[UserData]:
         """
@@ -81,9 +90,7 @@ class AuthService:
         async with pool.acquire() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    """SELECT id, vid, discord_user_id, discord_username, firstname, lastname,
-                       refresh_token, refresh_token_date, verified, is_banned
-                       FROM user_data WHERE vid = %s""",
+                    f"SELECT {USER_DATA_COLUMNS} FROM user_data WHERE vid = %s",
                     (vid,)
                 )
                 result = await cursor.fetchone()
@@ -91,42 +98,7 @@ class AuthService:
                 if not result:
                     return None
                 
-                return UserData(
-                    id=result[0],
-                    vid=result[1],
-                    discord_user_id=result[2],
-                    discord_username=result[3],
-                    firstname=result[4],
-                    lastname=result[5],
-                    refresh_token=result[6],
-                    refresh_token_date=result[7],
-                    verified=bool(result[8]),
-                    is_banned=bool(result[9])
-                )
-    
-    async def update_discord_user_id(self, vid: str, discord_user_id: int) -> bool:
-        """
-        Update Discord user ID for a user by VID.
-        
-        Args:
-            vid: IVAO VID
-            discord_user_id: New Discord user ID
-            
-        Returns:
-            True if update was successful, False otherwise
-        """
-        pool = get_pool().pool
-        if not pool:
-            return False
-        
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(
-                    "UPDATE user_data SET discord_user_id = %s WHERE vid = %s",
-                    (discord_user_id, vid)
-                )
-                await conn.commit()
-                return cursor.rowcount > 0
+                return UserData.from_row(result)
     
     async def verify_member(
         self,
@@ -146,113 +118,348 @@ class AuthService:
             - user_info: Optional[Dict] - IVAO user info if successful
             - error_code: Optional[int] - Error code if failed
             - error_message: Optional[str] - Error message if failed
+            - source: Optional[str] - SOURCE_HANDOFF or SOURCE_IVAO if successful
         """
-        # Get user data from database
-        user_data = await self.get_user_data(member.id)
-        
-        # If not found by Discord ID, try to extract VID from nickname and look up by VID
-        if not user_data:
-            # Try to extract VID from nickname (format: "Name | VID")
-            vid = None
-            if member.display_name and '|' in member.display_name:
-                try:
-                    parts = member.display_name.split('|')
-                    if len(parts) == 2:
-                        potential_vid = parts[1].strip()
-                        # Check if it looks like a VID (numeric)
-                        if potential_vid.isdigit():
-                            vid = potential_vid
-                            logger.info(f"Extracted VID {vid} from nickname '{member.display_name}'")
-                except Exception as e:
-                    logger.debug(f"Could not extract VID from nickname: {e}")
-            
-            if vid:
-                # Try to find user by VID
-                user_data = await self.get_user_data_by_vid(vid)
-                
-                if user_data and user_data.has_refresh_token:
-                    # Found user by VID with refresh token - update their Discord user ID
-                    logger.info(
-                        f"User {member.name} ({member.id}) found by VID {vid}, "
-                        f"updating discord_user_id from {user_data.discord_user_id} to {member.id}"
-                    )
-                    await self.update_discord_user_id(vid, member.id)
-                    # Update the discord_user_id in the user_data object
-                    user_data.discord_user_id = str(member.id)
-                elif user_data:
-                    # Found user by VID but no refresh token
-                    return {
-                        'success': False,
-                        'error_code': 2,
-                        'error_message': 'User found in database but no refresh token available. User needs to re-authenticate.'
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error_code': 2,
-                        'error_message': 'User not found in database'
-                    }
+        started = time.perf_counter()
+        with span("verify_member", member_id=member.id, new_member=new_member) as s:
+            result = await self._verify_member(member, new_member)
+            if result['success']:
+                s.set("source", result['source'])
             else:
-                return {
-                    'success': False,
-                    'error_code': 2,
-                    'error_message': 'User not found in database. Could not extract VID from nickname.'
-                }
+                s.set("error_code", result.get('error_code', 1))
+        self._record_result(result, time.perf_counter() - started)
+        return result
+    
+    @staticmethod
+    def _record_result(result: Dict[str, Any], elapsed: float) -> None:
+        """Count a verification result and observe how long it took."""
+        if result['success']:
+            VERIFY_RESULTS.inc(outcome="success", error_code="0")
+            VERIFY_SECONDS.observe(elapsed, source=result['source'])
+        else:
+            VERIFY_RESULTS.inc(outcome="failure", error_code=str(result.get('error_code', 1)))
+            VERIFY_SECONDS.observe(elapsed, source="failure")
+    
+    async def _verify_member(
+        self,
+        member: discord.Member,
+        new_member: bool
+    ) -> Dict[str, Any]:
+        """Verify a Discord member (see verify_member)."""
+        vid = parse_nickname(member.display_name).vid
+        # Joins of users who never linked IVAO are turned away without a
+        # lookup; /auth and staffauth always query the database
+        prefilter = self.identity_filter if new_member else None
+        match = None
+        if prefilter is None or await prefilter.may_exist(member.id, vid):
+            # Look the member up by Discord ID or the VID in their nickname
+            match = await self.identity.resolve(member)
+            if not match and prefilter is not None:
+                prefilter.remember_missing(member.id, vid)
+        
+        error = self._check_match(match, vid)
+        if error:
+            return error
+        
+        user_data = match.user_data
+        if match.kind != MATCH_DISCORD_ID:
+            # Found user by VID with refresh token - update their Discord user ID
+            logger.info(f"User {member.name} ({member.id}) found by VID {user_data.vid}")
+            await self.identity.link_discord_id(user_data, member.id)
         
         if user_data.is_banned:
-            return {
-                'success': False,
-                'error_code': 3,
-                'error_message': 'User is banned'
-            }
+            return self._banned_result()
         
-        # Get user info from IVAO using refresh token
         try:
-            # Use refresh token from database to get user info
-            # Use VID if Discord ID was just updated or doesn't match
-            if user_data.vid and (not user_data.discord_user_id or user_data.discord_user_id != str(member.id)):
-                user_info = await self.oauth.get_user_info_for_discord_user(vid=user_data.vid)
-            else:
-                user_info = await self.oauth.get_user_info_for_discord_user(user_id=member.id)
+            # The web flow hands over the profile it just fetched when it adds
+            # the user to the guild; only fall back to IVAO without one
+            user_info, source = await self._fetch_user_info(member, user_data, await self.handoffs.consume(member.id))
+            first_name, last_name = self._fill_names(user_info, user_data)
             
-            # Ensure we always have first/last name data by falling back to DB values
-            first_name = user_info.get('firstName') or user_data.firstname
-            last_name = user_info.get('lastName') or user_data.lastname
-            if first_name:
-                user_info['firstName'] = first_name
-            if last_name:
-                user_info['lastName'] = last_name
-            
-            # Persist latest name info in database
-            await self._update_user_names(member.id, first_name, last_name)
-            
-            # Update discord username in database
-            await self._update_discord_username(member.id, member.name)
-            
-            # Mark as verified
-            await self._mark_verified(member.id)
+            # Persist latest name info, Discord username and verified flag;
+            # these finish even if shutdown cancels the verification now
+            if not self._verification_stored(member, user_data, user_info):
+                await SHUTDOWN.protect("user_data", self._store_verification(member, first_name, last_name))
             
             return {
                 'success': True,
                 'user_info': user_info,
-                'user_data': user_data
+                'user_data': user_data,
+                'source': source
             }
             
-        except OAuthError as e:
-            logger.warning(f"OAuth error verifying {member.name} ({member.id}): {e}")
+        except Exception as e:
+            return self._error_result(member, e)
+    
+    @staticmethod
+    def _check_match(match: Optional[IdentityMatch], vid: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Failure result for a member without a usable user_data row, None otherwise."""
+        if not match:
+            if vid:
+                error_message = 'User not found in database'
+            else:
+                error_message = 'User not found in database. Could not extract VID from nickname.'
             return {
                 'success': False,
-                'error_code': 4,
-                'error_message': str(e)
+                'error_code': 2,
+                'error_message': error_message
             }
-        except Exception as e:
-            logger.error(f"Unexpected error verifying {member.name} ({member.id}): {e}")
+        
+        if match.kind != MATCH_DISCORD_ID and not match.user_data.has_refresh_token:
+            # Found user by VID but no refresh token
             return {
                 'success': False,
-                'error_code': 1,
-                'error_message': f'Unexpected error: {e}'
+                'error_code': 2,
+                'error_message': 'User found in database but no refresh token available. User needs to re-authenticate.'
             }
+        return None
+    
+    @staticmethod
+    def _verification_stored(member: discord.Member, user_data: UserData, user_info: Dict[str, Any]) -> bool:
+        """
+        Whether the row already holds what a verification would write.
+        
+        The fingerprint is stored once the roles of a profile were applied,
+        so a matching fingerprint means the names were written back then.
+        """
+        return (
+            user_data.verified
+            and user_data.discord_username == member.name
+            and user_data.profile_fingerprint is not None
+            and user_data.profile_fingerprint == profile_fingerprint(user_info)
+        )
+    
+    @staticmethod
+    def _banned_result() -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error_code': 3,
+            'error_message': 'User is banned'
+        }
+    
+    @staticmethod
+    def _error_result(member: discord.Member, error: Exception) -> Dict[str, Any]:
+        """Failure result for an exception raised while fetching the profile."""
+        if isinstance(error, OAuthError):
+            logger.warning(f"OAuth error verifying {member.name} ({member.id}): {error}")
+            return {
+                'success': False,
+                'error_code': 4,
+                'error_message': str(error)
+            }
+        logger.error(f"Unexpected error verifying {member.name} ({member.id}): {error}")
+        return {
+            'success': False,
+            'error_code': 1,
+            'error_message': f'Unexpected error: {error}'
+        }
+    
+    async def _fetch_user_info(
+        self,
+        member: discord.Member,
+        user_data: UserData,
+        handoff: Optional[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], str]:
+        """Return the member's IVAO profile and its source, from the handoff if it matches the row."""
+        if handoff and str(handoff.get('id')) == str(user_data.vid):
+            return handoff, SOURCE_HANDOFF
+        
+        # Get user info from IVAO using refresh token
+        # Use VID if Discord ID was just updated or doesn't match
+        if user_data.vid and (not user_data.discord_user_id or user_data.discord_user_id != str(member.id)):
+            user_info = await self.oauth.get_user_info_for_discord_user(vid=user_data.vid)
+        else:
+            user_info = await self.oauth.get_user_info_for_discord_user(user_id=member.id)
+        return user_info, SOURCE_IVAO
+    
+    @staticmethod
+    def _fill_names(user_info: Dict[str, Any], user_data: UserData) -> Tuple[Optional[str], Optional[str]]:
+        """Ensure we always have first/last name data by falling back to DB values."""
+        first_name = user_info.get('firstName') or user_data.firstname
+        last_name = user_info.get('lastName') or user_data.lastname
+        if first_name:
+            user_info['firstName'] = first_name
+        if last_name:
+            user_info['lastName'] = last_name
+        return first_name, last_name
+    
+    async def verify_members(
+        self,
+        members: Sequence[discord.Member],
+        concurrency: Optional[int] = None,
+        new_member: bool = False
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Verify many Discord members at once.
+        
+        Gives the same results as calling verify_member for each member, but
+        resolves every member in one query, consumes their handoffs in one
+        transaction, fetches the missing profiles from IVAO with bounded
+        concurrency and stores the results in one statement per
+        STORE_BATCH_SIZE members (rows whose stored fingerprint shows
+        nothing changed are skipped). Every member's result is recorded in
+        the verify_member metrics, timed as the whole batch.
+        
+        Args:
+            members: Discord members to verify
+            concurrency: Parallel IVAO fetches (default: IVAO_BATCH_CONCURRENCY)
+            new_member: Whether these are new members joining
+            
+        Returns:
+            verify_member results by member ID
+        """
+        started = time.perf_counter()
+        results: Dict[int, Dict[str, Any]] = {}
+        with span("verify_members", members=len(members), new_member=new_member) as s:
+            # Joins of users who never linked IVAO are turned away without a
+            # lookup, as in verify_member
+            candidates = members
+            prefilter = self.identity_filter if new_member else None
+            if prefilter is not None:
+                known = await asyncio.gather(
+                    *(prefilter.may_exist(member.id, parse_nickname(member.display_name).vid) for member in members)
+                )
+                candidates = [member for member, may_exist in zip(members, known) if may_exist]
+            matches = await self.identity.resolve_many(candidates)
+            if prefilter is not None:
+                for member in candidates:
+                    if member.id not in matches:
+                        prefilter.remember_missing(member.id, parse_nickname(member.display_name).vid)
+            
+            links: List[Tuple[UserData, int]] = []
+            eligible: List[Tuple[discord.Member, UserData]] = []
+            for member in members:
+                match = matches.get(member.id)
+                error = self._check_match(match, parse_nickname(member.display_name).vid)
+                if error:
+                    results[member.id] = error
+                    continue
+                if match.kind != MATCH_DISCORD_ID:
+                    links.append((match.user_data, member.id))
+                eligible.append((member, match.user_data))
+            # Linked before fetching, like verify_member, so a failed fetch keeps the link
+            await self.identity.link_discord_ids(links)
+            
+            pending = []
+            for member, user_data in eligible:
+                if user_data.is_banned:
+                    results[member.id] = self._banned_result()
+                else:
+                    pending.append((member, user_data))
+            handoffs = await self.handoffs.consume_many(member.id for member, _ in pending)
+            
+            semaphore = asyncio.Semaphore(concurrency or self.oauth.config.batch_concurrency)
+            
+            async def fetch(member: discord.Member, user_data: UserData):
+                async with semaphore:
+                    return await self._fetch_user_info(member, user_data, handoffs.get(member.id))
+            
+            fetched = await asyncio.gather(
+                *(fetch(member, user_data) for member, user_data in pending), return_exceptions=True
+            )
+            
+            unstored: List[Tuple[discord.Member, UserData, Optional[str], Optional[str]]] = []
+            for (member, user_data), outcome in zip(pending, fetched):
+                if isinstance(outcome, BaseException):
+                    if not isinstance(outcome, Exception):
+                        raise outcome
+                    results[member.id] = self._error_result(member, outcome)
+                    continue
+                user_info, source = outcome
+                first_name, last_name = self._fill_names(user_info, user_data)
+                if not self._verification_stored(member, user_data, user_info):
+                    unstored.append((member, user_data, first_name, last_name))
+                results[member.id] = {
+                    'success': True,
+                    'user_info': user_info,
+                    'user_data': user_data,
+                    'source': source
+                }
+            
+            await SHUTDOWN.protect("user_data", self._store_verifications(unstored))
+            s.set("stored", len(unstored))
+        
+        elapsed = time.perf_counter() - started
+        for result in results.values():
+            self._record_result(result, elapsed)
+        return results
     
+    @traced("db.store_verifications")
+    async def _store_verifications(
+        self,
+        verified: Sequence[Tuple[discord.Member, UserData, Optional[str], Optional[str]]]
+    ) -> None:
+        """Write the results of many successful verifications to user_data (see _store_verification)."""
+        pool = get_pool().pool
+        if not pool or not verified:
+            return
+        
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for offset in range(0, len(verified), STORE_BATCH_SIZE):
+                    chunk = verified[offset:offset + STORE_BATCH_SIZE]
+                    cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+                    params = []
+                    for column in (2, 3):
+                        for row in chunk:
+                            params += (row[1].id, row[column])
+                    for member, user_data, _, _ in chunk:
+                        params += (user_data.id, member.name)
+                    params += (user_data.id for _, user_data, _, _ in chunk)
+                    # A CASE without a matching WHEN is NULL, so missing names keep the stored value
+                    await cursor.execute(
+                        f"""UPDATE user_data
+                            SET firstname = COALESCE(CASE id {cases} END, firstname),
+                                lastname = COALESCE(CASE id {cases} END, lastname),
+                                discord_username = CASE id {cases} END,
+                                verified = 1
+                            WHERE id IN ({', '.join(['%s'] * len(chunk))})""",
+                        params
+                    )
+                await conn.commit()
+    
+    @traced("db.store_applied_roles")
+    async def store_applied_roles(self, user_data: UserData, fingerprint: str, role_ids: Sequence[int]) -> None:
+        """
+        Record the profile whose roles were applied and the roles it granted.
+        
+        Skipped when neither changed since the last verification.
+        
+        Args:
+            user_data: The member's row
+            fingerprint: profile_fingerprint of the applied profile
+            role_ids: IDs of the roles the profile grants
+        """
+        applied_roles = ",".join(str(role_id) for role_id in sorted(role_ids))
+        if user_data.profile_fingerprint == fingerprint and user_data.applied_roles == applied_roles:
+            return
+        
+        pool = get_pool().pool
+        if not pool:
+            return
+        
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE user_data SET profile_fingerprint = %s, applied_roles = %s WHERE id = %s",
+                    (fingerprint, applied_roles, user_data.id)
+                )
+                await conn.commit()
+        user_data.profile_fingerprint = fingerprint
+        user_data.applied_roles = applied_roles
+    
+    async def _store_verification(
+        self,
+        member: discord.Member,
+        first_name: Optional[str],
+        last_name: Optional[str]
+    ) -> None:
+        """Write the results of a successful verification to user_data."""
+        await self._update_user_names(member.id, first_name, last_name)
+        await self._update_discord_username(member.id, member.name)
+        await self._mark_verified(member.id)
+    
+    @traced("db.update_discord_username")
     async def _update_discord_username(self, user_id: int, username: str) -> None:
         """Update Discord username in database."""
         pool = get_pool().pool
@@ -267,6 +474,7 @@ class AuthService:
                 )
                 await conn.commit()
     
+    @traced("db.mark_verified")
     async def _mark_verified(self, user_id: int) -> None:
         """Mark user as verified in database."""
         pool = get_pool().pool
@@ -281,6 +489,7 @@ class AuthService:
                 )
                 await conn.commit()
     
+    @traced("db.update_user_names")
     async def _update_user_names(self, user_id: int, first_name: Optional[str], last_name: Optional[str]) -> None:
         """Update first and last name in database if provided."""
         if not first_name and not last_name:
@@ -303,3 +512,59 @@ class AuthService:
                 )
                 await conn.commit()
 
+
+class JoinBatcher:
+    """
+    Verifies joining members with verify_members.
+    
+    A join that arrives while no batch is running is verified at once;
+    joins that arrive while one runs (a join burst, or the joins held
+    during startup warmup) wait for it and are verified together in the
+    next batch, so a burst costs one lookup, one handoff transaction and
+    one store per batch instead of per member.
+    """
+    
+    def __init__(self, auth_service: AuthService, max_batch: int = STORE_BATCH_SIZE):
+        """
+        Initialize the batcher.
+        
+        Args:
+            auth_service: Auth service verifying the batches
+            max_batch: Most members verified in one batch
+        """
+        self.auth = auth_service
+        self.max_batch = max_batch
+        self._pending: List[Tuple[discord.Member, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    async def verify(self, member: discord.Member) -> Dict[str, Any]:
+        """Same as verify_member(member, new_member=True), batched with concurrent joins."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((member, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+        return await future
+    
+    async def _drain(self) -> None:
+        """Verify pending joins batch by batch until none are left."""
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            # A user joining several guilds at once is verified once
+            members = list({member.id: member for member, _ in batch}.values())
+            try:
+                results = await self.auth.verify_members(members, new_member=True)
+            except asyncio.CancelledError:
+                for _, future in batch + self._pending:
+                    future.cancel()
+                self._pending = []
+                raise
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for member, future in batch:
+                # The waiting join may have been cancelled meanwhile
+                if not future.done():
+                    future.set_result(results[member.id])
+
@@ -0,0 +1,367 @@
+"""DB-backed work claiming so several bot replicas can share bulk work.
+
+A bulk job is split into batches (ranges of user_data IDs) stored in the
+work_claims table. Every replica runs a ClaimWorker that takes batches with
+SELECT ... FOR UPDATE SKIP LOCKED and holds them under a lease. A batch whose
+lease expires (its replica crashed) becomes claimable again. A batch that
+has failed or been abandoned max_attempts times is marked failed with the
+last error, so its job can finish.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..database.pool import get_pool
+from ..utils.exceptions import DatabaseError
+
+logger = logging.getLogger("discord")
+
+
+# Batch states
+BATCH_PENDING = "pending"
+BATCH_CLAIMED = "claimed"
+BATCH_DONE = "done"
+BATCH_CANCELLED = "cancelled"
+BATCH_FAILED = "failed"
+
+BATCH_COLUMNS = "id, job_id, kind, params, range_start, range_end, attempts"
+
+
+@dataclass
+class WorkBatch:
+    """A claimed range of user_data IDs."""
+    id: int
+    job_id: int
+    kind: str
+    params: Dict[str, Any]
+    range_start: int
+    range_end: int
+    attempts: int
+
+    @classmethod
+    def from_row(cls, row) -> "WorkBatch":
+        """Build a WorkBatch from a row selected with BATCH_COLUMNS."""
+        return cls(
+            id=row[0],
+            job_id=row[1],
+            kind=row[2],
+            params=json.loads(row[3]) if row[3] else {},
+            range_start=row[4],
+            range_end=row[5],
+            attempts=row[6]
+        )
+
+
+@dataclass
+class JobClaimProgress:
+    """Aggregated batch state of one job."""
+    batches: int = 0
+    done: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    results: Optional[List[Dict[str, Any]]] = None
+    errors: Optional[List[str]] = None  # last error of each failed batch
+
+    @property
+    def finished(self) -> bool:
+        return self.batches > 0 and self.done + self.cancelled + self.failed == self.batches
+
+
+def default_owner_id() -> str:
+    """Identify this replica in claim rows."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkClaimStore:
+    """Creates, claims and completes batches in the work_claims table."""
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: int = 120, max_attempts: int = 3):
+        """
+        Initialize claim store.
+
+        Args:
+            owner: Replica identifier (default: hostname:pid)
+            lease_seconds: How long a claim stays valid without renewal
+            max_attempts: Claims of a batch before it is marked failed
+        """
+        self.owner = owner or default_owner_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def _pool(self):
+        pool = get_pool().pool
+        if not pool:
+            raise DatabaseError("Database pool not available")
+        return pool
+
+    async def create_batches(
+        self,
+        job_id: int,
+        kind: str,
+        params: Dict[str, Any],
+        ids: List[int],
+        batch_size: int
+    ) -> int:
+        """
+        Split sorted user_data IDs into batches for a job.
+
+        Args:
+            job_id: Owning bot_jobs row
+            kind: Work kind (selects the processor)
+            params: Processor parameters
+            ids: Sorted IDs to cover
+            batch_size: IDs per batch
+
+        Returns:
+            Number of batches created
+        """
+        now = datetime.now()
+        rows = [
+            (job_id, kind, json.dumps(params), chunk[0], chunk[-1], BATCH_PENDING, now, now)
+            for chunk in (ids[i:i + batch_size] for i in range(0, len(ids), batch_size))
+        ]
+        if not rows:
+            return 0
+
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(
+                    """INSERT INTO work_claims
+                       (job_id, kind, params, range_start, range_end, status, created_at, updated_at)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+                    rows
+                )
+                await conn.commit()
+        return len(rows)
+
+    async def claim(self, kinds: List[str]) -> Optional[WorkBatch]:
+        """
+        Claim the next pending or abandoned batch of the given kinds.
+
+        Rows locked by another replica's claim transaction are skipped rather
+        than waited for, so replicas never block each other. An abandoned
+        batch that has used up its attempts is marked failed instead.
+
+        Returns:
+            The claimed batch, or None if nothing is claimable
+        """
+        if not kinds:
+            return None
+        placeholders = ", ".join(["%s"] * len(kinds))
+
+        async with self._pool().acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    while True:
+                        await cursor.execute(
+                            f"""SELECT {BATCH_COLUMNS} FROM work_claims
+                                WHERE kind IN ({placeholders})
+                                  AND (status = %s OR (status = %s AND lease_expires_at < NOW()))
+                                ORDER BY id LIMIT 1
+                                FOR UPDATE SKIP LOCKED""",
+                            tuple(kinds) + (BATCH_PENDING, BATCH_CLAIMED)
+                        )
+                        row = await cursor.fetchone()
+                        if not row:
+                            # Keeps batches marked failed above
+                            await conn.commit()
+                            return None
+
+                        batch = WorkBatch.from_row(row)
+                        if batch.attempts < self.max_attempts:
+                            break
+                        # Its replicas kept dying or losing the lease while on it
+                        error = f"abandoned after {batch.attempts} attempts"
+                        await cursor.execute(
+                            """UPDATE work_claims SET status = %s, result = %s, lease_expires_at = NULL, updated_at = NOW()
+                               WHERE id = %s""",
+                            (BATCH_FAILED, json.dumps({"error": error}), batch.id)
+                        )
+                        logger.error(f"Batch #{batch.id} of job #{batch.job_id} failed: {error}")
+                    await cursor.execute(
+                        """UPDATE work_claims
+                           SET status = %s, owner = %s, attempts = attempts + 1,
+                               lease_expires_at = NOW() + INTERVAL %s SECOND, updated_at = NOW()
+                           WHERE id = %s""",
+                        (BATCH_CLAIMED, self.owner, self.lease_seconds, batch.id)
+                    )
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+        batch.attempts += 1
+        if batch.attempts > 1:
+            logger.info(f"Reclaimed abandoned batch #{batch.id} of job #{batch.job_id} (attempt {batch.attempts})")
+        return batch
+
+    async def renew(self, batch: WorkBatch) -> bool:
+        """
+        Extend the lease of a batch this replica holds.
+
+        Returns:
+            False if the claim was lost (lease expired and taken over)
+        """
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """UPDATE work_claims SET lease_expires_at = NOW() + INTERVAL %s SECOND, updated_at = NOW()
+                       WHERE id = %s AND owner = %s AND status = %s""",
+                    (self.lease_seconds, batch.id, self.owner, BATCH_CLAIMED)
+                )
+                await conn.commit()
+                return cursor.rowcount > 0
+
+    async def complete(self, batch: WorkBatch, result: Dict[str, Any]) -> None:
+        """Mark a batch done and store its result."""
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """UPDATE work_claims SET status = %s, result = %s, lease_expires_at = NULL, updated_at = NOW()
+                       WHERE id = %s AND owner = %s""",
+                    (BATCH_DONE, json.dumps(result), batch.id, self.owner)
+                )
+                await conn.commit()
+
+    async def fail(self, batch: WorkBatch, error: str) -> None:
+        """Mark a batch failed for good and store the error."""
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """UPDATE work_claims SET status = %s, result = %s, lease_expires_at = NULL, updated_at = NOW()
+                       WHERE id = %s AND owner = %s""",
+                    (BATCH_FAILED, json.dumps({"error": error[:1000]}), batch.id, self.owner)
+                )
+                await conn.commit()
+
+    async def release(self, batch: WorkBatch) -> None:
+        """Hand a batch back unfinished (e.g. on shutdown)."""
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """UPDATE work_claims SET status = %s, owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+                       WHERE id = %s AND owner = %s AND status = %s""",
+                    (BATCH_PENDING, batch.id, self.owner, BATCH_CLAIMED)
+                )
+                await conn.commit()
+
+    async def set_job_status(self, job_id: int, from_status: str, to_status: str) -> int:
+        """Move all batches of a job between states (cancel/reopen)."""
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE work_claims SET status = %s, updated_at = NOW() WHERE job_id = %s AND status = %s",
+                    (to_status, job_id, from_status)
+                )
+                await conn.commit()
+                return cursor.rowcount
+
+    async def progress(self, job_id: int) -> JobClaimProgress:
+        """Aggregate batch states and results of a job."""
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT status, result FROM work_claims WHERE job_id = %s",
+                    (job_id,)
+                )
+                rows = await cursor.fetchall()
+
+        progress = JobClaimProgress(batches=len(rows), results=[], errors=[])
+        for status, result in rows:
+            if status == BATCH_DONE:
+                progress.done += 1
+                if result:
+                    progress.results.append(json.loads(result))
+            elif status == BATCH_CANCELLED:
+                progress.cancelled += 1
+            elif status == BATCH_FAILED:
+                progress.failed += 1
+                progress.errors.append(json.loads(result).get("error", "unknown error") if result else "unknown error")
+        return progress
+
+
+BatchProcessor = Callable[[WorkBatch, Callable[[], Awaitable[bool]]], Awaitable[Dict[str, Any]]]
+
+
+class ClaimWorker:
+    """Background loop that claims and processes batches in this replica."""
+
+    POLL_INTERVAL = 5.0  # seconds
+
+    def __init__(self, store: WorkClaimStore):
+        """
+        Initialize claim worker.
+
+        Args:
+            store: Claim store
+        """
+        self.store = store
+        self._processors: Dict[str, BatchProcessor] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.processed_batches = 0
+
+    def register(self, kind: str, processor: BatchProcessor) -> None:
+        """
+        Register the processor for a work kind.
+
+        The processor receives the batch and a renew() callback it should
+        await periodically; renew() returns False once the claim is lost.
+        It returns a JSON-serialisable result dictionary.
+        """
+        self._processors[kind] = processor
+
+    def start(self) -> None:
+        """Start the claim loop if it is not running."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="claim-worker")
+
+    async def stop(self) -> None:
+        """Stop the claim loop, releasing the batch in progress."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                batch = await self.store.claim(list(self._processors))
+            except Exception as e:
+                logger.error(f"Claiming work failed: {e}")
+                batch = None
+
+            if batch is None:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                continue
+
+            try:
+                result = await self._processors[batch.kind](batch, lambda: self.store.renew(batch))
+            except asyncio.CancelledError:
+                try:
+                    await asyncio.shield(self.store.release(batch))
+                except Exception as e:
+                    logger.warning(f"Could not release batch #{batch.id}: {e}")
+                raise
+            except Exception as e:
+                logger.exception(f"Batch #{batch.id} of job #{batch.job_id} failed (attempt {batch.attempts}): {e}")
+                if batch.attempts >= self.store.max_attempts:
+                    try:
+                        await self.store.fail(batch, f"{type(e).__name__}: {e}")
+                    except Exception as fail_error:
+                        # The next claim() marks it failed once the lease expires
+                        logger.error(f"Could not mark batch #{batch.id} failed: {fail_error}")
+                # Otherwise leave the claim to expire so another attempt is made later
+                continue
+
+            try:
+                await self.store.complete(batch, result)
+            except Exception as e:
+                logger.error(f"Could not complete batch #{batch.id}: {e}")
+                continue
+            self.processed_batches += 1
@@ -0,0 +1,121 @@
+"""Profiles handed over by the web flow for members about to join."""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from ..database.pool import get_pool
+from ..utils.tracing import traced
+
+logger = logging.getLogger("discord")
+
+# Handoffs older than this are ignored; the member is verified the usual way
+HANDOFF_MAX_AGE = 600  # seconds
+
+
+class HandoffStore:
+    """
+    Reads the member_handoffs outbox written by the PHP web flow.
+
+    After the IVAO login the web flow already holds a fresh /users/me
+    profile. It stores that profile together with the Discord user ID just
+    before adding the user to the guild, so the bot can assign roles on
+    join without refreshing the token and fetching the profile again.
+    """
+
+    @traced("db.consume_handoff")
+    async def consume(self, discord_user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Take the newest recent handoff of a Discord user.
+
+        The row is deleted so exactly one replica uses it.
+
+        Args:
+            discord_user_id: Discord user ID
+
+        Returns:
+            IVAO profile if a recent handoff exists, None otherwise
+        """
+        pool = get_pool().pool
+        if not pool:
+            return None
+
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """SELECT id, profile FROM member_handoffs
+                       WHERE discord_user_id = %s AND created_at >= NOW() - INTERVAL %s SECOND
+                       ORDER BY id DESC LIMIT 1""",
+                    (str(discord_user_id), HANDOFF_MAX_AGE)
+                )
+                row = await cursor.fetchone()
+                if not row:
+                    return None
+
+                await cursor.execute("DELETE FROM member_handoffs WHERE id = %s", (row[0],))
+                await conn.commit()
+                if cursor.rowcount == 0:
+                    # Another replica took it first
+                    return None
+
+        return _parse_profile(row[0], discord_user_id, row[1])
+
+    @traced("db.consume_handoffs")
+    async def consume_many(self, discord_user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Take the newest recent handoff of each of many Discord users.
+
+        The rows are locked and deleted in one transaction, so a replica
+        consuming the same users concurrently waits and then finds none.
+
+        Args:
+            discord_user_ids: Discord user IDs
+
+        Returns:
+            IVAO profiles by Discord user ID, for users with a recent handoff
+        """
+        pool = get_pool().pool
+        ids = [str(discord_user_id) for discord_user_id in discord_user_ids]
+        if not pool or not ids:
+            return {}
+
+        newest: Dict[str, tuple] = {}
+        async with pool.acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        f"""SELECT id, discord_user_id, profile FROM member_handoffs
+                            WHERE discord_user_id IN ({', '.join(['%s'] * len(ids))})
+                              AND created_at >= NOW() - INTERVAL %s SECOND
+                            ORDER BY id DESC FOR UPDATE""",
+                        tuple(ids) + (HANDOFF_MAX_AGE,)
+                    )
+                    for row in await cursor.fetchall():
+                        newest.setdefault(row[1], row)
+                    if newest:
+                        handoff_ids = [row[0] for row in newest.values()]
+                        await cursor.execute(
+                            f"DELETE FROM member_handoffs WHERE id IN ({', '.join(['%s'] * len(handoff_ids))})",
+                            tuple(handoff_ids)
+                        )
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+        profiles = {}
+        for handoff_id, discord_user_id, data in newest.values():
+            profile = _parse_profile(handoff_id, discord_user_id, data)
+            if profile is not None:
+                profiles[int(discord_user_id)] = profile
+        return profiles
+
+
+def _parse_profile(handoff_id: int, discord_user_id, data: str) -> Optional[Dict[str, Any]]:
+    try:
+        profile = json.loads(data)
+    except ValueError:
+        logger.warning(f"Ignoring malformed handoff #{handoff_id} for {discord_user_id}")
+        return None
+    return profile if isinstance(profile, dict) and profile.get('id') else None
@@ -0,0 +1,318 @@
+"""Identity resolution from Discord members to user_data rows."""
+
+import logging
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import discord
+
+from ..database.pool import get_pool
+from ..database.models import UserData, USER_DATA_COLUMNS
+from ..utils.tracing import span, traced
+
+if TYPE_CHECKING:
+    from .identity_filter import IdentityFilter
+
+logger = logging.getLogger("discord")
+
+
+# Match kinds, strongest first
+MATCH_DISCORD_ID = "discord_id"
+MATCH_VID = "vid"
+MATCH_USERNAME = "username"
+MATCH_NAME = "name"
+MATCH_RANKS = (MATCH_DISCORD_ID, MATCH_VID, MATCH_USERNAME, MATCH_NAME)
+
+# Nicknames look like "First Last | 123456", "First Last | XM-SOC 123456"
+# (set by the bot) or "First Last - 123456" (set by the web flow on join)
+_NICKNAME_SEPARATOR = re.compile(r"\s*(?:\||\s-\s)\s*")
+_VID_PATTERN = re.compile(r"\b(\d{4,9})\b")
+
+# Members per query of resolve_many
+RESOLVE_BATCH_SIZE = 1000
+
+
+class ParsedNickname(NamedTuple):
+    """Identity hints extracted from a Discord display name."""
+    firstname: Optional[str]
+    lastname: Optional[str]
+    vid: Optional[str]
+
+
+@lru_cache(maxsize=4096)
+def parse_nickname(display_name: Optional[str]) -> ParsedNickname:
+    """
+    Extract name and VID hints from a display name.
+
+    Args:
+        display_name: Discord display name
+
+    Returns:
+        Parsed nickname (fields are None when not present)
+    """
+    if not display_name:
+        return ParsedNickname(None, None, None)
+
+    parts = _NICKNAME_SEPARATOR.split(display_name.strip(), maxsplit=1)
+    vid = None
+    if len(parts) == 2:
+        match = _VID_PATTERN.search(parts[1])
+        if match:
+            vid = match.group(1)
+
+    names = parts[0].split()
+    if len(names) >= 2:
+        return ParsedNickname(names[0], " ".join(names[1:]), vid)
+    return ParsedNickname(None, None, vid)
+
+
+@dataclass
+class IdentityMatch:
+    """A resolved user_data row and how it was matched."""
+    user_data: UserData
+    kind: str
+
+
+class LatencyStat:
+    """Running latency aggregate for one resolution path."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+class IdentityResolver:
+    """Resolves Discord members to user_data rows in a single round trip."""
+
+    def __init__(self, identity_filter: Optional["IdentityFilter"] = None):
+        """
+        Initialize identity resolver.
+
+        Args:
+            identity_filter: Join prefilter to keep up to date with links
+        """
+        self.latency: Dict[str, LatencyStat] = {}
+        self.identity_filter = identity_filter
+
+    def _build_query(
+        self,
+        member: discord.Member,
+        include_weak: bool
+    ) -> Tuple[str, tuple]:
+        """Build one UNION ALL query covering every available key, ranked by match strength."""
+        parsed = parse_nickname(member.display_name)
+        branches: List[Tuple[str, str, tuple]] = [
+            (MATCH_DISCORD_ID, "discord_user_id = %s", (str(member.id),)),
+        ]
+        if parsed.vid:
+            branches.append((MATCH_VID, "vid = %s", (parsed.vid,)))
+        if include_weak:
+            if member.name:
+                branches.append((MATCH_USERNAME, "discord_username = %s", (member.name,)))
+            if parsed.firstname and parsed.lastname:
+                branches.append((MATCH_NAME, "firstname = %s AND lastname = %s", (parsed.firstname, parsed.lastname)))
+
+        # Each branch stays a separate SELECT so it can use its own index
+        selects = []
+        params: tuple = ()
+        for kind, condition, values in branches:
+            selects.append(
+                f"(SELECT {USER_DATA_COLUMNS}, {MATCH_RANKS.index(kind)} AS match_rank "
+                f"FROM user_data WHERE {condition})"
+            )
+            params += values
+
+        sql = " UNION ALL ".join(selects) + " ORDER BY match_rank LIMIT 1"
+        return sql, params
+
+    async def resolve(
+        self,
+        member: discord.Member,
+        include_weak: bool = False
+    ) -> Optional[IdentityMatch]:
+        """
+        Resolve a member to their user_data row.
+
+        Discord ID and the VID from the nickname are always tried. Weak keys
+        (Discord username, first/last name from the display name) are only
+        used when include_weak is set, since they can match the wrong person.
+
+        Args:
+            member: Discord member
+            include_weak: Whether to also match on username and name
+
+        Returns:
+            IdentityMatch if found, None otherwise
+        """
+        pool = get_pool().pool
+        if not pool:
+            return None
+
+        sql, params = self._build_query(member, include_weak)
+        started = time.perf_counter()
+        with span("db.resolve_identity", include_weak=include_weak) as s:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(sql, params)
+                    row = await cursor.fetchone()
+            kind = MATCH_RANKS[row[-1]] if row else "miss"
+            s.set("kind", kind)
+        elapsed = time.perf_counter() - started
+
+        self.latency.setdefault(kind, LatencyStat()).add(elapsed)
+        logger.info(
+            f"Identity resolution for {member.name} ({member.id}, display '{member.display_name}'): "
+            f"{kind} in {elapsed * 1000:.1f}ms"
+        )
+
+        if not row:
+            return None
+        return IdentityMatch(user_data=UserData.from_row(row), kind=kind)
+
+    async def resolve_many(self, members: Sequence[discord.Member]) -> Dict[int, IdentityMatch]:
+        """
+        Resolve many members by Discord ID or nickname VID in one query per
+        RESOLVE_BATCH_SIZE members.
+
+        Args:
+            members: Discord members
+
+        Returns:
+            Matches by member ID; unresolved members are missing
+        """
+        pool = get_pool().pool
+        if not pool or not members:
+            return {}
+
+        matches: Dict[int, IdentityMatch] = {}
+        started = time.perf_counter()
+        with span("db.resolve_identities", members=len(members)):
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    for offset in range(0, len(members), RESOLVE_BATCH_SIZE):
+                        chunk = members[offset:offset + RESOLVE_BATCH_SIZE]
+                        discord_ids = [str(member.id) for member in chunk]
+                        vids = {member.id: parse_nickname(member.display_name).vid for member in chunk}
+                        vid_values = sorted({vid for vid in vids.values() if vid})
+                        sql = (
+                            f"(SELECT {USER_DATA_COLUMNS}, 0 AS match_rank FROM user_data "
+                            f"WHERE discord_user_id IN ({', '.join(['%s'] * len(discord_ids))}))"
+                        )
+                        if vid_values:
+                            sql += (
+                                f" UNION ALL (SELECT {USER_DATA_COLUMNS}, 1 AS match_rank FROM user_data "
+                                f"WHERE vid IN ({', '.join(['%s'] * len(vid_values))}))"
+                            )
+                        await cursor.execute(sql, tuple(discord_ids) + tuple(vid_values))
+                        rows = await cursor.fetchall()
+
+                        by_discord_id: Dict[str, tuple] = {}
+                        by_vid: Dict[str, tuple] = {}
+                        for row in rows:
+                            if row[-1] == 0:
+                                by_discord_id.setdefault(str(row[2]), row)
+                            else:
+                                by_vid.setdefault(str(row[1]), row)
+                        for member in chunk:
+                            row = by_discord_id.get(str(member.id))
+                            kind = MATCH_DISCORD_ID
+                            if row is None and vids[member.id]:
+                                row = by_vid.get(vids[member.id])
+                                kind = MATCH_VID
+                            if row is not None:
+                                matches[member.id] = IdentityMatch(user_data=UserData.from_row(row), kind=kind)
+
+        logger.info(
+            f"Identity resolution for {len(members)} member(s): {len(matches)} found "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return matches
+
+    @traced("db.link_discord_id")
+    async def link_discord_id(self, user_data: UserData, discord_user_id: int) -> bool:
+        """
+        Point a user_data row at a Discord account.
+
+        Args:
+            user_data: Row matched by a key other than the Discord ID
+            discord_user_id: Discord user ID to store
+
+        Returns:
+            True if update was successful, False otherwise
+        """
+        pool = get_pool().pool
+        if not pool:
+            return False
+
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE user_data SET discord_user_id = %s WHERE id = %s",
+                    (str(discord_user_id), user_data.id)
+                )
+                await conn.commit()
+                updated = cursor.rowcount > 0
+
+        logger.info(
+            f"Updated discord_user_id for VID {user_data.vid} "
+            f"from {user_data.discord_user_id} to {discord_user_id}"
+        )
+        user_data.discord_user_id = str(discord_user_id)
+        if self.identity_filter is not None:
+            self.identity_filter.add(discord_user_id=discord_user_id)
+        return updated
+
+    @traced("db.link_discord_ids")
+    async def link_discord_ids(self, links: Sequence[Tuple[UserData, int]]) -> None:
+        """
+        Point many user_data rows at Discord accounts in one statement.
+
+        Args:
+            links: (row matched by a key other than the Discord ID, Discord user ID) pairs
+        """
+        pool = get_pool().pool
+        if not pool or not links:
+            return
+
+        cases = " ".join(["WHEN %s THEN %s"] * len(links))
+        params = []
+        for user_data, discord_user_id in links:
+            params += (user_data.id, str(discord_user_id))
+        params += (user_data.id for user_data, _ in links)
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"UPDATE user_data SET discord_user_id = CASE id {cases} END "
+                    f"WHERE id IN ({', '.join(['%s'] * len(links))})",
+                    params
+                )
+                await conn.commit()
+
+        for user_data, discord_user_id in links:
+            user_data.discord_user_id = str(discord_user_id)
+            if self.identity_filter is not None:
+                self.identity_filter.add(discord_user_id=discord_user_id)
+        logger.info(f"Updated discord_user_id of {len(links)} user(s) found by VID")
+
+    def latency_summary(self) -> str:
+        """Return average/max resolution latency per match path."""
+        parts = []
+        for kind in MATCH_RANKS + ("miss",):
+            stat = self.latency.get(kind)
+            if stat and stat.count:
+                parts.append(
+                    f"{kind}: n={stat.count} avg={stat.total / stat.count * 1000:.1f}ms "
+                    f"max={stat.max * 1000:.1f}ms"
+                )
+        return "; ".join(parts) or "no resolutions yet"
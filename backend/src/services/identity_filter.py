@@ -0,0 +1,344 @@
+"""Prefilter that turns away joins of Discord users who never linked IVAO.
+
+Raids and public-invite spikes bring many members without a user_data
+row; resolving each of them costs a database round trip just to learn
+"not found". The filter keeps a Bloom filter of every known Discord ID
+and VID plus a short-lived negative cache of members recently resolved
+as unknown, and answers "definitely unknown" without a query.
+
+The web flow inserts user_data rows and links Discord IDs moments before
+it adds the user to the guild, so a filter miss is not trusted on its
+own: the join waits for an incremental sync (new user_data rows and
+member handoffs since the last sync) that started after it arrived, and
+is checked again. Syncs are shared by every waiting join and spaced at
+least IDENTITY_FILTER_SYNC_INTERVAL apart, so a raid costs one query per
+interval instead of one per member. The filter is rebuilt from scratch
+periodically to drop keys that no longer exist.
+
+The filter and the negative cache are saved in the cache snapshot, so a
+restart picks them up instead of reading the whole table again; the
+first sync after a restore adds the rows created while the bot was down.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..config.settings import IdentityFilterConfig
+from ..database.pool import get_pool
+from ..utils.bloom import BloomFilter
+from ..utils.memory import format_bytes
+from ..utils.metrics import IDENTITY_FILTER_BYTES, IDENTITY_FILTER_CHECKS, IDENTITY_FILTER_FP_RATE
+from ..utils.snapshot import Sections, Snapshot
+
+logger = logging.getLogger("discord")
+
+# Room for growth between rebuilds, relative to the keys at build time
+CAPACITY_HEADROOM = 2
+MIN_CAPACITY = 10000
+
+SNAPSHOT_META = "identity_filter"
+BLOOM_SECTION = "identity_filter.bloom"
+# Discord IDs of unlinked users together with the VID in their nickname
+NEGATIVE_SECTION = "identity_filter.negative"
+
+# (discord_user_id, vid) pairs
+IdentityKeys = Sequence[Tuple[Optional[str], Optional[str]]]
+
+
+def _keys(rows: IdentityKeys) -> List[str]:
+    keys = []
+    for discord_user_id, vid in rows:
+        if discord_user_id:
+            keys.append(f"d:{discord_user_id}")
+        if vid:
+            keys.append(f"v:{vid}")
+    return keys
+
+
+class IdentityFilter:
+    """Bloom filter of known Discord IDs and VIDs with a negative cache."""
+
+    def __init__(self, config: IdentityFilterConfig):
+        """
+        Initialize identity filter.
+
+        Args:
+            config: Identity filter configuration
+        """
+        self.config = config
+        self._bloom: Optional[BloomFilter] = None
+        # discord_user_id -> (expiry, VID from the nickname)
+        self._negative: "OrderedDict[int, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._last_user_id = 0
+        self._last_handoff_id = 0
+        self._synced_at = 0.0  # start of the last successful sync
+        self._built_at = 0.0  # wall clock time of the last full rebuild
+        self._last_sync_started = 0.0
+        self._sync_task: Optional[asyncio.Task] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._added_during_rebuild: Optional[List[str]] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    @property
+    def negative_count(self) -> int:
+        return len(self._negative)
+
+    @property
+    def bloom(self) -> Optional[BloomFilter]:
+        return self._bloom
+
+    def start(self) -> None:
+        """Start the periodic rebuild if it is not running."""
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild_periodically(), name="identity-filter-rebuild")
+
+    async def stop(self) -> None:
+        if self._rebuild_task and not self._rebuild_task.done():
+            self._rebuild_task.cancel()
+            await asyncio.gather(self._rebuild_task, return_exceptions=True)
+
+    async def _rebuild_periodically(self) -> None:
+        interval = self.config.rebuild_interval * 60
+        while True:
+            # A filter restored from a snapshot is rebuilt when it would have been without the restart
+            await asyncio.sleep(max(0.0, self._built_at + interval - time.time()))
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Identity filter rebuild failed, keeping the previous filter: {e}")
+                await asyncio.sleep(interval)
+
+    async def rebuild(self) -> None:
+        """Build a new filter from every user_data row."""
+        pool = get_pool().pool
+        if not pool:
+            return
+
+        started = time.monotonic()
+        built_at = time.time()
+        async with self._lock:
+            # Keys the bot writes while the table is read and hashed go into the new filter too
+            self._added_during_rebuild = []
+            try:
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute("SELECT COALESCE(MAX(id), 0) FROM member_handoffs")
+                        (last_handoff_id,) = await cursor.fetchone()
+                        await cursor.execute("SELECT id, discord_user_id, vid FROM user_data")
+                        rows = await cursor.fetchall()
+
+                keys = _keys([(row[1], row[2]) for row in rows])
+                bloom = BloomFilter(
+                    max(len(keys) * CAPACITY_HEADROOM, MIN_CAPACITY), self.config.fp_rate, self.config.max_bytes
+                )
+                # Hashing a large table takes long enough to stall the event loop
+                await asyncio.to_thread(bloom.update, keys)
+                bloom.update(self._added_during_rebuild)
+            finally:
+                self._added_during_rebuild = None
+
+            self._bloom = bloom
+            self._last_user_id = max((row[0] for row in rows), default=0)
+            self._last_handoff_id = last_handoff_id
+            self._synced_at = started
+            self._built_at = built_at
+
+        self._report()
+        logger.info(
+            f"Identity filter built from {len(rows)} user(s) in {time.monotonic() - started:.2f}s: "
+            f"{bloom.count} keys, {format_bytes(bloom.nbytes)}, {bloom.hash_count} hashes, "
+            f"expected false positives {bloom.expected_fp_rate():.2%} "
+            f"(target {self.config.fp_rate:.2%} at {bloom.capacity} keys)"
+        )
+
+    async def _sync(self) -> bool:
+        """Add user_data rows and handoffs created since the last sync; returns False if it failed."""
+        delay = self._last_sync_started + self.config.sync_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        try:
+            async with self._lock:
+                started = self._last_sync_started = time.monotonic()
+                pool = get_pool().pool
+                if not pool:
+                    return False
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(
+                            "SELECT id, discord_user_id, vid FROM user_data WHERE id > %s", (self._last_user_id,)
+                        )
+                        users = await cursor.fetchall()
+                        await cursor.execute(
+                            "SELECT id, discord_user_id, vid FROM member_handoffs WHERE id > %s", (self._last_handoff_id,)
+                        )
+                        handoffs = await cursor.fetchall()
+
+                self._last_user_id = max((row[0] for row in users), default=self._last_user_id)
+                self._last_handoff_id = max((row[0] for row in handoffs), default=self._last_handoff_id)
+                rows = [(row[1], row[2]) for row in list(users) + list(handoffs)]
+                self._bloom.update(_keys(rows))
+                self._forget_negative(rows)
+                self._synced_at = started
+        except Exception as e:
+            logger.warning(f"Identity filter sync failed, letting joins through: {e}")
+            return False
+
+        if rows:
+            self._report()
+        return True
+
+    async def _sync_after(self, arrived: float) -> bool:
+        """Wait for a sync that started after `arrived`; returns False if syncing failed."""
+        while self._synced_at < arrived:
+            if self._sync_task is None or self._sync_task.done():
+                self._sync_task = asyncio.create_task(self._sync())
+            if not await asyncio.shield(self._sync_task):
+                return False
+        return True
+
+    def _check(self, discord_user_id: int, vid: Optional[str]) -> bool:
+        negative = self._negative.get(discord_user_id)
+        if negative is not None:
+            if negative[0] > time.monotonic():
+                return False
+            del self._negative[discord_user_id]
+        return f"d:{discord_user_id}" in self._bloom or (vid is not None and f"v:{vid}" in self._bloom)
+
+    async def may_exist(self, discord_user_id: int, vid: Optional[str]) -> bool:
+        """
+        Check whether a joining member may have a user_data row.
+
+        Args:
+            discord_user_id: Discord user ID
+            vid: VID parsed from the display name, if any
+
+        Returns:
+            False if the member is definitely unknown; True if they may be
+            known or the filter cannot tell (not built yet, sync failed)
+        """
+        if not self.ready:
+            IDENTITY_FILTER_CHECKS.inc(result="not_ready")
+            return True
+
+        arrived = time.monotonic()
+        if self._check(discord_user_id, vid):
+            IDENTITY_FILTER_CHECKS.inc(result="pass")
+            return True
+        if not await self._sync_after(arrived):
+            IDENTITY_FILTER_CHECKS.inc(result="sync_failed")
+            return True
+        if self._check(discord_user_id, vid):
+            IDENTITY_FILTER_CHECKS.inc(result="pass_after_sync")
+            return True
+        IDENTITY_FILTER_CHECKS.inc(result="reject")
+        return False
+
+    def add(self, discord_user_id: Optional[int] = None, vid: Optional[str] = None) -> None:
+        """Add keys written by the bot itself."""
+        keys = _keys([(str(discord_user_id) if discord_user_id else None, vid)])
+        if self._bloom is not None:
+            self._bloom.update(keys)
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.extend(keys)
+        if discord_user_id:
+            self._negative.pop(discord_user_id, None)
+
+    def remember_missing(self, discord_user_id: int, vid: Optional[str]) -> None:
+        """Cache that a member was resolved as unknown, until the TTL or a sync says otherwise."""
+        if not self.config.negative_ttl:
+            return
+        self._negative[discord_user_id] = (time.monotonic() + self.config.negative_ttl, vid)
+        self._negative.move_to_end(discord_user_id)
+        while len(self._negative) > self.config.negative_size:
+            self._negative.popitem(last=False)
+
+    def _forget_negative(self, rows: IdentityKeys) -> None:
+        """Drop negative entries for members that just got a user_data row or handoff."""
+        if not rows or not self._negative:
+            return
+        discord_ids = {discord_user_id for discord_user_id, _ in rows if discord_user_id}
+        vids = {vid for _, vid in rows if vid}
+        for discord_user_id, (_, vid) in list(self._negative.items()):
+            if str(discord_user_id) in discord_ids or (vid is not None and vid in vids):
+                del self._negative[discord_user_id]
+
+    def snapshot(self) -> Optional[Tuple[Dict[str, Any], Sections]]:
+        """Metadata and sections for the cache snapshot; None before the filter is built."""
+        if self._bloom is None:
+            return None
+        now, wall = time.monotonic(), time.time()
+        # Expiry times are monotonic; store them as wall clock times
+        negative = [
+            [discord_user_id, vid, wall + expires - now]
+            for discord_user_id, (expires, vid) in self._negative.items()
+            if expires > now
+        ]
+        meta = {
+            "bloom": self._bloom.state(),
+            "built_at": self._built_at,
+            "last_user_id": self._last_user_id,
+            "last_handoff_id": self._last_handoff_id,
+        }
+        sections = {
+            BLOOM_SECTION: (self._bloom.to_bytes(), False),
+            NEGATIVE_SECTION: (json.dumps(negative).encode(), True),
+        }
+        return meta, sections
+
+    def restore(self, snapshot: Snapshot, meta: Dict[str, Any]) -> bool:
+        """
+        Restore the filter from a cache snapshot instead of building it.
+
+        Args:
+            snapshot: Open snapshot
+            meta: Metadata written by snapshot()
+
+        Returns:
+            False if the snapshot is older than the rebuild interval or has
+            no filter, in which case the filter has to be built
+
+        Raises:
+            SnapshotError: If a section is damaged
+        """
+        age = time.time() - meta["built_at"]
+        if age >= self.config.rebuild_interval * 60:
+            logger.info(f"Identity filter in the snapshot was built {age / 60:.0f} min ago, rebuilding instead")
+            return False
+        data = snapshot.section(BLOOM_SECTION)
+        if data is None:
+            return False
+        bloom = BloomFilter.from_state(meta["bloom"], data)
+
+        negative = snapshot.section(NEGATIVE_SECTION)
+        now, wall = time.monotonic(), time.time()
+        self._negative.clear()
+        if negative is not None and self.config.negative_ttl:
+            for discord_user_id, vid, expires in json.loads(negative)[-self.config.negative_size:]:
+                if expires > wall:
+                    self._negative[discord_user_id] = (now + expires - wall, vid)
+
+        self._bloom = bloom
+        self._built_at = meta["built_at"]
+        self._last_user_id = meta["last_user_id"]
+        self._last_handoff_id = meta["last_handoff_id"]
+        # The first miss syncs the rows created since the snapshot
+        self._synced_at = 0.0
+        self._report()
+        logger.info(
+            f"Identity filter restored from snapshot (built {age / 60:.0f} min ago): {bloom.count} keys, "
+            f"{format_bytes(bloom.nbytes)}, {len(self._negative)} negative cache entries"
+        )
+        return True
+
+    def _report(self) -> None:
+        IDENTITY_FILTER_BYTES.set(self._bloom.nbytes)
+        IDENTITY_FILTER_FP_RATE.set(self._bloom.expected_fp_rate())
@@ -0,0 +1,547 @@
+"""Persistent background jobs for long-running staff operations.
+
+A job is run by one replica at a time: the replica that starts, resumes
+or takes over a job holds it under a lease in bot_jobs (owner and
+lease_expires_at, as for work_claims batches) and renews it with every
+checkpoint save. A job whose lease expired (its replica died) is taken
+over by the next replica that looks for abandoned jobs.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+from ..database.pool import get_pool
+from .claims import default_owner_id
+from ..utils.exceptions import BotError
+from ..utils.shutdown import SHUTDOWN
+
+logger = logging.getLogger("discord")
+
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_CANCELLED = "cancelled"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+RESUMABLE_STATES = (JOB_CANCELLED, JOB_FAILED)
+
+JOB_COLUMNS = (
+    "id, kind, status, params, checkpoint, guild_id, channel_id, message_id, "
+    "created_by, created_at, updated_at, owner"
+)
+
+
+class JobError(BotError):
+    """Raised when a job operation is not possible."""
+    pass
+
+
+@dataclass
+class Job:
+    """A persisted background job."""
+    id: int
+    kind: str
+    status: str
+    params: Dict[str, Any]
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    guild_id: Optional[int] = None
+    channel_id: Optional[int] = None
+    message_id: Optional[int] = None
+    created_by: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    owner: Optional[str] = None  # replica holding the lease
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        """Build a Job from a row selected with JOB_COLUMNS."""
+        return cls(
+            id=row[0],
+            kind=row[1],
+            status=row[2],
+            params=json.loads(row[3]) if row[3] else {},
+            checkpoint=json.loads(row[4]) if row[4] else {},
+            guild_id=int(row[5]) if row[5] else None,
+            channel_id=int(row[6]) if row[6] else None,
+            message_id=int(row[7]) if row[7] else None,
+            created_by=int(row[8]) if row[8] else None,
+            created_at=row[9],
+            updated_at=row[10],
+            owner=row[11]
+        )
+
+
+class JobStore:
+    """Reads and writes jobs in the bot_jobs table."""
+
+    def __init__(self, owner: Optional[str] = None, lease_seconds: int = 120):
+        """
+        Initialize job store.
+
+        Args:
+            owner: Replica identifier (default: hostname:pid)
+            lease_seconds: How long a job stays owned without a checkpoint save
+        """
+        self.owner = owner or default_owner_id()
+        self.lease_seconds = lease_seconds
+
+    def _pool(self):
+        pool = get_pool().pool
+        if not pool:
+            raise JobError("Database pool not available")
+        return pool
+
+    async def _execute(self, sql: str, params: tuple = ()) -> int:
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                await conn.commit()
+                return cursor.lastrowid if sql.lstrip().upper().startswith("INSERT") else cursor.rowcount
+
+    async def _fetch(self, sql: str, params: tuple = ()) -> List[Job]:
+        async with self._pool().acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return [Job.from_row(row) for row in await cursor.fetchall()]
+
+    async def create(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        guild_id: Optional[int],
+        created_by: Optional[int]
+    ) -> int:
+        """Insert a queued job owned by this replica and return its ID."""
+        now = datetime.now()
+        return await self._execute(
+            """INSERT INTO bot_jobs
+               (kind, status, params, checkpoint, guild_id, created_by, created_at, updated_at, owner, lease_expires_at)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW() + INTERVAL %s SECOND)""",
+            (kind, JOB_QUEUED, json.dumps(params), json.dumps({}),
+             str(guild_id) if guild_id else None, str(created_by) if created_by else None, now, now,
+             self.owner, self.lease_seconds)
+        )
+
+    async def get(self, job_id: int) -> Optional[Job]:
+        """Get a job by ID."""
+        jobs = await self._fetch(f"SELECT {JOB_COLUMNS} FROM bot_jobs WHERE id = %s", (job_id,))
+        return jobs[0] if jobs else None
+
+    async def list_recent(self, guild_id: int, limit: int = 10) -> List[Job]:
+        """List the most recent jobs of a guild."""
+        return await self._fetch(
+            f"SELECT {JOB_COLUMNS} FROM bot_jobs WHERE guild_id = %s ORDER BY id DESC LIMIT %s",
+            (str(guild_id), limit)
+        )
+
+    async def claim_abandoned(self, can_run: Callable[[Job], bool]) -> List[Job]:
+        """
+        Take over queued or running jobs whose lease has expired.
+
+        Rows locked by another replica's claim transaction are skipped rather
+        than waited for, so each abandoned job is taken over by one replica.
+
+        Args:
+            can_run: Whether this replica can run a job (e.g. sees its guild)
+
+        Returns:
+            The claimed jobs
+        """
+        async with self._pool().acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        f"""SELECT {JOB_COLUMNS} FROM bot_jobs
+                            WHERE status IN (%s, %s) AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                            ORDER BY id
+                            FOR UPDATE SKIP LOCKED""",
+                        ACTIVE_STATES
+                    )
+                    jobs = [job for job in map(Job.from_row, await cursor.fetchall()) if can_run(job)]
+                    if jobs:
+                        await cursor.execute(
+                            f"""UPDATE bot_jobs SET owner = %s, lease_expires_at = NOW() + INTERVAL %s SECOND
+                                WHERE id IN ({', '.join(['%s'] * len(jobs))})""",
+                            (self.owner, self.lease_seconds) + tuple(job.id for job in jobs)
+                        )
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+        for job in jobs:
+            job.owner = self.owner
+        return jobs
+
+    async def save(self, job: Job) -> bool:
+        """
+        Persist status, checkpoint and progress message of a job this
+        replica owns, renewing its lease.
+
+        A job cancelled in the database (possibly by another process) stays
+        cancelled: only a save of the cancelled status itself is written.
+
+        Returns:
+            False if the save was refused because the job was cancelled or
+            another replica has taken it over
+        """
+        job.updated_at = datetime.now()
+        guard, guard_params = ("", ()) if job.status == JOB_CANCELLED else (" AND status <> %s", (JOB_CANCELLED,))
+        updated = await self._execute(
+            f"""UPDATE bot_jobs
+                SET status = %s, checkpoint = %s, channel_id = %s, message_id = %s, updated_at = %s,
+                    lease_expires_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s AND owner = %s{guard}""",
+            (job.status, json.dumps(job.checkpoint),
+             str(job.channel_id) if job.channel_id else None,
+             str(job.message_id) if job.message_id else None,
+             job.updated_at, self.lease_seconds, job.id, self.owner) + guard_params
+        )
+        if updated:
+            return True
+        # No row is also reported when nothing changed
+        current = await self.get(job.id)
+        return (
+            current is not None and current.owner == self.owner
+            and (job.status == JOB_CANCELLED or current.status != JOB_CANCELLED)
+        )
+
+    async def claim(self, job_id: int, from_states: Tuple[str, ...]) -> bool:
+        """
+        Queue a job in one of from_states and take it over for this replica.
+
+        Returns:
+            False if the job was in another state
+        """
+        placeholders = ", ".join(["%s"] * len(from_states))
+        updated = await self._execute(
+            f"""UPDATE bot_jobs
+                SET status = %s, owner = %s, lease_expires_at = NOW() + INTERVAL %s SECOND, updated_at = NOW()
+                WHERE id = %s AND status IN ({placeholders})""",
+            (JOB_QUEUED, self.owner, self.lease_seconds, job_id) + tuple(from_states)
+        )
+        return updated > 0
+
+    async def release(self, job: Job) -> None:
+        """Give up this replica's lease so another replica can take the job over."""
+        await self._execute(
+            "UPDATE bot_jobs SET owner = NULL, lease_expires_at = NULL WHERE id = %s AND owner = %s",
+            (job.id, self.owner)
+        )
+
+    async def set_status(self, job_id: int, from_states: Tuple[str, ...], status: str) -> bool:
+        """
+        Move a job to a status if it is in one of from_states.
+
+        Returns:
+            False if the job was in another state
+        """
+        placeholders = ", ".join(["%s"] * len(from_states))
+        updated = await self._execute(
+            f"UPDATE bot_jobs SET status = %s, updated_at = NOW() WHERE id = %s AND status IN ({placeholders})",
+            (status, job_id) + tuple(from_states)
+        )
+        return updated > 0
+
+
+JobHandler = Callable[[Job, "JobContext"], Awaitable[str]]
+
+
+class JobContext:
+    """Checkpointing and progress reporting for a running job."""
+
+    CHECKPOINT_INTERVAL = 10.0  # seconds
+    PROGRESS_INTERVAL = 5.0  # seconds
+
+    def __init__(self, manager: "JobManager", job: Job):
+        self.manager = manager
+        self.job = job
+        self._last_checkpoint = time.monotonic()
+        self._last_progress = 0.0
+
+    @property
+    def checkpoint(self) -> Dict[str, Any]:
+        """Mutable checkpoint state, persisted by save()."""
+        return self.job.checkpoint
+
+    async def save(self, force: bool = False) -> None:
+        """
+        Persist the checkpoint, at most every CHECKPOINT_INTERVAL seconds.
+
+        Args:
+            force: Persist regardless of the interval
+
+        Raises:
+            asyncio.CancelledError: If the job was cancelled in another process
+        """
+        now = time.monotonic()
+        if force or now - self._last_checkpoint >= self.CHECKPOINT_INTERVAL:
+            if not await self.manager.store.save(self.job):
+                # /jobs cancel ran in another process, or this replica lost
+                # the lease (e.g. it could not save for too long) and
+                # another one took the job over; stop like a local cancel
+                current = await self.manager.store.get(self.job.id)
+                if current is None or current.status == JOB_CANCELLED:
+                    self.job.status = JOB_CANCELLED
+                raise asyncio.CancelledError()
+            self._last_checkpoint = now
+
+    async def report(self, text: str, force: bool = False) -> None:
+        """
+        Edit the job's progress message, at most every PROGRESS_INTERVAL seconds.
+
+        Args:
+            text: Message content
+            force: Edit regardless of the interval
+        """
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.PROGRESS_INTERVAL:
+            self._last_progress = now
+            await self.manager.update_progress_message(self.job, text)
+
+
+class JobManager:
+    """Runs persisted jobs in the background and resumes them after restarts."""
+
+    def __init__(self, bot: discord.Client, lease_seconds: int = 120):
+        """
+        Initialize job manager.
+
+        Args:
+            bot: Bot instance (used to find progress message channels)
+            lease_seconds: How long a job stays owned without a checkpoint save
+        """
+        self.bot = bot
+        self.store = JobStore(lease_seconds=lease_seconds)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._running: Dict[int, Job] = {}
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the handler for a job kind.
+
+        The handler resumes from job.checkpoint, calls ctx.save() (at
+        least every few seconds, it renews the job's lease) and
+        ctx.report() as it goes and returns the final summary text. Reports
+        and summary are posted in the channel the job was started from, so
+        they must not name users.
+        """
+        self._handlers[kind] = handler
+
+    @property
+    def running_count(self) -> int:
+        """Number of jobs running in this process."""
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def is_running(self, job_id: int) -> bool:
+        """Check if a job is running in this process."""
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    async def enqueue(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        channel: discord.abc.Messageable,
+        guild_id: Optional[int],
+        created_by: Optional[int]
+    ) -> Job:
+        """
+        Persist a new job, post its progress message and start it.
+
+        Args:
+            kind: Registered job kind
+            params: Handler parameters (JSON serialisable)
+            channel: Channel for the progress message
+            guild_id: Guild the job belongs to
+            created_by: Discord user ID of the requester
+
+        Returns:
+            The started job
+        """
+        if kind not in self._handlers:
+            raise JobError(f"Unknown job kind: {kind}")
+        if not SHUTDOWN.accepting:
+            raise JobError("The bot is shutting down")
+
+        job_id = await self.store.create(kind, params, guild_id, created_by)
+        job = await self.store.get(job_id)
+        message = await channel.send(f"Job #{job.id} ({job.kind}) queued...")
+        job.channel_id = message.channel.id
+        job.message_id = message.id
+        await self.store.save(job)
+        self._start(job)
+        return job
+
+    async def _get(self, job_id: int, guild_id: int) -> Job:
+        """Get a job of a guild; jobs of other guilds are reported as not found."""
+        job = await self.store.get(job_id)
+        if not job or job.guild_id != guild_id:
+            raise JobError(f"Job #{job_id} not found")
+        return job
+
+    async def cancel(self, job_id: int, guild_id: int) -> Job:
+        """
+        Cancel a queued or running job, keeping its checkpoint.
+
+        A job running in another process stops at its next checkpoint save.
+        """
+        job = await self._get(job_id, guild_id)
+        if job.status not in ACTIVE_STATES:
+            raise JobError(f"Job #{job_id} is {job.status}")
+        if not await self.store.set_status(job_id, ACTIVE_STATES, JOB_CANCELLED):
+            raise JobError(f"Job #{job_id} is no longer active")
+
+        job.status = JOB_CANCELLED
+        task = self._tasks.get(job_id)
+        if task and not task.done():
+            # The runner persists the checkpoint
+            job = self._running[job_id]
+            job.status = JOB_CANCELLED
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return job
+
+    async def resume(self, job_id: int, guild_id: int) -> Job:
+        """Restart a cancelled or failed job from its last checkpoint."""
+        job = await self._get(job_id, guild_id)
+        if self.is_running(job_id):
+            raise JobError(f"Job #{job_id} is already running")
+        if not SHUTDOWN.accepting:
+            raise JobError("The bot is shutting down")
+        if job.status not in RESUMABLE_STATES:
+            raise JobError(f"Job #{job_id} is {job.status}")
+        if not await self.store.claim(job_id, RESUMABLE_STATES):
+            raise JobError(f"Job #{job_id} was resumed elsewhere")
+
+        job.status = JOB_QUEUED
+        self._start(job)
+        return job
+
+    async def resume_pending(self) -> None:
+        """
+        Take over and resume abandoned jobs, for guilds this bot can see.
+
+        Jobs of a stopped or dead replica are abandoned once their lease
+        expires (at once after a clean shutdown); run this at startup and
+        periodically. Every replica may call it, each job is resumed by one.
+        """
+        if not SHUTDOWN.accepting:
+            return
+        try:
+            jobs = await self.store.claim_abandoned(
+                lambda job: job.kind in self._handlers and not self.is_running(job.id)
+                and (not job.guild_id or self.bot.get_guild(job.guild_id) is not None)
+            )
+        except Exception as e:
+            logger.error(f"Could not claim pending jobs: {e}")
+            return
+
+        for job in jobs:
+            logger.info(f"Resuming job #{job.id} ({job.kind}) from checkpoint {job.checkpoint}")
+            self._start(job)
+
+    async def stop(self) -> int:
+        """
+        Stop the jobs running in this process for shutdown.
+
+        Each job saves its checkpoint, stays running in the database and
+        gives up its lease, so another replica or the next start resumes it.
+
+        Returns:
+            Number of stopped jobs
+        """
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    def _start(self, job: Job) -> None:
+        task = asyncio.create_task(self._run(job), name=f"job-{job.id}")
+        self._tasks[job.id] = task
+        self._running[job.id] = job
+        task.add_done_callback(lambda _: self._forget(job.id))
+
+    def _forget(self, job_id: int) -> None:
+        self._tasks.pop(job_id, None)
+        self._running.pop(job_id, None)
+
+    async def _run(self, job: Job) -> None:
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            logger.error(f"No handler registered for job #{job.id} ({job.kind})")
+            return
+
+        ctx = JobContext(self, job)
+        job.status = JOB_RUNNING
+        if not await self.store.save(job):
+            logger.info(f"Job #{job.id} ({job.kind}) was cancelled before it started")
+            return
+        logger.info(f"Job #{job.id} ({job.kind}) started")
+
+        try:
+            summary = await handler(job, ctx)
+        except asyncio.CancelledError:
+            # Cancelled by /jobs cancel (status already set), by shutdown or
+            # a lost lease (status stays running so another replica resumes it)
+            try:
+                await asyncio.shield(self.store.save(job))
+                if job.status == JOB_CANCELLED:
+                    await asyncio.shield(self.update_progress_message(job, f"Job #{job.id} cancelled."))
+                else:
+                    await asyncio.shield(self.store.release(job))
+            except Exception as e:
+                logger.warning(f"Could not persist checkpoint of job #{job.id}: {e}")
+            logger.info(f"Job #{job.id} stopped ({job.status}) at checkpoint {job.checkpoint}")
+            raise
+        except Exception as e:
+            logger.exception(f"Job #{job.id} ({job.kind}) failed: {e}")
+            job.status = JOB_FAILED
+            await self.store.save(job)
+            await self.update_progress_message(job, f"Job #{job.id} failed: {e}")
+            return
+
+        job.status = JOB_COMPLETED
+        if not await self.store.save(job):
+            # Cancelled in another process just as it finished
+            job.status = JOB_CANCELLED
+        await self.update_progress_message(job, summary)
+        logger.info(f"Job #{job.id} ({job.kind}) completed")
+
+    async def update_progress_message(self, job: Job, text: str) -> None:
+        """Edit the job's progress message in place, reposting it if it was deleted."""
+        if not job.channel_id:
+            return
+        channel = self.bot.get_channel(job.channel_id)
+        if channel is None:
+            return
+
+        text = text[:2000]
+        try:
+            if job.message_id:
+                await channel.get_partial_message(job.message_id).edit(content=text)
+                return
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            logger.warning(f"Could not update progress message of job #{job.id}: {e}")
+            return
+
+        try:
+            message = await channel.send(text)
+            job.message_id = message.id
+            await self.store.save(job)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not post progress message of job #{job.id}: {e}")
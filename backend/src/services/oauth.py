@@ -2,14 +2,18 @@
 
 import logging
 import asyncio
+import uuid
 from datetime import datetime
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any, Tuple, Union
 import aiohttp
 from aiohttp import ClientTimeout, ClientError
 
 from ..config.settings import OAuthConfig
 from ..database.pool import get_pool
-from ..utils.exceptions import OAuthError, TokenRefreshError
+from ..utils.exceptions import OAuthError, RateLimitedError, TokenRefreshError, TokenRevokedError
+from ..utils.metrics import IVAO_REQUEST_SECONDS, TOKEN_QUARANTINE, http_trace_config
+from ..utils.shutdown import SHUTDOWN
+from ..utils.tracing import span, traced
 
 logger = logging.getLogger("discord")
 
@@ -17,11 +21,14 @@ logger = logging.getLogger("discord")
 class OAuthService:
     """Handles IVAO OAuth2 operations with retry logic."""
     
-    TOKEN_URL = "https://api.ivao.aero/v2/oauth/token"
-    USER_INFO_URL = "https://api.ivao.aero/v2/users/me"
+    TOKEN_PATH = "/v2/oauth/token"
+    USER_INFO_PATH = "/v2/users/me"
     MAX_RETRIES = 3
     RETRY_DELAY = 1.0  # seconds
+    MAX_RETRY_AFTER = 30.0  # seconds; longer Retry-After values are capped
     REQUEST_TIMEOUT = 10  # seconds
+    TOKEN_CLAIM_SECONDS = 60  # lease on a refresh token while it is exchanged
+    CLAIM_POLL_INTERVAL = 0.5  # seconds between checks while another worker holds the claim
     
     def __init__(self, config: OAuthConfig):
         """
@@ -31,20 +38,50 @@ class OAuthService:
             config: OAuth configuration
         """
         self.config = config
+        self.token_url = f"{config.api_url}{self.TOKEN_PATH}"
+        self.user_info_url = f"{config.api_url}{self.USER_INFO_PATH}"
+        # Metric label per API endpoint
+        self.endpoints = {self.token_url: "token", self.user_info_url: "users_me"}
         self._session: Optional[aiohttp.ClientSession] = None
     
     async def _get_session(self) -> aiohttp.ClientSession:
         """Get or create HTTP session."""
         if self._session is None or self._session.closed:
             timeout = ClientTimeout(total=self.REQUEST_TIMEOUT)
-            self._session = aiohttp.ClientSession(timeout=timeout)
+            trace_config = http_trace_config(
+                IVAO_REQUEST_SECONDS,
+                lambda params: {"endpoint": self.endpoints.get(str(params.url), params.url.path)}
+            )
+            self._session = aiohttp.ClientSession(timeout=timeout, trace_configs=[trace_config])
         return self._session
     
+    async def warmup(self) -> None:
+        """
+        Open the HTTP session and a keep-alive connection to the IVAO API.
+        
+        DNS resolution and the TLS handshake then happen during startup
+        instead of on the first member join.
+        """
+        session = await self._get_session()
+        try:
+            async with session.head(self.config.api_url) as response:
+                await response.read()
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"IVAO API warmup failed, the first request will connect instead: {e}")
+    
     async def close(self) -> None:
         """Close HTTP session."""
         if self._session and not self._session.closed:
             await self._session.close()
     
+    def _retry_delay(self, response: aiohttp.ClientResponse, retry_count: int) -> float:
+        """Seconds to wait before retrying a rate limited request."""
+        try:
+            delay = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            delay = self.RETRY_DELAY * (retry_count + 1)
+        return min(max(delay, 0.0), self.MAX_RETRY_AFTER)
+    
     async def _refresh_token_request(
         self,
         refresh_token: str,
@@ -61,6 +98,8 @@ class OAuthService:
             Token response data
             
         Raises:
+            RateLimitedError: If IVAO rate limited the request (the token was not used)
+            TokenRevokedError: If IVAO rejected the refresh token for good
             TokenRefreshError: If refresh fails after retries
         """
         session = await self._get_session()
@@ -75,7 +114,12 @@ class OAuthService:
         }
         
         try:
-            async with session.post(self.TOKEN_URL, headers=headers, data=data) as response:
+            async with session.post(self.token_url, headers=headers, data=data) as response:
+                if response.status == 429:
+                    # Rate limited before the token was used; the caller waits
+                    # and resends without holding the token's claim
+                    raise RateLimitedError("Rate limited by IVAO", self._retry_delay(response, retry_count))
+                
                 result = await response.json()
                 
                 if response.status == 200 and 'access_token' in result:
@@ -85,7 +129,9 @@ class OAuthService:
                     error_desc = result.get('error_description', 'No description')
                     
                     # Don't retry on certain errors
-                    if error_type in ('invalid_grant', 'invalid_client', 'unauthorized_client'):
+                    if error_type == 'invalid_grant':
+                        raise TokenRevokedError(f"{error_type}: {error_desc}")
+                    if error_type in ('invalid_client', 'unauthorized_client'):
                         raise TokenRefreshError(f"{error_type}: {error_desc}")
                     
                     # Retry on server errors
@@ -97,6 +143,8 @@ class OAuthService:
                 else:
                     raise TokenRefreshError(f"Unexpected response: {result}")
                     
+        except TokenRefreshError:
+            raise
         except ClientError as e:
             if retry_count < self.MAX_RETRIES:
                 await asyncio.sleep(self.RETRY_DELAY * (retry_count + 1))
@@ -105,6 +153,7 @@ class OAuthService:
         except Exception as e:
             raise TokenRefreshError(f"Unexpected error: {e}") from e
     
+    @traced("oauth.refresh_token")
     async def refresh_token(
         self,
         user_id: Optional[int] = None,
@@ -133,61 +182,180 @@ class OAuthService:
         if not user_id and not vid:
             raise OAuthError("Either user_id or vid must be provided")
         
-        # Get refresh token from database
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                if user_id:
-                    await cursor.execute(
-                        "SELECT refresh_token FROM user_data WHERE discord_user_id = %s",
-                        (user_id,)
-                    )
-                else:
-                    await cursor.execute(
-                        "SELECT refresh_token FROM user_data WHERE vid = %s",
-                        (vid,)
-                    )
-                
-                result = await cursor.fetchone()
-                
-                if not result or not result[0]:
-                    identifier = f"user {user_id}" if user_id else f"VID {vid}"
-                    raise TokenRefreshError(
-                        f"No refresh token found for {identifier}. User needs to re-authenticate."
-                    )
-                
-                refresh_token = result[0]
+        identifier = f"user {user_id}" if user_id else f"VID {vid}"
+        token_data = await self._rotate_refresh_token(pool, user_id, vid, identifier)
+        
+        # Get user info
+        access_token = token_data['access_token']
+        user_info = await self.get_user_info(access_token)
+        
+        return user_info
+    
+    async def _rotate_refresh_token(
+        self,
+        pool,
+        user_id: Optional[int],
+        vid: Optional[str],
+        identifier: str
+    ) -> Dict[str, Any]:
+        """Exchange the stored refresh token and store the rotated one (see refresh_token)."""
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                # Once IVAO has rotated the token the new one must reach the
+                # database, so an attempt finishes even if the caller is cancelled
+                token_data = await SHUTDOWN.protect(
+                    "token_rotation", self._rotation_attempt(pool, user_id, vid, identifier)
+                )
+            except RateLimitedError as e:
+                # IVAO did not use the token: wait without holding the claim,
+                # and give up rather than delay a shutdown
+                if attempt == self.MAX_RETRIES or not SHUTDOWN.accepting:
+                    raise
+                logger.warning(f"IVAO rate limited the token request, retrying in {e.retry_after:.1f}s")
+                await asyncio.sleep(e.retry_after)
+                continue
+            if token_data is not None:
+                return token_data
+        raise TokenRefreshError(f"Refresh token of {identifier} kept changing during the rotation")
+    
+    async def _rotation_attempt(
+        self,
+        pool,
+        user_id: Optional[int],
+        vid: Optional[str],
+        identifier: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Claim the stored refresh token, exchange it and store the rotated one.
+        
+        No transaction or pool connection is held while IVAO answers. The
+        rotated token is stored with a compare-and-swap on the old one, so
+        a token the user stored by signing in again meanwhile is kept.
+        
+        Returns:
+            Token response, or None if IVAO rejected a token that was
+            replaced in the meantime (the caller retries with the new one)
+        """
+        owner = uuid.uuid4().hex
+        row_id, refresh_token = await self._claim_refresh_token(pool, user_id, vid, identifier, owner)
         
-        # Refresh the token
         try:
-            token_data = await self._refresh_token_request(refresh_token)
-        except TokenRefreshError as e:
-            identifier = f"user {user_id}" if user_id else f"VID {vid}"
-            logger.warning(f"Token refresh failed for {identifier}: {e}")
+            with span("ivao.token"):
+                token_data = await self._refresh_token_request(refresh_token)
+        except TokenRevokedError as e:
+            # Bulk refreshes skip the row until the user signs in again
+            # through the web flow, which clears these columns
+            with span("db.quarantine_refresh_token"):
+                quarantined = await self._execute(
+                    pool,
+                    """UPDATE user_data SET token_failure_reason = %s, token_failed_at = %s,
+                       token_failure_count = token_failure_count + 1,
+                       token_claim_owner = NULL, token_claim_expires_at = NULL
+                       WHERE id = %s AND refresh_token = %s""",
+                    (str(e)[:255], datetime.now(), row_id, refresh_token)
+                )
+            if not quarantined:
+                await self._release_claim(pool, row_id, owner)
+                return None
+            logger.warning(f"Refresh token of {identifier} was rejected, quarantining it: {e}")
+            TOKEN_QUARANTINE.inc(event="quarantined")
+            raise
+        except BaseException as e:
+            if isinstance(e, TokenRefreshError) and not isinstance(e, RateLimitedError):
+                logger.warning(f"Token refresh failed for {identifier}: {e}")
+            await self._release_claim(pool, row_id, owner)
             raise
         
-        # Update refresh token in database
         new_refresh_token = token_data.get('refresh_token')
+        stored = False
         if new_refresh_token:
-            async with pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    if user_id:
+            with span("db.store_refresh_token"):
+                stored = await self._execute(
+                    pool,
+                    """UPDATE user_data SET refresh_token = %s, refresh_token_date = %s,
+                       token_failure_reason = NULL, token_failed_at = NULL, token_failure_count = 0,
+                       token_claim_owner = NULL, token_claim_expires_at = NULL
+                       WHERE id = %s AND refresh_token = %s""",
+                    (new_refresh_token, datetime.now(), row_id, refresh_token)
+                )
+            if not stored:
+                logger.info(f"{identifier} signed in again during the token rotation, keeping the new sign-in's token")
+        if not stored:
+            await self._release_claim(pool, row_id, owner)
+        return token_data
+    
+    async def _claim_refresh_token(
+        self,
+        pool,
+        user_id: Optional[int],
+        vid: Optional[str],
+        identifier: str,
+        owner: str
+    ) -> Tuple[int, str]:
+        """
+        Take a short lease on a user's refresh token.
+        
+        IVAO refresh tokens are single use, so only one worker may send a
+        given token. While another worker holds the lease this waits for
+        it to store the rotated token and then claims that one.
+        
+        Returns:
+            (user_data ID, refresh token)
+        
+        Raises:
+            TokenRefreshError: If the user has no refresh token or another
+                worker held the claim for the whole lease
+        """
+        column, value = ("discord_user_id", user_id) if user_id else ("vid", vid)
+        deadline = asyncio.get_running_loop().time() + self.TOKEN_CLAIM_SECONDS
+        while True:
+            with span("db.claim_refresh_token"):
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
                         await cursor.execute(
-                            "UPDATE user_data SET refresh_token = %s, refresh_token_date = %s WHERE discord_user_id = %s",
-                            (new_refresh_token, datetime.now(), user_id)
+                            f"SELECT id, refresh_token FROM user_data WHERE {column} = %s LIMIT 1",
+                            (value,)
                         )
-                    else:
+                        result = await cursor.fetchone()
+                        if not result or not result[1]:
+                            raise TokenRefreshError(
+                                f"No refresh token found for {identifier}. User needs to re-authenticate."
+                            )
+                        row_id, refresh_token = result
                         await cursor.execute(
-                            "UPDATE user_data SET refresh_token = %s, refresh_token_date = %s WHERE vid = %s",
-                            (new_refresh_token, datetime.now(), vid)
+                            """UPDATE user_data SET token_claim_owner = %s,
+                               token_claim_expires_at = NOW() + INTERVAL %s SECOND
+                               WHERE id = %s AND refresh_token = %s
+                               AND (token_claim_expires_at IS NULL OR token_claim_expires_at < NOW())""",
+                            (owner, self.TOKEN_CLAIM_SECONDS, row_id, refresh_token)
                         )
-                    await conn.commit()
-        
-        # Get user info
-        access_token = token_data['access_token']
-        user_info = await self.get_user_info(access_token)
-        
-        return user_info
+                        if cursor.rowcount:
+                            return row_id, refresh_token
+            if asyncio.get_running_loop().time() >= deadline:
+                raise TokenRefreshError(f"Refresh token of {identifier} is being rotated by another worker")
+            await asyncio.sleep(self.CLAIM_POLL_INTERVAL)
+    
+    async def _release_claim(self, pool, row_id: int, owner: str) -> None:
+        try:
+            await self._execute(
+                pool,
+                """UPDATE user_data SET token_claim_owner = NULL, token_claim_expires_at = NULL
+                   WHERE id = %s AND token_claim_owner = %s""",
+                (row_id, owner)
+            )
+        except Exception as e:
+            # The lease runs out by itself
+            logger.warning(f"Could not release the refresh token claim on user_data #{row_id}: {e}")
+    
+    @staticmethod
+    async def _execute(pool, query: str, args: tuple) -> int:
+        """Run one autocommitted statement; returns the number of rows changed."""
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, args)
+                return cursor.rowcount
     
+    @traced("ivao.users_me")
     async def get_user_info(self, access_token: str) -> Dict[str, Any]:
         """
         Get user information from IVAO API.
@@ -206,18 +374,25 @@ class OAuthService:
             'Authorization': f'Bearer {access_token}'
         }
         
-        try:
-            async with session.get(self.USER_INFO_URL, headers=headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    error_data = await response.json()
-                    error_msg = error_data.get('error_description', f'HTTP {response.status}')
-                    raise OAuthError(f"Failed to get user info: {error_msg}")
-        except ClientError as e:
-            raise OAuthError(f"Network error getting user info: {e}") from e
-        except Exception as e:
-            raise OAuthError(f"Unexpected error getting user info: {e}") from e
+        for retry_count in range(self.MAX_RETRIES + 1):
+            try:
+                async with session.get(self.user_info_url, headers=headers) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    if response.status != 429:
+                        error_data = await response.json()
+                        error_msg = error_data.get('error_description', f'HTTP {response.status}')
+                        raise OAuthError(f"Failed to get user info: {error_msg}")
+                    if retry_count == self.MAX_RETRIES:
+                        raise OAuthError("Failed to get user info: rate limited by IVAO")
+                    delay = self._retry_delay(response, retry_count)
+            except ClientError as e:
+                raise OAuthError(f"Network error getting user info: {e}") from e
+            except Exception as e:
+                raise OAuthError(f"Unexpected error getting user info: {e}") from e
+            
+            logger.warning(f"IVAO rate limited the user info request, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
     
     async def get_user_info_for_discord_user(
         self,
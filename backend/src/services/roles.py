@@ -0,0 +1,177 @@
+"""Role and nickname planning from IVAO profiles."""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import discord
+
+from ..config.settings import DivisionConfig, get_settings
+
+# Staff position suffixes (after "<DIV>-") and the DivisionConfig role fields they grant
+ALL_STAFF_ROLES = (
+    "div_staff", "div_hq", "specops", "flightops", "atcops", "training", "web", "membership", "event", "pr",
+)
+STAFF_POSITION_ROLES: Dict[str, Sequence[str]] = {
+    # Director and Assistant Director -> all staff roles
+    "DIR": ALL_STAFF_ROLES,
+    "ADIR": ALL_STAFF_ROLES,
+    # Special Operations
+    "SOC": ("div_staff", "specops"),
+    "SOAC": ("div_staff", "specops"),
+    "SOA1": ("div_staff", "specops"),
+    # Flight Operations
+    "FOC": ("div_staff", "flightops"),
+    "FOAC": ("div_staff", "flightops"),
+    "FOA1": ("div_staff", "flightops"),
+    # ATC Operations
+    "AOC": ("div_staff", "atcops"),
+    "AOAC": ("div_staff", "atcops"),
+    "AOA1": ("div_staff", "atcops"),
+    # Training
+    "TC": ("div_staff", "training"),
+    "TAC": ("div_staff", "training"),
+    "TA1": ("div_staff", "training"),
+    # Web
+    "WM": ("div_staff", "web"),
+    "AWM": ("div_staff", "web"),
+    "WMA1": ("div_staff", "web"),
+    # Membership
+    "MC": ("div_staff", "membership"),
+    "MAC": ("div_staff", "membership"),
+    "MA1": ("div_staff", "membership"),
+    # Event
+    "EC": ("div_staff", "event"),
+    "EAC": ("div_staff", "event"),
+    "EA1": ("div_staff", "event"),
+    # Public Relations
+    "PRC": ("div_staff", "pr"),
+    "PRAC": ("div_staff", "pr"),
+    "PRA1": ("div_staff", "pr"),
+}
+
+MAX_NICKNAME_LENGTH = 32
+
+
+@dataclass
+class RolePlan:
+    """Roles and nickname to apply to a member."""
+    roles: List[discord.Role] = field(default_factory=list)  # granted roles the member does not have yet
+    granted: List[discord.Role] = field(default_factory=list)
+    nickname: Optional[str] = None
+    fallback_nickname: Optional[str] = None
+    reason: str = "IVAO authentication"
+
+    def add(self, role: Optional[discord.Role], member_roles: Sequence[discord.Role]) -> None:
+        """Grant a role if it exists; it is applied if the member does not have it yet."""
+        if role and role not in self.granted:
+            self.granted.append(role)
+            if role not in member_roles:
+                self.roles.append(role)
+
+    def nickname_applied(self, member: discord.Member) -> bool:
+        """Whether the member already has the planned nickname (or its fallback)."""
+        return not self.nickname or member.nick in (self.nickname, self.fallback_nickname)
+
+
+def profile_fingerprint(user_info: Dict[str, Any]) -> str:
+    """Hash of the IVAO profile fields that decide roles and nickname."""
+    positions = sorted(
+        position['id'] for position in user_info.get('userStaffPositions') or []
+        if isinstance(position, dict) and isinstance(position.get('id'), str)
+    )
+    fields = [
+        str(user_info.get('id', '')), user_info.get('divisionId') or '', bool(user_info.get('isStaff')),
+        user_info.get('firstName') or '', user_info.get('lastName') or '', positions,
+    ]
+    return hashlib.blake2b(json.dumps(fields).encode(), digest_size=16).hexdigest()
+
+
+def _member_nickname(name: str, vid: Any, member_name: str) -> str:
+    nickname = f"{name} | {vid}"
+    return nickname if len(nickname) < MAX_NICKNAME_LENGTH else f"{member_name} | {vid}"
+
+
+def plan_roles(
+    division: DivisionConfig,
+    guild: discord.Guild,
+    member: discord.Member,
+    user_info: Dict[str, Any]
+) -> RolePlan:
+    """
+    Work out which roles and nickname a member should get.
+
+    Args:
+        division: Division configuration of the member's guild
+        guild: Guild (used to look up role objects)
+        member: Member being verified
+        user_info: IVAO user info
+
+    Returns:
+        RolePlan with the missing roles and the nickname to set
+    """
+    member_roles = member.roles
+    first_name = user_info.get('firstName', '')
+    last_name = user_info.get('lastName', '')
+    vid = user_info.get('id', '')
+    div = user_info.get('divisionId', '')
+    name = f"{first_name} {last_name}" if first_name and last_name else member.name
+    plan = RolePlan()
+
+    def role(role_field: str) -> Optional[discord.Role]:
+        return guild.get_role(getattr(division, role_field))
+
+    # Not staff - regular member
+    if not user_info.get('isStaff'):
+        plan.nickname = _member_nickname(name, vid, member.name)
+        plan.add(role("div_member" if div == division.division else "non_div_ivao_member"), member_roles)
+        plan.add(role("vid_verified"), member_roles)
+        return plan
+
+    # Staff from other division
+    if div != division.division:
+        plan.nickname = _member_nickname(name, vid, member.name)
+        plan.add(role("vid_verified"), member_roles)
+        plan.add(role("non_div_ivao_member"), member_roles)
+        return plan
+
+    # Staff of this division: map staff positions to roles
+    plan.reason = "IVAO staff authentication"
+    prefix = f"{division.division}-"
+    position_names: List[str] = []
+    for position in user_info.get('userStaffPositions') or []:
+        if not isinstance(position, dict) or not isinstance(position.get('id'), str):
+            continue
+        position_id = position['id']
+        if not position_id.startswith(prefix):
+            continue
+        position_name = position_id[len(prefix):]
+        role_fields = STAFF_POSITION_ROLES.get(position_name)
+        if role_fields is None:
+            continue
+
+        for role_field in role_fields:
+            plan.add(role(role_field), member_roles)
+        if position_name not in position_names:
+            position_names.append(position_name)
+            # Add base member and verified roles
+            plan.add(role("div_member"), member_roles)
+            plan.add(role("vid_verified"), member_roles)
+
+    # Update nickname with staff position
+    nickname = f"{name} | {division.division} Staff"
+    if position_names:
+        with_positions = f"{name} | {division.division}-{'/'.join(position_names)}"
+        if len(with_positions) <= MAX_NICKNAME_LENGTH:
+            nickname = with_positions
+    plan.nickname = nickname
+    plan.fallback_nickname = f"{member.name} | {division.division} Staff"
+    return plan
+
+
+def is_division_staff(member: discord.Member) -> bool:
+    """Check if a member has the staff role of their guild's division."""
+    division = get_settings().division_for(member.guild.id)
+    staff_role = member.guild.get_role(division.div_staff)
+    return staff_role is not None and staff_role in member.roles
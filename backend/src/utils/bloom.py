@@ -0,0 +1,83 @@
+"""Bloom filter for set membership with a bounded false-positive rate."""
+
+import hashlib
+import math
+from typing import Any, Dict, Iterable
+
+
+class BloomFilter:
+    """
+    Probabilistic set: "maybe present" or "definitely absent".
+
+    Uses double hashing over one 128-bit BLAKE2b digest per key, so a
+    lookup costs a single hash call however many bit positions are probed.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float, max_bytes: int = 0):
+        """
+        Initialize filter.
+
+        Args:
+            capacity: Number of keys the filter is sized for
+            fp_rate: Target false-positive rate at capacity
+            max_bytes: Upper bound for the bit array (0 = no bound); a bound
+                below the optimal size raises the false-positive rate
+        """
+        capacity = max(capacity, 1)
+        bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        if max_bytes:
+            bits = min(bits, max_bytes * 8)
+        self.size = max(bits, 64)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return ((first + i * second) % size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        bits = self._bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def state(self) -> Dict[str, Any]:
+        """Parameters needed to restore the filter from its bits (see from_state)."""
+        return {"size": self.size, "hash_count": self.hash_count, "capacity": self.capacity, "count": self.count}
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], data: bytes) -> "BloomFilter":
+        """Restore a filter from state() and to_bytes()."""
+        bloom = cls.__new__(cls)
+        bloom.size = state["size"]
+        bloom.hash_count = state["hash_count"]
+        bloom.capacity = state["capacity"]
+        bloom.count = state["count"]
+        bloom._bits = bytearray(data)
+        if len(bloom._bits) != (bloom.size + 7) // 8:
+            raise ValueError(f"Expected {(bloom.size + 7) // 8} bytes of filter bits, got {len(bloom._bits)}")
+        return bloom
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def expected_fp_rate(self) -> float:
+        """False-positive rate for the keys added so far (repeated keys count again)."""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
@@ -26,6 +26,24 @@ class TokenRefreshError(OAuthError):
     pass
 
 
+class TokenRevokedError(TokenRefreshError):
+    """Raised when IVAO permanently rejects a refresh token; the user must re-authenticate."""
+    pass
+
+
+class RateLimitedError(TokenRefreshError):
+    """Raised when IVAO rate limits a token request; the token was not used."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SnapshotError(BotError):
+    """Raised when a cache snapshot cannot be read or written."""
+    pass
+
+
 class UserNotFoundError(BotError):
     """Raised when a user is not found in the database."""
     pass
@@ -1,13 +1,39 @@
-"""Logging configuration."""
+"""Logging configuration.
 
+Records are handed to a queue on the calling thread and written by a
+QueueListener thread, so the event loop never waits for file or console
+I/O. The log file rotates by size and/or time and rotated files are
+gzipped; records can be written as text or as JSON lines.
+"""
+
+import atexit
+import copy
+import gzip
+import json
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import colorlog
 
+from .tracing import current_trace_id
+
+if TYPE_CHECKING:
+    from ..config.settings import LoggingConfig
+
+TEXT_FORMAT = '[%(asctime)s] %(levelname)s [%(filename)s.%(funcName)s:%(lineno)d] %(message)s'
+DATE_FORMAT = '%a, %d %b %Y %H:%M:%S'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
 
 class PyNaClFilter(logging.Filter):
     """Filter to suppress PyNaCl voice support warnings."""
@@ -20,75 +46,263 @@ class PyNaClFilter(logging.Filter):
         return True
 
 
+class DedupFilter(logging.Filter):
+    """
+    Rate-limit repeated warnings and errors from the same call site.
+
+    Bulk runs log one warning per failing user from the same line; after
+    `burst` records from a call site within `window` seconds the rest are
+    dropped, and the next record let through reports how many were.
+    """
+
+    def __init__(self, window: float, burst: int):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        # (pathname, lineno) -> [window start, records in window, suppressed]
+        self._sites: Dict[Tuple[str, int], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or record.levelno >= logging.CRITICAL:
+            return True
+
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = int(site[2]) if site else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar message(s) suppressed in the last {self.window:.0f}s]"
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "process": record.process,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the listener's handlers."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve everything that can change or is tied to this thread; the
+        # listener's formatters do the rest
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.trace_id = current_trace_id()
+        return record
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotates at a time boundary or when the file exceeds a size, whichever comes first."""
+
+    def __init__(self, filename: str, max_bytes: int = 0, when: Optional[str] = "midnight", **kwargs):
+        """
+        Initialize handler.
+
+        Args:
+            filename: Log file path
+            max_bytes: Rotate when the file reaches this size (0 = never)
+            when: TimedRotatingFileHandler interval (None = size only)
+            **kwargs: Passed to TimedRotatingFileHandler
+        """
+        super().__init__(filename, when=when or "midnight", **kwargs)
+        self.max_bytes = max_bytes
+        self.rotate_on_time = when is not None
+        if not self.rotate_on_time:
+            self.rolloverAt = float("inf")
+            self.suffix = "%Y-%m-%d_%H-%M-%S"
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rotate_on_time and time.time() >= self.rolloverAt:
+            return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            if self.stream.tell() >= self.max_bytes:
+                return True
+        return False
+
+    def doRollover(self) -> None:
+        if self.rotate_on_time:
+            super().doRollover()
+            return
+        # Size-only rotation: name files by rotation time like the timed rotation does
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.rotate(self.baseFilename, self.rotation_filename(
+            f"{self.baseFilename}.{time.strftime(self.suffix)}"
+        ))
+        if self.backupCount > 0:
+            for old in self.getFilesToDelete():
+                os.remove(old)
+        if not self.delay:
+            self.stream = self._open()
+
+    def getFilesToDelete(self) -> List[str]:
+        # Rotated names may carry a counter and .gz, which the base class does not match
+        directory, base = os.path.split(self.baseFilename)
+        rotated = [
+            os.path.join(directory, name) for name in os.listdir(directory or ".")
+            if name.startswith(f"{base}.")
+        ]
+        if len(rotated) <= self.backupCount:
+            return []
+        rotated.sort(key=os.path.getmtime)
+        return rotated[:len(rotated) - self.backupCount]
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Rotating twice within the same second (size rotation) must not overwrite
+        name = super().rotation_filename(default_name)
+        counter = 1
+        candidate = name
+        while os.path.exists(candidate) or os.path.exists(f"{candidate}.gz"):
+            candidate = f"{name}.{counter}"
+            counter += 1
+        return candidate
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """Compress a rotated log file."""
+    with open(source, "rb") as src, gzip.open(f"{dest}.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
 def setup_logging(
     log_level: str = "INFO",
     log_file: Optional[str] = None,
-    log_dir: Optional[str] = None
+    log_dir: Optional[str] = None,
+    config: Optional["LoggingConfig"] = None
 ) -> logging.Logger:
     """
     Set up logging with both file and console handlers.
-    
+
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Name of the log file (default: discord.log)
         log_dir: Directory for log files (default: current directory)
-    
+        config: LoggingConfig with format, rotation and deduplication
+            settings (defaults to LoggingConfig())
+
     Returns:
         Configured logger instance
     """
+    global _listener
+    if config is None:
+        # Imported here: the settings module imports this package
+        from ..config.settings import LoggingConfig
+        config = LoggingConfig()
+
+    shutdown_logging()
+
     logger = logging.getLogger("discord")
     logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
     logger.handlers.clear()  # Remove any existing handlers
-    
+
     # Also filter discord.client logger (where PyNaCl warning originates)
     client_logger = logging.getLogger("discord.client")
     client_logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
-    
+
     # Create formatters
-    file_formatter = logging.Formatter(
-        '[%(asctime)s] %(levelname)s [%(filename)s.%(funcName)s:%(lineno)d] %(message)s',
-        datefmt='%a, %d %b %Y %H:%M:%S'
-    )
-    
-    console_formatter = colorlog.ColoredFormatter(
-        '%(log_color)s [%(asctime)s] %(levelname)s [%(filename)s.%(funcName)s:%(lineno)d] %(message)s',
-        datefmt='%a, %d %b %Y %H:%M:%S',
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'red,bg_white',
-        }
-    )
-    
-    # Create filter to suppress PyNaCl warnings
-    nacl_filter = PyNaClFilter()
-    
+    if config.json_format:
+        file_formatter = console_formatter = JsonFormatter()
+    else:
+        file_formatter = logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+        console_formatter = colorlog.ColoredFormatter(
+            '%(log_color)s ' + TEXT_FORMAT,
+            datefmt=DATE_FORMAT,
+            log_colors={
+                'DEBUG': 'cyan',
+                'INFO': 'green',
+                'WARNING': 'yellow',
+                'ERROR': 'red',
+                'CRITICAL': 'red,bg_white',
+            }
+        )
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(console_formatter)
-    console_handler.addFilter(nacl_filter)
-    logger.addHandler(console_handler)
-    
+
     # File handler
     if log_dir:
         log_path = Path(log_dir)
         log_path.mkdir(parents=True, exist_ok=True)
     else:
         log_path = Path(".")
-    
+
     log_file = log_file or "discord.log"
     file_path = log_path / log_file
-    
-    # Create log file if it doesn't exist
-    if not file_path.exists():
-        file_path.touch()
-    
-    file_handler = logging.FileHandler(file_path)
+
+    file_handler = SizedTimedRotatingFileHandler(
+        str(file_path),
+        max_bytes=config.max_bytes,
+        when=config.rotate_when,
+        backupCount=config.backup_count,
+        encoding="utf-8"
+    )
     file_handler.setFormatter(file_formatter)
-    file_handler.addFilter(nacl_filter)
-    logger.addHandler(file_handler)
-    
+    if config.compress:
+        file_handler.rotator = _gzip_rotator
+
+    # Filters run on the calling thread, before the record is queued
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(PyNaClFilter())
+    if config.dedup_window > 0:
+        queue_handler.addFilter(DedupFilter(config.dedup_window, config.dedup_burst))
+    logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        queue_handler.queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+
     return logger
 
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown_logging)
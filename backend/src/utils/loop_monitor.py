@@ -0,0 +1,176 @@
+"""Event loop lag monitor with blocking call attribution.
+
+A heartbeat coroutine sleeps for a fixed interval and records how late it
+woke up; that scheduling delay is exported as a histogram. When the loop
+is blocked the heartbeat cannot run at all, so a watchdog thread watches
+the time of the last heartbeat. Once the loop has been stuck for longer
+than the threshold, the watchdog samples the loop thread's stack with
+sys._current_frames() until the loop runs again, then writes the stall's
+duration, the most sampled stack and the innermost frame of the bot's own
+code (the call site to fix) to a dedicated log file.
+
+While the loop is healthy the watchdog only wakes up when the threshold
+could next be crossed and reads a timestamp; stacks are only sampled
+during a stall.
+"""
+
+import asyncio
+import linecache
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from .metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger("discord")
+
+# Frames from this directory are the bot's own code
+_SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# (filename, line number, function) from the outermost frame inwards
+Stack = Tuple[Tuple[str, int, str], ...]
+
+
+def _capture(frame) -> Stack:
+    summary = traceback.StackSummary.extract(traceback.walk_stack(frame), lookup_lines=False)
+    return tuple((entry.filename, entry.lineno, entry.name) for entry in reversed(summary))
+
+
+def call_site(stack: Stack) -> Optional[Tuple[str, int, str]]:
+    """Innermost frame of the bot's own code, None if the stack has none."""
+    for filename, lineno, name in reversed(stack):
+        if filename.startswith(_SOURCE_DIR):
+            return os.path.relpath(filename, os.path.dirname(_SOURCE_DIR)), lineno, name
+    return None
+
+
+class LoopLagMonitor:
+    """Measures event loop scheduling delay and attributes stalls to a stack."""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, log_file: Optional[str] = None):
+        """
+        Initialize loop lag monitor.
+
+        Args:
+            interval: Seconds between heartbeats
+            threshold: Seconds the loop must be blocked before its stack is sampled
+            log_file: Dedicated log for stall reports (None = main log only)
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._tick = max(0.01, threshold / 5)
+        self._beat = 0.0
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._log = self._stall_logger(log_file)
+
+    @staticmethod
+    def _stall_logger(log_file: Optional[str]) -> Optional[logging.Logger]:
+        if not log_file:
+            return None
+        stall_logger = logging.getLogger("discord.loop_lag")
+        stall_logger.propagate = False
+        stall_logger.setLevel(logging.INFO)
+        for handler in list(stall_logger.handlers):
+            stall_logger.removeHandler(handler)
+            handler.close()
+        # Written from the watchdog thread, never from the loop
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s"))
+        stall_logger.addHandler(handler)
+        return stall_logger
+
+    def start(self) -> None:
+        """Start the heartbeat on the running loop and the watchdog thread."""
+        if self._task is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name="loop-lag-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+        if self._log is not None:
+            for handler in list(self._log.handlers):
+                self._log.removeHandler(handler)
+                handler.close()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self) -> None:
+        while True:
+            beat = self._beat
+            # Earliest time a stall after this heartbeat can cross the threshold
+            wait = beat + self.interval + self.threshold - time.monotonic()
+            if wait > 0:
+                if self._stop.wait(wait):
+                    return
+                continue
+            if self._stop.is_set():
+                return
+            stacks = self._sample_stall(beat)
+            if stacks:
+                resumed = self._beat if self._beat != beat else time.monotonic()
+                self._report(resumed - beat - self.interval, stacks)
+
+    def _sample_stall(self, beat: float) -> Counter:
+        """Sample the loop thread's stack until the next heartbeat."""
+        stacks: Counter = Counter()
+        while self._beat == beat and not self._stop.is_set():
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                break
+            stacks[_capture(frame)] += 1
+            del frame
+            self._stop.wait(self._tick)
+        return stacks
+
+    def _report(self, duration: float, stacks: Counter) -> None:
+        self.stalls += 1
+        stack, samples = stacks.most_common(1)[0]
+        site = call_site(stack)
+        where = f"{site[0]}:{site[1]} in {site[2]}" if site else f"{stack[-1][0]}:{stack[-1][1]} in {stack[-1][2]}"
+        LOOP_STALLS.inc(site=f"{site[0]}:{site[2]}" if site else "external")
+        logger.warning(
+            f"Event loop blocked for {duration * 1000:.0f}ms at {where}"
+            f"{'; stack in the loop lag log' if self._log else ''}"
+        )
+        if self._log is not None:
+            lines: List[str] = [
+                f"Event loop blocked for {duration * 1000:.0f}ms at {where} "
+                f"({samples} of {sum(stacks.values())} samples in this stack)"
+            ]
+            for filename, lineno, name in stack:
+                lines.append(f'  File "{filename}", line {lineno}, in {name}')
+                source = linecache.getline(filename, lineno).strip()
+                if source:
+                    lines.append(f"    {source}")
+            self._log.warning("\n".join(lines))
@@ -0,0 +1,171 @@
+"""Memory diagnostics: tracemalloc snapshots and cache size estimates.
+
+tracemalloc is only running after it has been started on demand (or at
+startup when periodic snapshot dumps are configured); it slows down
+allocations and needs memory of its own, so it is off by default.
+
+Dumped snapshots can be compared offline:
+    python -m src.utils.memory OLD.tracemalloc NEW.tracemalloc
+"""
+
+import glob
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+# Allocations of tracemalloc and the import machinery are noise
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+SNAPSHOT_SUFFIX = ".tracemalloc"
+
+
+class CacheStat(NamedTuple):
+    """Entry count and estimated size of one cache."""
+    name: str
+    count: int
+    size: Optional[int]  # bytes, None when it cannot be estimated
+
+
+def format_bytes(size: float) -> str:
+    """Format a byte count with a binary unit."""
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size:.0f}B"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+def _object_size(obj: object) -> int:
+    """Size of an object and its direct attribute values (one level deep)."""
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, "__dict__", None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes) + sum(sys.getsizeof(value) for value in attributes.values())
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            value = getattr(obj, slot, None)
+            if value is not None:
+                size += sys.getsizeof(value)
+    return size
+
+
+def estimate_size(objects: Sequence[object], sample: int = 100) -> int:
+    """
+    Estimate the memory held by a collection of similar objects.
+
+    Sizes a random sample one level deep and extrapolates, so shared
+    objects (a member's user, for example) are counted with each owner.
+
+    Args:
+        objects: Objects to estimate
+        sample: Maximum number of objects to size
+
+    Returns:
+        Estimated size in bytes
+    """
+    if not objects:
+        return 0
+    picked = random.sample(list(objects), sample) if len(objects) > sample else objects
+    return int(sum(_object_size(obj) for obj in picked) / len(picked) * len(objects))
+
+
+def format_growth(stats: Iterable[tracemalloc.StatisticDiff]) -> List[str]:
+    """Format allocation sites as '+size (total) +count blocks  file:line'."""
+    lines = []
+    for stat in stats:
+        frame = stat.traceback[0]
+        lines.append(
+            f"{'+' if stat.size_diff >= 0 else '-'}{format_bytes(abs(stat.size_diff)):>9} "
+            f"({format_bytes(stat.size):>9}) {stat.count_diff:+7d} blocks  {frame.filename}:{frame.lineno}"
+        )
+    return lines
+
+
+class MemoryTracker:
+    """Takes tracemalloc snapshots and compares them with a baseline."""
+
+    def __init__(self, name: str = "main"):
+        """
+        Initialize memory tracker.
+
+        Args:
+            name: Name of the process in snapshot file names ("main" or
+                "workerN"), the same across restarts
+        """
+        self.name = name
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_at: Optional[datetime] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        """Start tracing (if needed) and take the baseline."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.reset_baseline(self.snapshot())
+
+    def stop(self) -> None:
+        """Stop tracing and free its memory."""
+        tracemalloc.stop()
+        self.baseline = None
+        self.baseline_at = None
+
+    def snapshot(self) -> tracemalloc.Snapshot:
+        """Take a filtered snapshot."""
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def reset_baseline(self, snapshot: tracemalloc.Snapshot) -> None:
+        self.baseline = snapshot
+        self.baseline_at = datetime.now()
+
+    def growth(self, snapshot: tracemalloc.Snapshot, limit: int = 15) -> List[tracemalloc.StatisticDiff]:
+        """Return the allocation sites that grew most since the baseline."""
+        if self.baseline is None:
+            self.reset_baseline(snapshot)
+        return snapshot.compare_to(self.baseline, "lineno")[:limit]
+
+    def dump(self, directory: str, keep: int) -> Optional[str]:
+        """
+        Write a snapshot to a directory, keeping the newest files of this name.
+
+        Files are named after the process name rather than its PID, so the
+        dumps of earlier runs of the same process are pruned as well.
+
+        Args:
+            directory: Target directory (created if missing)
+            keep: Number of snapshot files of this name to keep
+
+        Returns:
+            Path of the written snapshot, None if tracing is not running
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"snapshot-{self.name}-")
+        path = f"{prefix}{datetime.now():%Y%m%d-%H%M%S}{SNAPSHOT_SUFFIX}"
+        self.snapshot().dump(path)
+        for old in sorted(glob.glob(f"{glob.escape(prefix)}*{SNAPSHOT_SUFFIX}"))[:-keep]:
+            os.remove(old)
+        return path
+
+
+def compare_snapshot_files(old_path: str, new_path: str, limit: int = 25) -> List[str]:
+    """Compare two dumped snapshots and format the top growth."""
+    old = tracemalloc.Snapshot.load(old_path)
+    new = tracemalloc.Snapshot.load(new_path)
+    return format_growth(new.compare_to(old, "lineno")[:limit])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m src.utils.memory OLD.tracemalloc NEW.tracemalloc")
+    print("\n".join(compare_snapshot_files(sys.argv[1], sys.argv[2])))
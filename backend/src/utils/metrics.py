@@ -0,0 +1,304 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Recording is a dict lookup plus an addition, so metrics can sit on hot
+paths; all formatting happens when /metrics is scraped.
+"""
+
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp
+from yarl import URL
+
+LabelValues = Tuple[str, ...]
+
+# Seconds; covers DB round trips (ms) up to slow IVAO calls with retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class of a named metric with a fixed set of label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def series_count(self) -> int:
+        """Number of stored label sets."""
+        return len(getattr(self, "_values", ()))
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Yield (suffix, formatted labels, value) tuples."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, value in list(self._values.items()):
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down.
+
+    A gauge created with a callback reads its values at scrape time; the
+    callback returns a {label values tuple: value} mapping.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        values = self.callback() if self.callback else self._values
+        for key, value in list(values.items()):
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, data in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"'), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield "_sum", labels, data[-2]
+            yield "_count", labels, data[-1]
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def series_count(self) -> int:
+        """Number of stored label sets over all metrics."""
+        return sum(metric.series_count() for metric in list(self._metrics.values()))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+VERIFY_RESULTS = REGISTRY.counter(
+    "bot_verify_member_total", "verify_member outcomes by error code (0 = success)", ("outcome", "error_code")
+)
+VERIFY_SECONDS = REGISTRY.histogram(
+    "bot_verify_member_seconds", "verify_member duration", ("source",)
+)
+IVAO_REQUEST_SECONDS = REGISTRY.histogram(
+    "bot_ivao_request_seconds", "IVAO API request latency", ("endpoint", "status")
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "bot_db_query_seconds", "Database query latency", ("operation",)
+)
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "bot_db_pool_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+DISCORD_REST_SECONDS = REGISTRY.histogram(
+    "bot_discord_rest_seconds", "Discord REST API request latency", ("method", "route", "status")
+)
+GATEWAY_EVENTS = REGISTRY.counter(
+    "bot_gateway_events_total", "Gateway events received by type", ("event",)
+)
+IDENTITY_FILTER_CHECKS = REGISTRY.counter(
+    "bot_identity_filter_checks_total", "Join prefilter results (reject = turned away without a lookup)", ("result",)
+)
+IDENTITY_FILTER_BYTES = REGISTRY.gauge(
+    "bot_identity_filter_bytes", "Size of the known-identity Bloom filter"
+)
+IDENTITY_FILTER_FP_RATE = REGISTRY.gauge(
+    "bot_identity_filter_false_positive_rate", "Expected false-positive rate of the known-identity Bloom filter"
+)
+
+TOKEN_QUARANTINE = REGISTRY.counter(
+    "bot_token_quarantine_total",
+    "Refresh tokens quarantined after IVAO rejected them, and bulk refresh calls skipped because of it",
+    ("event",)
+)
+
+ROLE_SYNC = REGISTRY.counter(
+    "bot_role_sync_total", "Role and nickname application results (unchanged = no Discord REST call)", ("result",)
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+LOOP_STALLS = REGISTRY.counter(
+    "bot_event_loop_stalls_total", "Event loop stalls over the lag threshold, by the bot's innermost call site", ("site",)
+)
+CACHE_SNAPSHOTS = REGISTRY.counter(
+    "bot_cache_snapshots_total", "Cache snapshots written, restored at startup, or rejected as stale or damaged", ("event",)
+)
+
+_SNOWFLAKE = re.compile(r"/\d{15,21}")
+_API_PREFIX = re.compile(r"^/api(?:/v\d+)?")
+
+
+def discord_route(url: URL) -> str:
+    """Collapse IDs in a Discord API path so routes have bounded cardinality."""
+    return _SNOWFLAKE.sub("/{id}", _API_PREFIX.sub("", url.path))
+
+
+def http_trace_config(
+    histogram: Histogram,
+    labels: Callable[[aiohttp.TraceRequestStartParams], Dict[str, str]]
+) -> aiohttp.TraceConfig:
+    """
+    Build an aiohttp trace config that observes request latency.
+
+    Args:
+        histogram: Histogram with a "status" label
+        labels: Returns the remaining labels for a request
+
+    Returns:
+        Trace config to pass to a ClientSession
+    """
+    async def on_request_start(session, context: SimpleNamespace, params) -> None:
+        context.metrics_started = time.perf_counter()
+        context.metrics_labels = labels(params)
+
+    async def on_request_end(session, context: SimpleNamespace, params) -> None:
+        histogram.observe(
+            time.perf_counter() - context.metrics_started,
+            status=str(params.response.status),
+            **context.metrics_labels
+        )
+
+    async def on_request_exception(session, context: SimpleNamespace, params) -> None:
+        histogram.observe(
+            time.perf_counter() - context.metrics_started,
+            status=type(params.exception).__name__,
+            **context.metrics_labels
+        )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
@@ -0,0 +1,25 @@
+"""Process resource helpers."""
+
+import os
+import resource
+import sys
+
+
+def current_rss_bytes() -> int:
+    """
+    Get the current resident set size of this process.
+
+    Reads /proc on Linux and falls back to the peak RSS reported by
+    getrusage elsewhere.
+
+    Returns:
+        Resident set size in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
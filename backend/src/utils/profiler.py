@@ -0,0 +1,119 @@
+"""Sampling CPU profiler for the running process.
+
+A background thread periodically captures the stack of the event loop
+thread with sys._current_frames() and counts identical stacks. The result
+is written in the collapsed ("folded") stack format understood by
+flamegraph.pl, speedscope and inferno: one line per distinct stack, frames
+separated by ";" from the outermost inwards, followed by the sample count.
+
+Nothing is installed or hooked while no profile is running; the sampler
+thread only exists for the duration of a profile.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# Modules whose frames on top of the stack mean the loop is waiting for I/O
+_IDLE_MODULES = frozenset(("selectors", "asyncio.windows_events"))
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{code.co_firstlineno}"
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval."""
+
+    _lock = threading.Lock()
+    _active: Optional["SamplingProfiler"] = None
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.01):
+        """
+        Initialize profiler.
+
+        Args:
+            thread_id: Thread to sample (defaults to the calling thread,
+                i.e. the event loop when called from a coroutine)
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Start sampling.
+
+        Raises:
+            ProfilerBusyError: If another profile is running in this process
+        """
+        with SamplingProfiler._lock:
+            if SamplingProfiler._active is not None:
+                raise ProfilerBusyError("A profile is already running")
+            SamplingProfiler._active = self
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+        with SamplingProfiler._lock:
+            if SamplingProfiler._active is self:
+                SamplingProfiler._active = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Return the samples in the collapsed stack format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return the functions with the most samples on top of the stack.
+
+        Returns:
+            (frame label, share of samples) pairs, idle time included
+        """
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = self.samples or 1
+        return [(label, count / total) for label, count in leaves.most_common(limit)]
+
+    def idle_share(self) -> float:
+        """Share of samples where the event loop was waiting for I/O."""
+        idle = sum(
+            count for stack, count in self.stacks.items()
+            if stack.rsplit(";", 1)[-1].split(":", 1)[0] in _IDLE_MODULES
+        )
+        return idle / self.samples if self.samples else 0.0
@@ -0,0 +1,134 @@
+"""Graceful shutdown: in-flight work tracking and draining.
+
+Handlers wrap their work in SHUTDOWN.track() so shutdown can wait for
+it. Writes that must not stop halfway once started go through
+SHUTDOWN.protect(): they run as their own task and finish even if the
+caller is cancelled. A refresh token rotated at IVAO but never stored
+locks the user out, so token rotation is the prime example.
+
+On shutdown, drain() stops new work from being accepted, waits for the
+tracked work and then for the protected writes until a deadline, and
+reports what finished and what was abandoned.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Dict, Iterator, TypeVar
+
+logger = logging.getLogger("discord")
+
+T = TypeVar("T")
+
+
+@dataclass
+class DrainReport:
+    """What finished and what was still running when the deadline passed, by kind."""
+    drained: Counter = field(default_factory=Counter)
+    abandoned: Counter = field(default_factory=Counter)
+
+    def summary(self) -> str:
+        def describe(counts: Counter) -> str:
+            return ", ".join(f"{kind}={count}" for kind, count in sorted(counts.items())) or "none"
+        return f"drained: {describe(self.drained)}; abandoned: {describe(self.abandoned)}"
+
+
+class ShutdownCoordinator:
+    """Tracks in-flight work and protected writes so shutdown can wait for them."""
+
+    def __init__(self):
+        self.accepting = True
+        self._work: Dict[asyncio.Task, str] = {}
+        self._writes: Dict[asyncio.Task, str] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Tracked work and protected writes currently running."""
+        return len(self._work) + len(self._writes)
+
+    @contextmanager
+    def track(self, kind: str) -> Iterator[None]:
+        """Register the current task as in-flight work of a kind until the block exits."""
+        task = asyncio.current_task()
+        self._work[task] = kind
+        try:
+            yield
+        finally:
+            self._work.pop(task, None)
+
+    async def protect(self, kind: str, awaitable: Awaitable[T]) -> T:
+        """
+        Run a write to completion even if the caller is cancelled.
+
+        Args:
+            kind: Write kind for the drain report
+            awaitable: The write
+
+        Returns:
+            The result of the write
+        """
+        task = asyncio.ensure_future(awaitable)
+        self._writes[task] = kind
+        task.add_done_callback(lambda done: self._writes.pop(done, None))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                # Nobody awaits the result any more; report failures here
+                task.add_done_callback(_log_orphaned_failure)
+            raise
+
+    async def drain(self, timeout: float) -> DrainReport:
+        """
+        Stop accepting work and wait for in-flight work and writes.
+
+        Tracked work still running at the deadline is cancelled; protected
+        writes are left running (cancelling them would lose what they are
+        writing) and reported as abandoned.
+
+        Args:
+            timeout: Seconds to wait in total
+
+        Returns:
+            Drain report
+        """
+        self.accepting = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        report = DrainReport()
+
+        current = asyncio.current_task()
+        work = {task: kind for task, kind in self._work.items() if task is not current}
+        pending = await self._wait(work, deadline, report)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # Let cancelled handlers unwind; writes they started are drained below
+            await asyncio.wait(pending, timeout=1)
+
+        await self._wait(dict(self._writes), deadline, report)
+        return report
+
+    @staticmethod
+    async def _wait(tasks: Dict[asyncio.Task, str], deadline: float, report: DrainReport) -> set:
+        """Wait for tasks until the deadline, counting them in the report; returns the pending ones."""
+        if not tasks:
+            return set()
+        remaining = max(0.0, deadline - asyncio.get_running_loop().time())
+        done, pending = await asyncio.wait(tasks, timeout=remaining)
+        for task in done:
+            report.drained[tasks[task]] += 1
+        for task in pending:
+            report.abandoned[tasks[task]] += 1
+        return pending
+
+
+def _log_orphaned_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Protected write failed after its caller was cancelled: {task.exception()}")
+
+
+# Global coordinator instance
+SHUTDOWN = ShutdownCoordinator()
@@ -0,0 +1,191 @@
+"""Cache snapshots for warm restarts.
+
+A snapshot is one file: a magic number, a JSON header and the raw bytes
+of each section, page-aligned so the file can be memory-mapped and a
+section read without touching the others. The header records the format
+version, when the snapshot was written, metadata of the cached state and
+the offset (from the first page after the header), length and BLAKE2b
+digest of every section.
+
+Sections marked secret are encrypted with AES-GCM under a key derived
+from SNAPSHOT_KEY, which needs the optional cryptography package. Without
+a key they are left out of the snapshot rather than written in the clear.
+
+Snapshots are written to a temporary file and renamed, so a crash while
+writing leaves the previous snapshot in place.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .exceptions import SnapshotError
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # optional, only needed for secret sections
+    AESGCM = None
+
+MAGIC = b"IVDCSNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = mmap.PAGESIZE
+NONCE_BYTES = 12
+_HEADER_LENGTH = struct.Struct("<I")
+
+# section name -> (data, secret)
+Sections = Dict[str, Tuple[bytes, bool]]
+
+
+def _cipher(key: Optional[str]) -> Optional["AESGCM"]:
+    if not key:
+        return None
+    if AESGCM is None:
+        raise SnapshotError("SNAPSHOT_KEY is set but the cryptography package is not installed")
+    return AESGCM(hashlib.sha256(key.encode()).digest())
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path: str, meta: Dict[str, Any], sections: Sections, key: Optional[str] = None) -> int:
+    """
+    Write a snapshot file, replacing the previous one.
+
+    Args:
+        path: Snapshot file
+        meta: JSON-serialisable metadata of the cached state
+        sections: Section data by name, with whether it is secret
+        key: SNAPSHOT_KEY; secret sections are skipped without it
+
+    Returns:
+        Size of the file in bytes
+    """
+    cipher = _cipher(key)
+    entries: Dict[str, Dict[str, Any]] = {}
+    payloads = []
+    offset = 0
+    for name, (data, secret) in sections.items():
+        entry: Dict[str, Any] = {}
+        if secret:
+            if cipher is None:
+                continue
+            nonce = os.urandom(NONCE_BYTES)
+            data = cipher.encrypt(nonce, data, name.encode())
+            entry["nonce"] = nonce.hex()
+        entry.update(offset=offset, length=len(data), digest=_digest(data))
+        entries[name] = entry
+        payloads.append(data)
+        offset = _aligned(offset + len(data))
+
+    header = {"version": FORMAT_VERSION, "created_at": time.time(), "meta": meta, "sections": entries}
+    encoded = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + _HEADER_LENGTH.size + len(encoded))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + _HEADER_LENGTH.pack(len(encoded)) + encoded)
+        for entry, data in zip(entries.values(), payloads):
+            f.seek(data_start + entry["offset"])
+            f.write(data)
+        size = f.seek(0, os.SEEK_END)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return size
+
+
+class Snapshot:
+    """A memory-mapped snapshot file; sections are read and checked on demand."""
+
+    def __init__(self, path: str, key: Optional[str] = None):
+        """
+        Open a snapshot and read its header.
+
+        Args:
+            path: Snapshot file
+            key: SNAPSHOT_KEY; secret sections read as None without it
+
+        Raises:
+            OSError: If the file cannot be opened
+            SnapshotError: If the file is not a snapshot of this version
+        """
+        self.path = path
+        self._cipher = _cipher(key)
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path} is empty")
+        try:
+            self._read_header()
+        except SnapshotError:
+            self.close()
+            raise
+
+    def _read_header(self) -> None:
+        prefix = len(MAGIC) + _HEADER_LENGTH.size
+        if len(self._map) < prefix or self._map[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{self.path} is not a cache snapshot")
+        (length,) = _HEADER_LENGTH.unpack(self._map[len(MAGIC):prefix])
+        self._data_start = _aligned(prefix + length)
+        try:
+            header = json.loads(self._map[prefix:prefix + length])
+            if header.get("version") != FORMAT_VERSION:
+                raise SnapshotError(f"{self.path} has format version {header.get('version')}, expected {FORMAT_VERSION}")
+            self.created_at: float = header["created_at"]
+            self.meta: Dict[str, Any] = header["meta"]
+            self._sections: Dict[str, Dict[str, Any]] = header["sections"]
+        except (ValueError, KeyError, AttributeError) as e:
+            raise SnapshotError(f"{self.path} has a damaged header: {e}")
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was written."""
+        return time.time() - self.created_at
+
+    def section(self, name: str) -> Optional[bytes]:
+        """
+        Read a section.
+
+        Returns:
+            The section's data, or None if the snapshot has no such section
+            or it is secret and no key was given
+
+        Raises:
+            SnapshotError: If the section is damaged or the key is wrong
+        """
+        entry = self._sections.get(name)
+        if entry is None:
+            return None
+        start = self._data_start + entry["offset"]
+        data = self._map[start:start + entry["length"]]
+        if len(data) != entry["length"] or _digest(data) != entry["digest"]:
+            raise SnapshotError(f"Section {name} of {self.path} is damaged")
+        if "nonce" not in entry:
+            return data
+        if self._cipher is None:
+            return None
+        try:
+            return self._cipher.decrypt(bytes.fromhex(entry["nonce"]), data, name.encode())
+        except Exception:
+            raise SnapshotError(f"Section {name} of {self.path} cannot be decrypted (SNAPSHOT_KEY changed?)")
+
+    def close(self) -> None:
+        self._map.close()
+
+
+def read_snapshot(path: str, key: Optional[str] = None) -> Optional[Snapshot]:
+    """Open a snapshot; returns None if there is none yet."""
+    try:
+        return Snapshot(path, key)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,270 @@
+"""Lightweight tracing spans with an offline OTLP/JSON file exporter.
+
+The current span lives in a context variable, so spans nest correctly
+across awaits (and into tasks created inside a span). When a root span ends
+the whole trace is exported as one OTLP/JSON line if it was sampled, and it
+is also logged as a tree if it took longer than the slow threshold.
+
+Usage:
+    with span("verify_member", member_id=member.id) as s:
+        ...
+        s.set("error_code", 2)
+
+    @traced("oauth.refresh_token")
+    async def refresh_token(...): ...
+"""
+
+import functools
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("discord")
+
+SERVICE_NAME = "ivao-discord-bot"
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """Spans of one trace, collected until the root span ends."""
+
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+
+
+class Span:
+    """A timed stage of work."""
+
+    __slots__ = ("tracer", "trace", "name", "span_id", "parent", "attributes",
+                 "start_ns", "end_ns", "status", "status_message", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent: Optional[Span] = None
+        self.trace: Optional[_Trace] = None
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status = STATUS_OK
+        self.status_message = ""
+        self._token = None
+
+    def set(self, key: str, value: Any) -> None:
+        """Set an attribute."""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self.trace = self.parent.trace if self.parent else _Trace(self.tracer.should_sample())
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.status = STATUS_ERROR
+            self.status_message = f"{type(exc).__name__}: {exc}"
+        self.trace.spans.append(self)
+        if self.parent is None:
+            self.tracer.finish(self.trace, self)
+
+
+class _NoopSpan:
+    """Span used while tracing is disabled."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(trace: _Trace) -> Dict[str, Any]:
+    """Convert a finished trace to an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for span in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": span.status, "message": span.status_message} if span.status_message else {"code": span.status},
+        }
+        if span.parent:
+            otlp_span["parentSpanId"] = span.parent.span_id
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+        }]
+    }
+
+
+def format_trace_tree(trace: _Trace, root: Span) -> str:
+    """Render a trace as an indented tree of stage durations."""
+    children: Dict[Optional[str], List[Span]] = {}
+    for span in trace.spans:
+        children.setdefault(span.parent.span_id if span.parent else None, []).append(span)
+
+    lines: List[str] = []
+
+    def walk(span: Span, depth: int) -> None:
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        error = f" ERROR {span.status_message}" if span.status == STATUS_ERROR else ""
+        lines.append(f"{'  ' * depth}{span.name} {span.duration_ms:.1f}ms {attributes}{error}".rstrip())
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.start_ns):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines)
+
+
+class Tracer:
+    """Creates spans and exports finished traces."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        export_path: Optional[str] = None,
+        sample_rate: float = 0.0,
+        slow_threshold_ms: int = 0
+    ):
+        """
+        Initialize tracer.
+
+        Args:
+            enabled: Record spans at all
+            export_path: OTLP/JSON lines file (None disables the exporter)
+            sample_rate: Share of traces exported regardless of duration
+            slow_threshold_ms: Traces at least this slow are always exported
+                and logged (0 disables the slow-trace log)
+        """
+        self.enabled = enabled
+        self.export_path = export_path
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self._file = None
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def span(self, name: str, **attributes: Any):
+        """Start a span (use as a context manager)."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def finish(self, trace: _Trace, root: Span) -> None:
+        """Handle a trace whose root span ended."""
+        slow = self.slow_threshold_ms > 0 and root.duration_ms >= self.slow_threshold_ms
+        if slow:
+            logger.warning(
+                f"Slow trace {trace.trace_id} ({root.duration_ms:.0f}ms >= {self.slow_threshold_ms}ms):\n"
+                f"{format_trace_tree(trace, root)}"
+            )
+        if self.export_path and (slow or trace.sampled):
+            self._export(trace)
+
+    def _export(self, trace: _Trace) -> None:
+        try:
+            if self._file is None:
+                self._file = open(self.export_path, "a", encoding="utf-8")
+            self._file.write(json.dumps(to_otlp_json(trace), separators=(",", ":")) + "\n")
+            self._file.flush()
+        except OSError as e:
+            logger.error(f"Could not export trace to {self.export_path}: {e}")
+
+    def close(self) -> None:
+        """Close the export file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Global tracer instance (disabled until init_tracing is called)
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Get the global tracer."""
+    return _tracer
+
+
+def init_tracing(
+    enabled: bool,
+    export_path: Optional[str],
+    sample_rate: float,
+    slow_threshold_ms: int
+) -> Tracer:
+    """Configure and return the global tracer."""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(enabled, export_path, sample_rate, slow_threshold_ms)
+    return _tracer
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace ID of the span running in this context, if any."""
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def span(name: str, **attributes: Any):
+    """Start a span on the global tracer (use as a context manager)."""
+    return _tracer.span(name, **attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator wrapping a coroutine function in a span."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
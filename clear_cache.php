@@ -42,7 +42,14 @@ if (function_exists('apcu_clear_cache')) {
     echo "ℹ APCu not available\n";
 }
 
-// 3. Clear Python __pycache__ directories
+// 3. Clear file cache (used for the IVAO OpenID configuration when APCu is not available)
+$cacheFiles = glob(sys_get_temp_dir() . '/ivao_discord_*') ?: [];
+foreach ($cacheFiles as $file) {
+    @unlink($file);
+}
+echo $cacheFiles ? "✓ File cache cleared\n" : "ℹ File cache empty\n";
+
+// 4. Clear Python __pycache__ directories
 $backendDir = __DIR__ . '/backend/src';
 if (is_dir($backendDir)) {
     $cleared = false;
@@ -72,7 +79,7 @@ if (is_dir($backendDir)) {
     echo "ℹ Backend directory not found\n";
 }
 
-// 4. Clear session cache
+// 5. Clear session cache
 session_start();
 $_SESSION = [];
 if (session_destroy()) {
@@ -0,0 +1,104 @@
+--
+-- One-off migration: one user_data row per VID and a unique key on vid
+--
+-- Concurrent first sign-ins could store a user twice. The web app upserts
+-- on the unique key (INSERT ... ON DUPLICATE KEY UPDATE) once it exists;
+-- until then it looks the row up first.
+--
+-- The rows of every duplicated VID are merged into its newest row (highest
+-- id), which gets:
+--   - the newest non-NULL discord_user_id, with that row's discord_username,
+--     profile_fingerprint and applied_roles
+--   - the newest refresh token, with that row's refresh_token_date and
+--     token_failure_* quarantine state
+--   - the earliest ivao_auth_date, and verified / is_banned if any row has them
+-- The other rows are then deleted.
+--
+-- Nothing is lost: the original rows are copied to user_data_vid_duplicates
+-- and user_data_vid_merge records which rows were merged into which (the
+-- script prints it at the end). Check them, then drop both tables.
+--
+-- Works on MySQL and MariaDB. Start the bot once beforehand, it adds the
+-- token_failure_* and profile columns. The script stops at its first
+-- statement if the two tables of an earlier run still exist.
+--
+--   mysql -u root -p xmivao_discord < migrations/001_user_data_unique_vid.sql
+--
+
+SET SESSION group_concat_max_len = 1000000;
+
+-- Merge plan: one row per duplicated VID
+CREATE TABLE `user_data_vid_merge` AS
+SELECT
+  `vid`,
+  COUNT(*) AS `row_count`,
+  GROUP_CONCAT(`id` ORDER BY `id`) AS `merged_ids`,
+  MAX(`id`) AS `keep_id`,
+  CAST(SUBSTRING_INDEX(GROUP_CONCAT(
+    CASE WHEN `discord_user_id` IS NOT NULL THEN `id` END ORDER BY `id` DESC
+  ), ',', 1) AS UNSIGNED) AS `discord_from_id`,
+  CAST(SUBSTRING_INDEX(GROUP_CONCAT(
+    CASE WHEN `refresh_token` <> '' THEN `id` END ORDER BY `refresh_token_date` DESC, `id` DESC
+  ), ',', 1) AS UNSIGNED) AS `token_from_id`,
+  MIN(`ivao_auth_date`) AS `ivao_auth_date`,
+  MAX(`verified`) AS `verified`,
+  MAX(`is_banned`) AS `is_banned`
+FROM `user_data`
+WHERE `vid` IS NOT NULL
+GROUP BY `vid`
+HAVING COUNT(*) > 1;
+
+-- Backup of every row of a duplicated VID, as it was before the merge
+CREATE TABLE `user_data_vid_duplicates` AS
+SELECT `u`.*
+FROM `user_data` `u`
+JOIN `user_data_vid_merge` `m` ON `m`.`vid` = `u`.`vid`;
+
+-- Merge into the kept row (values are read from the backup, not from rows being updated)
+UPDATE `user_data` `keep_row`
+JOIN `user_data_vid_merge` `m` ON `m`.`keep_id` = `keep_row`.`id`
+LEFT JOIN `user_data_vid_duplicates` `d` ON `d`.`id` = `m`.`discord_from_id`
+LEFT JOIN `user_data_vid_duplicates` `t` ON `t`.`id` = `m`.`token_from_id`
+SET
+  `keep_row`.`ivao_auth_date` = `m`.`ivao_auth_date`,
+  `keep_row`.`verified` = `m`.`verified`,
+  `keep_row`.`is_banned` = `m`.`is_banned`,
+  `keep_row`.`discord_user_id` = `d`.`discord_user_id`,
+  `keep_row`.`discord_username` = IF(`d`.`id` IS NULL, `keep_row`.`discord_username`, `d`.`discord_username`),
+  `keep_row`.`profile_fingerprint` = IF(`d`.`id` IS NULL, `keep_row`.`profile_fingerprint`, `d`.`profile_fingerprint`),
+  `keep_row`.`applied_roles` = IF(`d`.`id` IS NULL, `keep_row`.`applied_roles`, `d`.`applied_roles`),
+  `keep_row`.`refresh_token` = IF(`t`.`id` IS NULL, `keep_row`.`refresh_token`, `t`.`refresh_token`),
+  `keep_row`.`refresh_token_date` = IF(`t`.`id` IS NULL, `keep_row`.`refresh_token_date`, `t`.`refresh_token_date`),
+  `keep_row`.`token_failure_reason` = IF(`t`.`id` IS NULL, `keep_row`.`token_failure_reason`, `t`.`token_failure_reason`),
+  `keep_row`.`token_failed_at` = IF(`t`.`id` IS NULL, `keep_row`.`token_failed_at`, `t`.`token_failed_at`),
+  `keep_row`.`token_failure_count` = IF(`t`.`id` IS NULL, `keep_row`.`token_failure_count`, `t`.`token_failure_count`);
+
+DELETE `u`
+FROM `user_data` `u`
+JOIN `user_data_vid_merge` `m` ON `m`.`vid` = `u`.`vid` AND `u`.`id` <> `m`.`keep_id`;
+
+-- Add the unique key, then drop the plain index it replaces (if present)
+SET @statement = IF(
+  (SELECT COUNT(*) FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_data' AND INDEX_NAME = 'unique_vid') = 0,
+  'ALTER TABLE `user_data` ADD UNIQUE KEY `unique_vid` (`vid`)',
+  'DO 0'
+);
+PREPARE migration FROM @statement;
+EXECUTE migration;
+DEALLOCATE PREPARE migration;
+
+SET @statement = IF(
+  (SELECT COUNT(*) FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_data' AND INDEX_NAME = 'vid') > 0,
+  'ALTER TABLE `user_data` DROP INDEX `vid`',
+  'DO 0'
+);
+PREPARE migration FROM @statement;
+EXECUTE migration;
+DEALLOCATE PREPARE migration;
+
+-- What was merged
+SELECT `vid`, `row_count`, `merged_ids`, `keep_id`, `discord_from_id`, `token_from_id`
+FROM `user_data_vid_merge`
+ORDER BY `vid`;
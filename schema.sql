@@ -58,13 +58,82 @@ CREATE TABLE `user_data` (
   `discord_user_id` varchar(100) DEFAULT NULL,
   `verified` tinyint(1) NOT NULL,
   `is_banned` tinyint(1) NOT NULL,
-  `discord_username` varchar(150) DEFAULT NULL
+  `discord_username` varchar(150) DEFAULT NULL,
+  `token_failure_reason` varchar(255) DEFAULT NULL,
+  `token_failed_at` datetime DEFAULT NULL,
+  `token_failure_count` int(11) NOT NULL DEFAULT 0,
+  `token_claim_owner` varchar(100) DEFAULT NULL,
+  `token_claim_expires_at` datetime DEFAULT NULL,
+  `profile_fingerprint` varchar(64) DEFAULT NULL,
+  `applied_roles` varchar(1000) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 --
 -- Dumping data for table `user_data`
 -- (Data removed for security - schema only)
 
+--
+-- Table structure for table `bot_jobs`
+-- (background jobs of the Discord bot, e.g. bulk token refreshes, each run
+-- by one bot replica under a lease)
+--
+
+CREATE TABLE `bot_jobs` (
+  `id` int(11) NOT NULL,
+  `kind` varchar(50) NOT NULL,
+  `status` varchar(20) NOT NULL,
+  `params` text NOT NULL,
+  `checkpoint` mediumtext DEFAULT NULL,
+  `guild_id` varchar(100) DEFAULT NULL,
+  `channel_id` varchar(100) DEFAULT NULL,
+  `message_id` varchar(100) DEFAULT NULL,
+  `created_by` varchar(100) DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  `updated_at` datetime NOT NULL,
+  `owner` varchar(100) DEFAULT NULL,
+  `lease_expires_at` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `work_claims`
+-- (batches of bulk bot jobs, claimed by bot replicas under a lease)
+--
+
+CREATE TABLE `work_claims` (
+  `id` int(11) NOT NULL,
+  `job_id` int(11) NOT NULL,
+  `kind` varchar(50) NOT NULL,
+  `params` text NOT NULL,
+  `range_start` int(11) NOT NULL,
+  `range_end` int(11) NOT NULL,
+  `status` varchar(20) NOT NULL,
+  `owner` varchar(100) DEFAULT NULL,
+  `lease_expires_at` datetime DEFAULT NULL,
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `result` text DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  `updated_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `member_handoffs`
+-- (IVAO profiles handed from the web flow to the bot for joining members)
+--
+
+CREATE TABLE `member_handoffs` (
+  `id` int(11) NOT NULL,
+  `discord_user_id` varchar(100) NOT NULL,
+  `vid` varchar(100) NOT NULL,
+  `profile` mediumtext NOT NULL,
+  `created_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Indexes for dumped tables
 --
@@ -80,12 +149,55 @@ ALTER TABLE `options`
 --
 ALTER TABLE `user_data`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `vid` (`vid`);
+  ADD UNIQUE KEY `unique_vid` (`vid`),
+  ADD KEY `discord_user_id` (`discord_user_id`),
+  ADD KEY `discord_username` (`discord_username`),
+  ADD KEY `name` (`firstname`,`lastname`);
+
+--
+-- Indexes for table `bot_jobs`
+--
+ALTER TABLE `bot_jobs`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `status` (`status`);
+
+--
+-- Indexes for table `work_claims`
+--
+ALTER TABLE `work_claims`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `job_id` (`job_id`),
+  ADD KEY `claimable` (`kind`,`status`,`lease_expires_at`);
+
+--
+-- Indexes for table `member_handoffs`
+--
+ALTER TABLE `member_handoffs`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `discord_user_id` (`discord_user_id`);
 
 --
 -- AUTO_INCREMENT for dumped tables
 --
 
+--
+-- AUTO_INCREMENT for table `bot_jobs`
+--
+ALTER TABLE `bot_jobs`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
+--
+-- AUTO_INCREMENT for table `work_claims`
+--
+ALTER TABLE `work_claims`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
+--
+-- AUTO_INCREMENT for table `member_handoffs`
+--
+ALTER TABLE `member_handoffs`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
 --
 -- AUTO_INCREMENT for table `options`
 --